@@ -1,15 +1,39 @@
+# Startup is timed from here, before pygame and the font are loaded
+from time import perf_counter
+STARTED = perf_counter()
+
+import argparse
+import weakref
+from collections import Counter
+
 import pygame
 
 from dependencies import *
+from dungeon import Dungeon
+from leaderboard import LEADERBOARD_FILE, Leaderboard, new_run
+from save import SAVE_FILE, Saver, apply_save, load_save
+
+IMPORTED = perf_counter()
 
 
 class Manager:
     '''Game manager, controls what the user sees and oversees the entire game'''
 
-    def __init__(self):
+    def __init__(self, dirty=False, debug_dirty=False):
+        # Everything but the font decodes in the background, the title screen doesn't need any of it
+        ASSETS.preload(*startup_files())
+        self.startup = {'imported': IMPORTED-STARTED}
+
         pygame.init()
         self.clock = pygame.time.Clock()
         self.screen = pygame.display.set_mode((SCREEN_W, SCREEN_H))
+        INPUT.allow()
+
+        # Dirty rect mode only pushes the parts of the screen that changed
+        self.dirty = dirty or debug_dirty
+        self.debug_dirty = debug_dirty
+        self.pixels_pushed = 0
+        if self.dirty: self.screen = DirtySurface(self.screen, deferred=True)
         pygame.display.set_caption('Snungeon by David Nguyen')
         iconicon = pygame.image.load('assets/iconicon.png')
         pygame.display.set_icon(iconicon)
@@ -23,86 +47,309 @@ class Manager:
         self.armour_sheet = SpriteSheet('assets/armour')
         self.battleicon_sheet = SpriteSheet('assets/battleicons')
         self.enemies_sheet = SpriteSheet('assets/enemies')
+        self.loaded = False
+        self.report_startup = False
 
         self.status = 0
 
+        # Scenes made ahead of time for the rooms in the selection scene
+        self.prepare = True
+        self.prepared = {}
+        self.prepared_for = None
+        self.transitions = []
+
+        # Writes a save at every room transition if set (see save.py)
+        self.saver = None
+
+        # The run goes down the dungeon map if there is one (see start_dungeon), the selection scene offers the rooms ahead
+        self.dungeon = None
+        self.map_pos = None
+        self.map_choices = ()
+
+        # The run so far, endless runs go on the leaderboard if there is one (see leaderboard.py) when the player dies
+        self.name = None
+        self.boss_kills = 0
+        self.run_started = perf_counter()
+        self.leaderboard = None
+        self.after_leaderboard = None
+
+        # Finished scenes that can be reset, by class, so a new room reuses their surfaces
+        self.pool = True
+        self.pools = {}
+        self.pool_stats = Counter()
+        # Surfaces held by scenes that no scene held before, by level (only counted if count_allocations is set)
+        self.count_allocations = False
+        self.allocations = Counter()
+        self.seen_surfaces = weakref.WeakSet()
+
+        self.startup['manager'] = perf_counter()-STARTED
+
+    def finish_loading(self):
+        '''
+        Runs after the first frame is up, packs the sprites (waiting for any files still decoding)
+        and decodes the sounds for AUDIO so the first one played doesn't wait'''
+
+        self.startup['first_frame'] = perf_counter()-STARTED
+        self.startup['waiting'] = ASSETS.loading
+
+        pack_sprites((
+            (self.weapon_sheet, WEAPON_DICTS),
+            (self.armour_sheet, ARMOUR_DICTS),
+            (self.battleicon_sheet, BATTLE_DICTS),
+            (self.enemies_sheet, ENEMY_DICTS),
+        ))
+        AUDIO.load(SOUNDS)
+        # Everything the game needs is claimed by now, the rest came from the pack
+        ASSETS.drop_pending()
+
+        self.loaded = True
+        self.startup['loaded'] = perf_counter()-STARTED
+        if self.report_startup: self.startup_report()
+
+    def startup_report(self):
+        '''Prints how long startup took, from the start of Snungeon.py'''
+
+        print('Imports and font: {:.1f} ms'.format(self.startup['imported']*1000))
+        print('Manager ready: {:.1f} ms'.format(self.startup['manager']*1000))
+        print('First frame: {:.1f} ms'.format(self.startup['first_frame']*1000))
+        print('Everything loaded: {:.1f} ms ({})'.format(self.startup['loaded']*1000, 'waited for background decoding' if self.startup['waiting'] else 'decoding had already finished'))
+        print('Assets: {}'.format(ASSETS.stats()))
+
+    def make(self, scene_class, *args):
+        '''
+        Makes a scene, resetting a pooled one with the same arguments if there is one
+        Scenes with a reset() go back in the pool once they are done (see release)'''
+
+        pool = self.pools.get(scene_class)
+        if pool:
+            scene = pool.pop()
+            scene.reset(*args)
+            self.pool_stats['reused'] += 1
+        else:
+            scene = scene_class(*args)
+            self.pool_stats['made'] += 1
+
+        if self.count_allocations: self.allocations[self.player.level] += self.new_surfaces(scene)
+        return scene
+
+    def release(self, scene):
+        '''Pools a scene that is done with, if it can be reset'''
+        if self.pool and hasattr(scene, 'reset'): self.pools.setdefault(type(scene), []).append(scene)
+
+    def new_surfaces(self, scene):
+        '''Counts the surfaces the scene holds that no scene has held before'''
+
+        found = {}
+        visited = set()
+        stack = [scene]
+        while stack:
+            obj = stack.pop()
+            if id(obj) in visited: continue
+            visited.add(id(obj))
+
+            if isinstance(obj, pygame.Surface): found[id(obj)] = obj
+            elif isinstance(obj, DirtySurface): stack.append(obj.surface)
+            elif isinstance(obj, (list, tuple)): stack.extend(obj)
+            elif isinstance(obj, dict): stack.extend(obj.values())
+            elif isinstance(obj, pygame.sprite.AbstractGroup): stack.extend(obj.sprites())
+            elif isinstance(obj, (Scene, pygame.sprite.Sprite, Text)): stack.extend(vars(obj).values())
+
+        new = [surface for surface in found.values() if surface not in self.seen_surfaces]
+        self.seen_surfaces.update(new)
+        return len(new)
+
+    def room_scene(self, room, mode):
+        '''Makes the scene for a room picked in a selection scene, mode is 'Story' or 'Endless' '''
+
+        if room == 'HEAL ROOM': return HealScene(self.screen, self.player)
+        if room == 'BOOST ROOM': return BoostScene(self.screen, self.player)
+        if room == 'CHEST ROOM': return self.make(ChestScene, self.screen, self.player, self.weapon_sheet, self.armour_sheet)
+        if is_boss(mode): return self.make(EnemyScene, self.screen, self.player, self.enemies_sheet, self.battleicon_sheet, 'boss')
+        return self.make(EnemyScene, self.screen, self.player, self.enemies_sheet, self.battleicon_sheet)
+
+    def drop_prepared(self):
+        '''Pools the prepared scenes that weren't picked'''
+
+        for scene, state in self.prepared.values():
+            self.release(scene)
+        self.prepared = {}
+        self.prepared_for = None
+
+    def prepare_rooms(self, limit=1):
+        '''
+        While a selection scene is up, makes the scenes of its rooms ahead of time (limit at a time, all if None)
+        Each one is made from the current RNG state, which is then put back, so whichever is picked comes out
+        exactly as if it was made on the spot'''
+
+        scene = self.current_scene
+        if not self.prepare or not isinstance(scene, SelectionScene) or not scene.running: return
+        if self.prepared_for is not scene:
+            self.drop_prepared()
+            self.prepared_for = scene
+
+        for room in scene.choices:
+            if limit == 0: break
+            if room.name in self.prepared: continue
+
+            state = RNG.getstate()
+            self.prepared[room.name] = (self.room_scene(room.name, self.level_type), RNG.getstate())
+            RNG.setstate(state)
+            if limit is not None: limit -= 1
+
+    def enter_room(self, room, mode):
+        '''Swaps to the room's scene, the prepared one if there is one, timing how long the swap took'''
+
+        start = perf_counter()
+
+        prepared = self.prepared.pop(room, None)
+        if prepared is not None:
+            self.current_scene, state = prepared
+            RNG.setstate(state)  # As if the scene had been made now
+        else:
+            self.current_scene = self.room_scene(room, mode)
+        self.drop_prepared()
+        self.current_scene.arrive()  # Only now does the room do anything to the player
+
+        self.transitions.append((room, perf_counter()-start, prepared is not None))
+
+    def transition_stats(self):
+        '''Mean and worst ms to enter a room, for prepared and freshly made scenes'''
+
+        stats = {}
+        for kind, prepared in (('prepared', True), ('made', False)):
+            times = [taken for room, taken, was_prepared in self.transitions if was_prepared == prepared]
+            if times: stats[kind] = {'rooms': len(times), 'mean_ms': sum(times)/len(times)*1000, 'worst_ms': max(times)*1000}
+        return stats
+
+    def enter(self, kind, *args, save=True):
+        '''
+        Moves on to the scene of a room transition, kind is one of save.SCENE_KINDS
+        The autosave is taken first (not while replaying), so resuming it makes the same scene from the same state'''
+
+        if save and self.saver is not None and EVENTS.replaying is None: self.saver.save(self, kind, args)
+
+        if kind == 'room':
+            self.enter_room(*args)
+        elif kind == 'chest':
+            self.current_scene = self.make(ChestScene, self.screen, self.player, self.weapon_sheet, self.armour_sheet, *args)
+        elif kind == 'dead':
+            self.current_scene = BoostScene(self.screen, self.player, 'dead')
+        elif kind == 'selection':
+            self.current_scene = self.make(SelectionScene, self.screen, self.selection_rooms(), self.player)
+        elif kind == 'final':
+            self.current_scene = self.make(EnemyScene, self.screen, self.player, self.enemies_sheet, self.battleicon_sheet, 'final')
+            self.player.level += 1  # The final boss is rolled for the level before it
+        elif kind == 'won':
+            self.current_scene = WonScene(self.screen, self.player)
+
+    def start_dungeon(self, seed):
+        '''Plays runs on the dungeon map made from seed (see dungeon.py), every run starts at the top'''
+
+        self.dungeon = Dungeon(seed)
+        self.map_pos = self.dungeon.start()
+
+    def selection_rooms(self):
+        '''The rooms for a selection scene, random ones unless there is a dungeon map, then the three ahead on it'''
+
+        if self.dungeon is None: return gen_random_rooms()
+        self.dungeon.visit(*self.map_pos)
+        self.map_choices = self.dungeon.choices(*self.map_pos)
+        return gen_random_rooms(feature.name for feature in self.map_choices)
+
+    def pick_room(self, room, mode):
+        '''Enters the room picked in the selection scene, moving to it on the dungeon map first so the save is taken there'''
+
+        if self.dungeon is not None:
+            feature = self.map_choices[self.current_scene.c_choice]
+            self.map_pos = feature.x, feature.y
+        self.enter('room', room, mode)
+
+    def restart_map(self):
+        '''The player died, the next run starts from the top of the map'''
+        if self.dungeon is not None: self.map_pos = self.dungeon.start()
+
+    def run_time(self):
+        '''Seconds since the run started'''
+        return perf_counter()-self.run_started
+
+    def end_run(self):
+        '''
+        Ends the run when the player dies, before die() resets them, and starts the next one
+        Returns the run if it went on the leaderboard (not while replaying)'''
+
+        run = None
+        if self.leaderboard is not None and EVENTS.replaying is None:
+            run = new_run(self.name or '', self.player, self.boss_kills, self.run_time())
+            self.leaderboard.record(run)
+        self.boss_kills = 0
+        self.run_started = perf_counter()
+        return run
+
     def story_loop(self):
         '''Loop manager for story mode'''
 
         run_scene = self.current_scene.run()
 
-        if run_scene == 'HEAL ROOM':
-            self.current_scene = HealScene(self.screen, self.player)
-        elif run_scene == 'BOOST ROOM':
-            self.current_scene = BoostScene(self.screen, self.player)
-        elif run_scene == 'ENEMY ROOM':
-            if round(random(), 2) <= 1/25: self.current_scene = EnemyScene(self.screen, self.player, self.enemies_sheet, self.battleicon_sheet, 'boss')
-            else: self.current_scene = EnemyScene(self.screen, self.player, self.enemies_sheet, self.battleicon_sheet)
-        elif run_scene == 'CHEST ROOM':
-            self.current_scene = ChestScene(self.screen, self.player, self.weapon_sheet, self.armour_sheet)
+        if run_scene in ROOMS:
+            self.pick_room(run_scene, 'Story')
         elif run_scene == 'POST ENEMY ROOM - WON':
-            self.current_scene = ChestScene(self.screen, self.player, self.weapon_sheet, self.armour_sheet, 'enemy')
+            self.enter('chest', 'enemy')
         elif run_scene == 'POST ENEMY ROOM - WON - BOSS':
-            self.current_scene = ChestScene(self.screen, self.player, self.weapon_sheet, self.armour_sheet, 'boss')
+            self.enter('chest', 'boss')
         elif run_scene == 'POST ENEMY ROOM - DEAD':
-            sp = self.player.level
-            if sp > 5: sp = 5
-            self.player.skill_points += sp
-            self.player.level = 0
-            self.player.atk = 1
-            self.player.hp = 1
-            self.player.defence = 1
-            self.player.weapon = None
-            self.player.armour = None
-            self.current_scene = BoostScene(self.screen, self.player, 'dead')
+            die(self.player)
+            self.restart_map()
+            self.enter('dead')
         elif run_scene:
             self.player.level += 1
-            self.current_scene = SelectionScene(self.screen, gen_random_rooms(), self.player)
+            self.enter('selection')
 
-            if self.player.level >= 99 and self.status == 0:
-                self.current_scene = EnemyScene(self.screen, self.player, self.enemies_sheet, self.battleicon_sheet, 'final')
+            if self.player.level >= FINAL_LEVEL and self.status == 0:
+                self.release(self.current_scene)
                 self.status = 1
-                self.player.level += 1
+                self.enter('final')
             elif self.player.level >= 100 and self.status == 1:
-                self.current_scene = WonScene(self.screen, self.player)
                 self.status = 2
+                self.enter('won')
 
     def endless_loop(self):
         '''Loop manager for endless mode'''
 
         run_scene = self.current_scene.run()
 
-        if run_scene == 'HEAL ROOM':
-            self.current_scene = HealScene(self.screen, self.player)
-        elif run_scene == 'BOOST ROOM':
-            self.current_scene = BoostScene(self.screen, self.player)
-        elif run_scene == 'ENEMY ROOM':
-            if round(random(), 2) <= 1/2: self.current_scene = EnemyScene(self.screen, self.player, self.enemies_sheet, self.battleicon_sheet, 'boss')
-            else: self.current_scene = EnemyScene(self.screen, self.player, self.enemies_sheet, self.battleicon_sheet)
-        elif run_scene == 'CHEST ROOM':
-            self.current_scene = ChestScene(self.screen, self.player, self.weapon_sheet, self.armour_sheet)
+        if run_scene in ROOMS:
+            self.pick_room(run_scene, 'Endless')
         elif run_scene == 'POST ENEMY ROOM - WON':
-            self.current_scene = ChestScene(self.screen, self.player, self.weapon_sheet, self.armour_sheet, 'enemy')
+            self.enter('chest', 'enemy')
         elif run_scene == 'POST ENEMY ROOM - WON - BOSS':
-            self.current_scene = ChestScene(self.screen, self.player, self.weapon_sheet, self.armour_sheet, 'boss')
+            self.boss_kills += 1
+            self.enter('chest', 'boss')
         elif run_scene == 'POST ENEMY ROOM - DEAD':
-            sp = self.player.level
-            if sp > 5: sp = 5
-            self.player.skill_points += sp
-            self.player.level = 0
-            self.player.atk = 1
-            self.player.hp = 1
-            self.player.defence = 1
-            self.player.weapon = None
-            self.player.armour = None
-            self.current_scene = BoostScene(self.screen, self.player, 'dead')
+            run = self.end_run()
+            die(self.player)
+            self.restart_map()
+            self.enter('dead')
+
+            # The board comes up before the skill points
+            if run is not None:
+                self.after_leaderboard = self.current_scene
+                self.current_scene = LeaderboardScene(self.screen, self.player, self.leaderboard, run)
+        elif run_scene == 'POST LEADERBOARD':
+            self.current_scene, self.after_leaderboard = self.after_leaderboard, None
         elif run_scene:
             self.player.level += 1
-            self.current_scene = SelectionScene(self.screen, gen_random_rooms(), self.player)
+            self.enter('selection')
 
     def loop_manager(self):
         '''Loop manager that runs that current scene'''
 
+        scene = self.current_scene
+        self.run_scene()
+        if self.current_scene is not scene: self.release(scene)
+
+    def run_scene(self):
+        '''Runs the current scene and moves on to the next one when it is done'''
+
         self.screen.fill(BG_COLOUR)
 
         if self.scene == 0:
@@ -112,35 +359,199 @@ class Manager:
                 self.scene += 1
         elif self.scene == 1:
             if self.current_scene.run():
+                self.name = self.current_scene.name
                 self.current_scene = SkillScene(self.screen, self.player)
                 self.scene += 1
         elif self.scene == 2:
             if self.current_scene.run():
                 self.scene += 1
         elif self.scene == 3:
+            self.run_started = perf_counter()
             if self.level_type == 'Story':
                 self.player.level += 1
-                self.current_scene = SelectionScene(self.screen, gen_random_rooms(), self.player)
                 self.scene += 1
+                self.enter('selection')
             if self.level_type == 'Endless':
                 self.player.level += 1
-                self.current_scene = SelectionScene(self.screen, gen_random_rooms(), self.player)
                 self.scene = 5
+                self.enter('selection')
         elif self.scene == 4:
             self.story_loop()
         elif self.scene == 5:
             self.endless_loop()
 
+    def present(self):
+        '''Pushes the frame to the display, only the dirty rects in dirty rect mode'''
+
+        if EVENTS.exposed:
+            # The window lost what was on it, so every pixel goes out again
+            EVENTS.exposed = False
+            if self.dirty: self.screen.mark_dirty()
+
+        if not self.dirty:
+            self.pixels_pushed = SCREEN_W*SCREEN_H
+            if FRAME_STATS.overlay: FRAME_STATS.draw(self.screen)
+            pygame.display.update()
+            return
+
+        rects = self.screen.end_frame()
+        self.pixels_pushed = sum(rect.w*rect.h for rect in rects)
+
+        if self.debug_dirty:
+            # Outlines and the counter are drawn straight on the display, so they get cleared next frame
+            surface = self.screen.surface
+            for rect in rects:
+                pygame.draw.rect(surface, '#FF00FF', rect, 1)
+            counter = TEXT_CACHE.render('{} px'.format(self.pixels_pushed), True, '#FF00FF')
+            counter_rect = surface.blit(counter, (4, 4))
+            for rect in rects:
+                for edge in ((rect.x, rect.y, rect.w, 1), (rect.x, rect.bottom-1, rect.w, 1), (rect.x, rect.y, 1, rect.h), (rect.right-1, rect.y, 1, rect.h)):
+                    self.screen.mark_dirty(edge)
+            self.screen.mark_dirty(counter_rect)
+            rects = rects + [counter_rect]
+
+        if FRAME_STATS.overlay:
+            # Same as the debug outlines, drawn on the display and cleared next frame
+            overlay_rect = FRAME_STATS.draw(self.screen.surface)
+            self.screen.mark_dirty(overlay_rect)
+            rects = rects + [overlay_rect]
+
+        pygame.display.update(rects)
+
+    def frame(self):
+        '''One frame without the frame cap, the harness runs these as fast as it can'''
+
+        scene = type(self.current_scene).__name__
+        FRAME_STATS.measure('loop', self.loop_manager)
+        FRAME_STATS.measure('present', self.present)
+        INPUT.presented(scene)
+        if not self.loaded: self.finish_loading()
+        FRAME_STATS.measure('prepare', self.prepare_rooms)
+        FRAME_STATS.end_frame(EVENTS.frame, scene)
+        EVENTS.next_frame()
+
     def run(self):
         '''PyGame loop'''
 
         while True:
-            self.loop_manager()
+            scene = self.current_scene
+            start = perf_counter()
+            self.frame()
+            FRAME_STATS.measure('tick', self.wait_for_frame, start)
 
-            pygame.display.update()
-            self.clock.tick(FRAME_RATE)
+            # Nothing will change on screen until something happens, so sleep until it does (unless the input is a replay)
+            # Events taken off the queue while sleeping out the frame already happened, the next frame handles them
+            if self.current_scene is scene and scene.running and scene.idle() and EVENTS.replaying is None and not EVENTS.pending:
+                FRAME_STATS.measure('prepare', self.prepare_rooms, None)  # Nothing else to do while waiting
+                FRAME_STATS.measure('wait', self.wait_for_event)
+
+    def wait_for_frame(self, start):
+        '''
+        Sleeps out the rest of the frame that started at start, like clock.tick(FRAME_RATE)
+        A key press (or quitting) cuts the sleep short, so the next frame handles it as soon as it comes in'''
+
+        end = start + 1/FRAME_RATE
+        remaining = end - perf_counter()
+        while remaining > 0:
+            event = pygame.event.wait(max(1, round(remaining*1000)))
+            if event.type != pygame.NOEVENT:
+                events = EVENTS.poll([event] + pygame.event.get())
+                if any(event.type in (pygame.KEYDOWN, pygame.QUIT) for event in events): break
+            remaining = end - perf_counter()
+        self.clock.tick()
+
+    def wait_for_event(self):
+        '''Blocks until there is an event (input or a scene timer), then keeps it for the scene'''
+
+        if EVENTS.pending: return  # Polled already, the SDL queue may have nothing left to wake on
+        # Waking up every so often keeps the process responsive to signals
+        event = pygame.event.wait(IDLE_TIMEOUT)
+        while event.type == pygame.NOEVENT:
+            event = pygame.event.wait(IDLE_TIMEOUT)
+
+        EVENTS.poll([event] + pygame.event.get())
 
 
 if __name__ == '__main__':
-    mgr = Manager()
-    mgr.run()
+    parser = argparse.ArgumentParser(description='Snungeon')
+    parser.add_argument('--dirty', action='store_true', help='only push the parts of the screen that changed')
+    parser.add_argument('--dirty-debug', action='store_true', help='dirty rect mode with the rects outlined')
+    parser.add_argument('--seed', type=int, help='seed for everything random')
+    parser.add_argument('--record', metavar='PATH', help='record the game to PATH when it closes')
+    parser.add_argument('--replay', metavar='PATH', help='play back a recording, then carry on playing')
+    parser.add_argument('--seek', type=int, metavar='FRAME', help='skip to FRAME of the replay')
+    parser.add_argument('--overlay', action='store_true', help='show the frame time overlay (F3 toggles it)')
+    parser.add_argument('--frame-stats', metavar='PATH', help='time every frame and save them to PATH (.csv or .json) when the game closes')
+    parser.add_argument('--startup-report', action='store_true', help='print how long startup took')
+    parser.add_argument('--save', metavar='PATH', default=SAVE_FILE, help='where the run is saved at every room transition (default {})'.format(SAVE_FILE))
+    parser.add_argument('--no-save', action='store_true', help="don't save the run")
+    parser.add_argument('--resume', action='store_true', help='carry on the saved run from the room it was saved in')
+    parser.add_argument('--save-report', action='store_true', help='print how long loading and saving took when the game closes')
+    parser.add_argument('--leaderboard', metavar='PATH', default=LEADERBOARD_FILE, help='where endless runs are kept (default {})'.format(LEADERBOARD_FILE))
+    parser.add_argument('--no-leaderboard', action='store_true', help="don't keep endless runs")
+    parser.add_argument('--dungeon', action='store_true', help='go down a dungeon map made from the seed instead of picking from random rooms')
+    parser.add_argument('--dungeon-report', action='store_true', help='print how long making the map chunks took when the game closes')
+    parser.add_argument('--bind', action='append', default=[], metavar='ACTION=KEY', help='bind a key to an action ({}), can be given more than once'.format(', '.join(sorted(ACTION_NAMES))))
+    args = parser.parse_args()
+    if args.resume and (args.replay or args.record): parser.error('--resume can not be used with --replay or --record')
+
+    bindings = {}
+    for binding in args.bind:
+        name, _, key = binding.partition('=')
+        try:
+            bindings.setdefault(name.strip(), []).append(pygame.key.key_code(key.strip()))
+        except ValueError:
+            parser.error('no key called {!r}'.format(key.strip()))
+    for name, keys in bindings.items():
+        try:
+            INPUT.bind(name, *keys)
+        except ValueError as error:
+            parser.error(str(error))
+
+    EVENTS.hotkeys[pygame.K_F3] = FRAME_STATS.toggle_overlay
+    if args.frame_stats: FRAME_STATS.start()
+    if args.overlay: FRAME_STATS.toggle_overlay()
+
+    recording = None
+    if args.replay:
+        from replay import Replayer, load_recording
+        recording = load_recording(args.replay)
+    try:
+        RNG.seed(recording['seed'] if recording is not None else args.seed)
+    except ValueError as error:
+        parser.error(str(error))
+
+    mgr = Manager(dirty=args.dirty, debug_dirty=args.dirty_debug)
+    mgr.report_startup = args.startup_report
+    if args.dungeon or (recording is not None and recording.get('dungeon')): mgr.start_dungeon(RNG.master)
+    if recording is not None:
+        replayer = Replayer(mgr, recording)
+        if args.seek: replayer.seek(args.seek)
+        if isinstance(mgr.screen, DirtySurface): mgr.screen.mark_dirty()
+
+    loaded = None
+    if args.resume:
+        try:
+            loaded, load_time = load_save(args.save)
+        except ValueError as error:
+            parser.error(str(error))
+        if loaded is None: print('No save at {}, starting a new run'.format(args.save))
+        else: apply_save(mgr, loaded)
+    if not args.no_save: mgr.saver = Saver(args.save)
+    if not args.no_leaderboard: mgr.leaderboard = Leaderboard(args.leaderboard)
+
+    if args.record: EVENTS.record([event for event in recording['events'] if event[0] < EVENTS.frame] if recording else ())
+    try:
+        mgr.run()
+    finally:
+        if args.frame_stats: FRAME_STATS.export(args.frame_stats)
+        if args.save_report:
+            if loaded is not None: print('Loaded {} in {:.3f} ms'.format(args.save, load_time*1000))
+            if mgr.saver is not None:
+                mgr.saver.flush()
+                print('Autosave: {}'.format(mgr.saver.stats()))
+        if args.dungeon_report and mgr.dungeon is not None: print('Dungeon: {}'.format(mgr.dungeon.stats()))
+        if mgr.leaderboard is not None: mgr.leaderboard.close()
+        if args.record:
+            from replay import save_recording
+            save_recording(args.record, RNG.master, EVENTS.recording, EVENTS.frame, mgr.dungeon is not None)
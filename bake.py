@@ -0,0 +1,66 @@
+'''
+Offline asset bake
+Writes every image (converted and scaled) and sound (decoded) the game uses into one pack file
+Run it again after changing anything in assets/ or audios/, stale entries fall back to the loose files anyway'''
+
+
+import json
+import pygame
+
+from dependencies import *
+
+
+def bake(path=PACK_FILE):
+    '''Bakes the pack file and returns its manifest'''
+
+    pygame.display.set_mode((SCREEN_W, SCREEN_H))
+    assets = AssetManager()  # Not the shared one, that may already be reading an old pack
+
+    images = [('{}.png'.format(sheet), None) for sheet in SHEET_IMAGES] + game_images()
+    manifest = {'format': None, 'mixer': pygame.mixer.get_init(), 'sources': {}, 'images': [], 'sounds': []}
+    blobs = []
+    offset = 0
+
+    def add(data):
+        nonlocal offset
+        start = offset
+        blobs.append(data)
+        offset += len(data)
+        # Keeps every blob 16 byte aligned
+        padding = -offset % 16
+        blobs.append(bytes(padding))
+        offset += padding
+        return start
+
+    for image_path, size in images:
+        image = assets.image(image_path, size)
+        manifest['format'] = AssetManager.pixel_format(image)
+        try:
+            data = pygame.image.tostring(image, manifest['format'])
+        except ValueError:  # pygame before 2.1.3 can't write BGRA, RGBA packs get converted when they load instead
+            manifest['format'] = 'RGBA'
+            data = pygame.image.tostring(image, manifest['format'])
+        manifest['images'].append({'path': image_path, 'size': size, 'pixels': image.get_size(), 'offset': add(data), 'length': len(data)})
+        manifest['sources'][image_path] = AssetManager.hash_file(image_path)
+
+    for sound_path in SOUNDS:
+        data = assets.sound(sound_path).get_raw()
+        manifest['sounds'].append({'path': sound_path, 'offset': add(data), 'length': len(data)})
+        manifest['sources'][sound_path] = AssetManager.hash_file(sound_path)
+
+    encoded = json.dumps(manifest).encode()
+    header = PACK_HEADER.pack(PACK_MAGIC, PACK_VERSION, len(encoded))
+
+    with open(path, 'wb') as f:
+        f.write(header)
+        f.write(encoded)
+        f.write(bytes(pack_data_start(len(encoded)) - len(header) - len(encoded)))
+        for blob in blobs:
+            f.write(blob)
+
+    return manifest
+
+
+if __name__ == '__main__':
+    manifest = bake()
+    print('Baked {} images and {} sounds into {}'.format(len(manifest['images']), len(manifest['sounds']), PACK_FILE))
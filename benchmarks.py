@@ -0,0 +1,313 @@
+'''
+Benchmarks for the hot rendering paths, runs headless
+Results are compared to the baselines in benchmarks.json, --save updates them'''
+
+
+import os
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+
+import json
+import platform
+import random
+import sys
+from time import perf_counter
+
+from dependencies import *
+from dungeon import Dungeon
+from loot import TABLES, Item, roll_items
+from save import decode_save, encode_save, snapshot
+
+
+BASELINE_FILE = 'benchmarks.json'
+THRESHOLD = 0.25  # Slower than the baseline by this fraction (and more than the noise) is a regression
+
+
+def timeit(func, repeat=20):
+    '''Runs func repeat times and returns the mean and standard deviation in milliseconds'''
+
+    times = []
+    for _ in range(repeat):
+        start = perf_counter()
+        func()
+        times.append((perf_counter()-start)*1000)
+
+    mean = sum(times) / len(times)
+    var = sum((t-mean)**2 for t in times) / len(times)
+    return mean, var**0.5
+
+
+def longest_texts(display):
+    '''The longest texts in the game, taken from the scenes that show them'''
+
+    player = Player()
+    return {
+        'controls': TitleScene(display, player).text,
+        'won': WonScene(display, player).text,
+        'skills': SkillScene(display, player).text,
+    }
+
+
+def bench_text_renderers(display):
+    '''Typewriter animation of the longest texts drawn with FONT.render vs the glyph atlas'''
+
+    results = {}
+    for name, text in longest_texts(display).items():
+        for renderer in ('font', 'atlas'):
+            t = Text(display, text.text, speed=1, pos=text.pos, renderer=renderer)
+
+            def animate():
+                t.change_text(t.text)
+                while t.frame != len(t.text):
+                    t.update()
+                    t.draw()
+
+            def draw():
+                t.draw()
+
+            t.skip()
+            misses = TEXT_CACHE.misses
+            results['text {} animate ({})'.format(name, renderer)] = timeit(animate)
+            print('text {} animate ({}): {} text cache misses'.format(name, renderer, TEXT_CACHE.misses-misses))
+            results['text {} draw ({})'.format(name, renderer)] = timeit(draw, 200)
+    return results
+
+
+def load_sheets():
+    '''Sprite sheets and their sprite rects, the same ones Manager uses'''
+
+    return (
+        (SpriteSheet('assets/weapons'), WEAPON_DICTS),
+        (SpriteSheet('assets/armour'), ARMOUR_DICTS),
+        (SpriteSheet('assets/battleicons'), BATTLE_DICTS),
+        (SpriteSheet('assets/enemies'), ENEMY_DICTS),
+    )
+
+
+def surface_bytes(surfaces):
+    '''Pixel memory of the surfaces'''
+    return sum(surface.get_pitch()*surface.get_height() for surface in surfaces)
+
+
+def bench_sprite_atlas(display, sheets):
+    '''Copying sprites out of the sheets and separate blits vs atlas handles and one blits batch'''
+
+    results = {}
+
+    def extract():
+        for sheet, rects in sheets:
+            for rect in rects.values(): sheet.extract(rect)
+
+    def get_image():
+        for sheet, rects in sheets:
+            for rect in rects.values(): sheet.get_image(rect)
+
+    results['sprites extract (copy)'] = timeit(extract, 200)
+    results['sprites get_image (atlas)'] = timeit(get_image, 200)
+
+    scene = EnemyScene(display, Player(), sheets[3][0], sheets[2][0])
+    sequence = scene.battle_blits()
+
+    def separate():
+        for image, rect in sequence: display.blit(image, rect)
+
+    def batched():
+        display.blits(sequence, doreturn=False)
+
+    results['battle sprites (separate blits)'] = timeit(separate, 500)
+    results['battle sprites (blits batch)'] = timeit(batched, 500)
+
+    copies = [sheet.extract(rect) for sheet, rects in sheets for rect in rects.values()]
+    copies += [ASSETS.image(path, size).copy() for path, size in ASSETS.images if size is not None]
+    print('surface memory: {} bytes as separate surfaces, {} bytes in {} atlas page(s)'.format(surface_bytes(copies), SPRITE_ATLAS.bytes, len(SPRITE_ATLAS.pages)))
+
+    return results
+
+
+def play_scene(scene, keys=(pygame.K_RETURN,), max_frames=5000):
+    '''
+    Runs a scene until it stops, pressing the next key whenever it is waiting for input
+    Returns the number of frames it took'''
+
+    for frame in range(max_frames):
+        if not scene.running: return frame
+        if scene.idle(): pygame.event.post(pygame.event.Event(pygame.KEYDOWN, key=keys[frame % len(keys)]))
+        scene.run()
+    return max_frames
+
+
+def battle_player():
+    '''A player that takes a few turns to win a level 1 battle, so the battle goes through every stage'''
+
+    player = Player()
+    player.atk, player.hp, player.max_hp, player.defence = 3, 30, 30, 5
+    player.level = 1
+    return player
+
+
+def bench_scenes(display, sheets):
+    '''Whole scenes from start to finish, always with the same rolls'''
+
+    results = {}
+    weapons, armour, battleicons, enemies = (sheet for sheet, rects in sheets)
+
+    def battle():
+        RNG.seed(0)
+        return play_scene(EnemyScene(display, battle_player(), enemies, battleicons))
+
+    def chest():
+        RNG.seed(0)
+        return play_scene(ChestScene(display, battle_player(), weapons, armour))
+
+    def selection():
+        RNG.seed(0)
+        scene = SelectionScene(display, gen_random_rooms(), battle_player())
+        for frame in range(120):
+            if frame % 10 == 0: pygame.event.post(pygame.event.Event(pygame.KEYDOWN, key=pygame.K_d if frame % 40 < 20 else pygame.K_a))
+            scene.run()
+
+    def rooms():
+        for _ in range(100): gen_random_rooms()
+
+    def scripts():
+        # Lots of scripts at once, most of them waiting on an action or a timer
+        scheduler = Scheduler()
+        rect = pygame.Rect(0, 0, 1, 1)
+        def script(n):
+            while True:
+                yield Wait(n % 30 + 1)
+                if n % 4 == 0: yield Tween(rect, 'x', [1]*10)
+                yield WaitAction('confirm')
+        for n in range(1000): scheduler.start(script(n))
+        for frame in range(60):
+            scheduler.update()
+            if frame % 20 == 0: scheduler.press('confirm')
+
+    def saves():
+        # A save at a room transition and loading it back, without the disk
+        player = Player()
+        player.weapon = Item('weapon', TABLES['weapon'].code('Sword', 'Piercing', 'Time'), 12)
+        manager = type('Manager', (), {'player': player, 'scene': 5, 'status': 0, 'level_type': 'Endless', 'name': 'DAVID', 'boss_kills': 2, 'dungeon': None, 'map_pos': None, 'run_time': lambda self: 61.5})()
+        for _ in range(100): decode_save(encode_save(snapshot(manager, 'room', ('ENEMY ROOM', 'Endless'))))
+
+    print('battle cycle: {} frames, chest reveal: {} frames'.format(battle(), chest()))
+    results['scene EnemyScene battle cycle'] = timeit(battle, 10)
+    results['scene ChestScene item reveal'] = timeit(chest, 10)
+    results['scene SelectionScene 120 frames of moving'] = timeit(selection, 10)
+    results['gen_random_rooms x100'] = timeit(rooms, 20)
+    results['Scheduler 1000 scripts x60 frames'] = timeit(scripts, 10)
+    results['save snapshot, encode and decode x100'] = timeit(saves, 10)
+    return results
+
+
+def bench_loot():
+    '''Rolling items one at a time (like the chest scene) and in bulk (like a simulation)'''
+
+    rng = random.Random(0)
+
+    def single():
+        for _ in range(10000): roll_item(20, 'enemy', rng)
+
+    def bulk():
+        roll_items(10000, 20, 'enemy', rng)
+
+    return {'loot roll_item x10000': timeit(single, 10), 'loot roll_items 10000': timeit(bulk, 10)}
+
+
+def bench_dungeon():
+    '''Making the map chunks around a player (a new map each time, so every chunk is made) and picking the rooms ahead'''
+
+    seeds = iter(range(10**9))
+
+    def chunks():
+        dungeon = Dungeon(next(seeds))
+        for x in (-1, 0, 1):
+            for y in (0, 1, 2): dungeon.chunk(x, y)
+
+    dungeon = Dungeon(0)
+    x, y = dungeon.start()
+
+    def walk():
+        nonlocal x, y
+        for _ in range(100):
+            dungeon.visit(x, y)
+            _, x, y = dungeon.choices(x, y)[1]
+
+    return {'dungeon make 9 chunks': timeit(chunks, 20), 'dungeon walk 100 rooms': timeit(walk, 10)}
+
+
+def machine():
+    return {'python': platform.python_version(), 'pygame': pygame.version.ver, 'platform': platform.platform(), 'processor': platform.processor()}
+
+
+def load_baselines(path=BASELINE_FILE):
+    if not os.path.exists(path): return {}
+    with open(path) as file:
+        return json.load(file)['results']
+
+
+def save_baselines(results, path=BASELINE_FILE):
+    with open(path, 'w') as file:
+        json.dump({'machine': machine(), 'results': {name: [round(mean, 4), round(std, 4)] for name, (mean, std) in results.items()}}, file, indent=4)
+
+
+def regressed(result, baseline, threshold=THRESHOLD):
+    '''Slower than the baseline by more than threshold and by more than three standard deviations of either run'''
+
+    mean, std = result
+    base_mean, base_std = baseline
+    return mean > base_mean*(1+threshold) and mean-base_mean > 3*max(std, base_std)
+
+
+def compare(results, baselines, threshold=THRESHOLD):
+    '''Prints the results next to the baselines, returns the names of the regressions'''
+
+    regressions = []
+    width = max(len(name) for name in results)
+    for name, (mean, std) in results.items():
+        line = '{}  {:9.4f} ms  +- {:.4f}'.format(name.ljust(width), mean, std)
+        if name in baselines:
+            change = mean/baselines[name][0] - 1 if baselines[name][0] else 0
+            line += '  {:+7.1%} vs {:.4f}'.format(change, baselines[name][0])
+            if regressed((mean, std), baselines[name], threshold):
+                line += '  REGRESSION'
+                regressions.append(name)
+        print(line)
+    return regressions
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Benchmarks the rendering hot paths and compares them to the stored baselines')
+    parser.add_argument('--save', action='store_true', help='store these results as the new baselines')
+    parser.add_argument('--baselines', default=BASELINE_FILE, metavar='PATH')
+    parser.add_argument('--threshold', type=float, default=THRESHOLD, help='fraction slower than the baseline that counts as a regression')
+    parser.add_argument('--filter', help='only show benchmarks with this in the name')
+    args = parser.parse_args()
+
+    display = pygame.display.set_mode((SCREEN_W, SCREEN_H))
+    sheets = load_sheets()
+    pack_sprites(sheets)
+
+    results = {}
+    results.update(bench_text_renderers(display))
+    results.update(bench_sprite_atlas(display, sheets))
+    results.update(bench_scenes(display, sheets))
+    results.update(bench_loot())
+    results.update(bench_dungeon())
+    if args.filter: results = {name: result for name, result in results.items() if args.filter in name}
+
+    print()
+    regressions = compare(results, load_baselines(args.baselines), args.threshold)
+
+    if args.save:
+        save_baselines(results, args.baselines)
+        print('Saved baselines to {}'.format(args.baselines))
+    elif regressions:
+        print('{} regression(s) over {:.0%}'.format(len(regressions), args.threshold))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
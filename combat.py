@@ -0,0 +1,244 @@
+'''
+Battle rules without any rendering
+EnemyScene drives a Battle, simulate() plays lots of battles at once with NumPy (optional, only needed for simulate)'''
+
+
+from rules import RNG
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+# Multiplier ranges rolled on top of the enemy stats
+ENEMY_MULTIPLIERS = {
+    None: (1, 1),
+    'boss': (2, 5),
+    'final': (4, 7),  # just get better smh
+}
+MAX_BOOST = 3
+BOOST_STEP = 0.3
+HEALS = 5
+
+FIGHT, SHARPEN, DEFEND, HEAL = range(4)
+
+
+def roll_enemy_stat(level, type_=None, rng=None):
+    '''Enemy hp, defence and attack all roll the same way, rng is a randint function'''
+
+    if rng is None: rng = RNG.enemies.randint
+
+    low, high = ENEMY_MULTIPLIERS[type_]
+    stat = rng(2*(level+1), 5*(level+1))
+    if type_ is not None: stat *= rng(low, high)
+    return stat
+
+
+def damage(atk, defence):
+    '''Damage formula for both sides'''
+    return round(atk/(defence/atk+1))+1
+
+
+class Battle:
+    '''One battle between the player and an enemy'''
+
+    def __init__(self, player, type_=None, rng=None):
+        self.player = player
+        self.type_ = type_
+        self.rng = rng if rng is not None else RNG.enemies.randint
+
+        self.extra_atk = 1
+        self.extra_def = 1
+        self.heals = HEALS
+
+        self.enemy_hp = roll_enemy_stat(player.level, type_, self.rng)
+        self.enemy_def = roll_enemy_stat(player.level, type_, self.rng)
+
+    @property
+    def player_atk(self):
+        '''Player attack with weapon and sharpening'''
+
+        atk = self.player.atk
+        if self.player.weapon is not None: atk += self.player.weapon.amount
+        return round(atk*self.extra_atk)
+
+    @property
+    def player_def(self):
+        '''Player defence with armour and defending'''
+
+        defence = self.player.defence
+        if self.player.armour is not None: defence += self.player.armour.amount
+        return round(defence*self.extra_def)
+
+    def fight(self):
+        '''Player attacks, returns the damage done'''
+
+        dealt = damage(self.player_atk, self.enemy_def)
+        self.enemy_hp -= dealt
+        return dealt
+
+    def sharpen(self):
+        '''Increases attack, returns False if it can't go any higher'''
+
+        if self.extra_atk >= MAX_BOOST: return False
+        self.extra_atk += BOOST_STEP
+        return True
+
+    def defend(self):
+        '''Increases defence, returns False if it can't go any higher'''
+
+        if self.extra_def >= MAX_BOOST: return False
+        self.extra_def += BOOST_STEP
+        return True
+
+    def heal(self):
+        '''
+        Uses a heal, returns the amount or None if there are none left
+        The amount is only shown, it has never been added to the player hp'''
+
+        if self.heals == 0: return None
+        self.heals -= 1
+        return self.rng(25, 50)/100 * self.player.hp
+
+    def enemy_attack(self):
+        '''Enemy attacks, returns the damage done'''
+
+        enemy_atk = roll_enemy_stat(self.player.level, self.type_, self.rng)
+        dealt = damage(enemy_atk, self.player_def)
+        self.player.change_hp(-dealt)
+        return dealt
+
+    @property
+    def won(self):
+        return self.enemy_hp <= 0
+
+    @property
+    def lost(self):
+        return self.player.hp <= 0
+
+
+# Policies for simulate, they get the battle state arrays and return a choice for every battle
+
+def always_fight(state, rng):
+    return np.full(state['enemy_hp'].shape, FIGHT)
+
+
+def sharpen_then_fight(state, rng):
+    '''Sharpens until it can't, then fights'''
+    return np.where(state['extra_atk'] < MAX_BOOST, SHARPEN, FIGHT)
+
+
+def random_choices(probabilities):
+    '''Policy picking fight/sharpen/defend/heal with the given probabilities'''
+
+    def policy(state, rng):
+        return rng.choice(4, size=state['enemy_hp'].shape, p=probabilities)
+    return policy
+
+
+POLICIES = {
+    'fight': always_fight,
+    'sharpen': sharpen_then_fight,
+    'random': random_choices((0.25, 0.25, 0.25, 0.25)),
+}
+
+
+def roll_enemy_stats(rng, n, level, type_=None):
+    '''simulate version of roll_enemy_stat, n rolls at once'''
+
+    low, high = ENEMY_MULTIPLIERS[type_]
+    stat = rng.integers(2*(level+1), 5*(level+1), size=n, endpoint=True)
+    if type_ is not None: stat *= rng.integers(low, high, size=n, endpoint=True)
+    return stat
+
+
+def simulate(n, level, atk, hp, defence, weapon_atk=0, armour_def=0, type_=None, policy=always_fight, max_turns=500, seed=None):
+    '''
+    Plays n battles at once as NumPy arrays, with the same rules as Battle
+    Returns a dict of arrays: won, lost (either can be False if max_turns ran out), turns, player_hp'''
+
+    if np is None:
+        raise ImportError('simulate needs NumPy (pip install numpy)')
+
+    rng = np.random.default_rng(seed)
+    if isinstance(policy, str): policy = POLICIES[policy]
+
+    state = {
+        'enemy_hp': roll_enemy_stats(rng, n, level, type_),
+        'enemy_def': roll_enemy_stats(rng, n, level, type_),
+        'player_hp': np.full(n, hp),
+        'extra_atk': np.ones(n),
+        'extra_def': np.ones(n),
+        'heals': np.full(n, HEALS),
+    }
+    won = np.zeros(n, dtype=bool)
+    lost = np.zeros(n, dtype=bool)
+    turns = np.zeros(n, dtype=np.int64)
+
+    for _ in range(max_turns):
+        active = ~(won | lost)
+        if not active.any(): break
+        turns += active
+
+        choices = np.where(active, policy(state, rng), -1)
+
+        fighting = choices == FIGHT
+        player_atk = np.round((atk+weapon_atk)*state['extra_atk'])
+        dealt = np.round(player_atk/(state['enemy_def']/player_atk+1))+1
+        state['enemy_hp'] = np.where(fighting, state['enemy_hp']-dealt, state['enemy_hp'])
+
+        sharpening = (choices == SHARPEN) & (state['extra_atk'] < MAX_BOOST)
+        state['extra_atk'] = np.where(sharpening, state['extra_atk']+BOOST_STEP, state['extra_atk'])
+        defending = (choices == DEFEND) & (state['extra_def'] < MAX_BOOST)
+        state['extra_def'] = np.where(defending, state['extra_def']+BOOST_STEP, state['extra_def'])
+        healing = (choices == HEAL) & (state['heals'] > 0)
+        state['heals'] = state['heals'] - healing  # Heals are used up but add nothing, same as Battle.heal
+
+        won |= active & (state['enemy_hp'] <= 0)
+        attacked = active & ~won
+
+        enemy_atk = roll_enemy_stats(rng, n, level, type_)
+        player_def = np.round((defence+armour_def)*state['extra_def'])
+        taken = np.round(enemy_atk/(player_def/enemy_atk+1))+1
+        state['player_hp'] = np.where(attacked, state['player_hp']-taken, state['player_hp'])
+        lost |= attacked & (state['player_hp'] <= 0)
+
+    return {'won': won, 'lost': lost, 'turns': turns, 'player_hp': state['player_hp']}
+
+
+def main():
+    import argparse
+    from time import perf_counter
+
+    parser = argparse.ArgumentParser(description='Simulates battles to check the balance')
+    parser.add_argument('--n', type=int, default=100000, help='number of battles')
+    parser.add_argument('--level', type=int, default=1)
+    parser.add_argument('--skill-points', type=int, default=35, help='split evenly between atk, hp and defence unless they are given')
+    parser.add_argument('--atk', type=int)
+    parser.add_argument('--hp', type=int)
+    parser.add_argument('--defence', type=int)
+    parser.add_argument('--weapon-atk', type=int, default=0)
+    parser.add_argument('--armour-def', type=int, default=0)
+    parser.add_argument('--type', choices=('normal', 'boss', 'final'), default='normal')
+    parser.add_argument('--policy', choices=tuple(POLICIES), default='fight')
+    parser.add_argument('--seed', type=int)
+    args = parser.parse_args()
+
+    split = [args.skill_points//3 + (i < args.skill_points%3) for i in range(3)]
+    atk = args.atk if args.atk is not None else split[0]
+    hp = args.hp if args.hp is not None else split[1]
+    defence = args.defence if args.defence is not None else split[2]
+    type_ = None if args.type == 'normal' else args.type
+
+    start = perf_counter()
+    result = simulate(args.n, args.level, atk, hp, defence, args.weapon_atk, args.armour_def, type_, args.policy, seed=args.seed)
+    taken = perf_counter()-start
+
+    print('Level {} {} battles, ATK {} HP {} DEF {}, policy {}'.format(args.level, args.type, atk, hp, defence, args.policy))
+    print('Win rate: {:.2%}  Loss rate: {:.2%}  Mean turns: {:.2f}'.format(result['won'].mean(), result['lost'].mean(), result['turns'].mean()))
+    print('{} battles in {:.2f}s'.format(args.n, taken))
+
+
+if __name__ == '__main__':
+    main()
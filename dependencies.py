@@ -1,9 +1,21 @@
 ﻿'''Dependencies file with constants and game classes'''
 
 
+import hashlib
+import json
+import mmap
 import pygame
+import struct
+from collections import OrderedDict, deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from math import ceil
 from sys import exit
-from random import choice, randint, random
+from time import perf_counter
+
+from combat import Battle
+from leaderboard import since
+from loot import roll_item
+from rules import *
 
 
 pygame.init()
@@ -15,52 +27,480 @@ FRAME_RATE = 60
 
 FONT = pygame.font.Font('lol font.ttf', 20)
 
-SOUND_SELECT = pygame.mixer.Sound('audios/select.wav')
-SOUND_CONFIRM = pygame.mixer.Sound('audios/confirm.ogg')
-SOUND_TAKE_ITEM = pygame.mixer.Sound('audios/take_item.wav')
 
-WEAPON_NAME = ('Sword', 'Staff', 'Shuriken', 'Broomstick', 'Knife', 'Pan', 'Glass Bottle')
-WEAPON_ADJ = ('Thunderous', 'Unstoppable', 'Piercing', 'Formidable', 'Inconceivable')
-WEAPON_END = ('Power', 'Vengeance', 'Strength', 'Bravery', 'Courage', 'Soul', 'Space', 'Mind', 'Time', 'Reality', 'Death', 'Life')
-ARMOUR_NAME = ('Shield', 'Wall', 'Pillow', 'Turtle Shell', 'Car Door')
-ARMOUR_ADJ = ('Iron', 'Unbreakable', 'Mighty', 'Unweilding', 'Defensive')
-ARMOUR_END = ('Defence', 'Safety', 'Might', 'Protection', 'Prowess')
-ENEMY_NAME = ('Goblin', 'Ogre', 'Pixie', 'Goomba', 'Gremlin')
-ENEMY_ADJ = ('Stinky', 'Green', 'Mischievious', 'Naughty', 'Short', 'Ugly', 'Cruel', 'Slimy', 'Evil')
+class TextCache:
+    '''
+    LRU cache for rendered text surfaces
+    Every scene renders the same strings every frame, so keep them around'''
+
+    def __init__(self, font, max_size=256):
+        self.font = font
+        self.max_size = max_size
+        self.surfaces = OrderedDict()
+        self.sizes = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def render(self, text, antialias, colour, font=None):
+        '''Returns a (shared) rendered surface, same arguments as Font.render'''
+
+        if font is None: font = self.font
+        if not isinstance(colour, str): colour = tuple(colour)
+        key = (text, antialias, colour, font)
+
+        surface = self.surfaces.get(key)
+        if surface is not None:
+            self.hits += 1
+            self.surfaces.move_to_end(key)
+            return surface
+
+        self.misses += 1
+        surface = font.render(text, antialias, colour)
+        self.surfaces[key] = surface
+        if len(self.surfaces) > self.max_size:
+            self.surfaces.popitem(last=False)
+
+        return surface
+
+    def size(self, text, font=None):
+        '''Returns the size of the text, same as Font.size'''
+
+        if font is None: font = self.font
+        key = (text, font)
+
+        size = self.sizes.get(key)
+        if size is not None:
+            self.sizes.move_to_end(key)
+            return size
+
+        size = font.size(text)
+        self.sizes[key] = size
+        if len(self.sizes) > self.max_size:
+            self.sizes.popitem(last=False)
+
+        return size
+
+    def clear(self):
+        '''Empties the cache and resets the counters'''
+
+        self.surfaces.clear()
+        self.sizes.clear()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def hit_rate(self):
+        '''Fraction of render calls served from the cache'''
+
+        total = self.hits + self.misses
+        if total == 0: return 0
+        return self.hits / total
+
+
+TEXT_CACHE = TextCache(FONT)
+
+
+class GlyphAtlas:
+    '''
+    Every glyph of a font rendered once onto one surface, for one colour
+    Text that changes every frame (typewriter) is drawn as glyph blits instead of re-rendering'''
+
+    CHARS = ''.join(chr(i) for i in range(32, 127))
+
+    def __init__(self, font, colour, antialias=True, width=512):
+        self.font = font
+        self.colour = colour
+        self.antialias = antialias
+        self.glyphs = {}
+
+        rendered = [(char, font.render(char, antialias, colour)) for char in self.CHARS]
+
+        # Packs the glyphs into rows
+        x = y = row_h = 0
+        positions = []
+        for char, surface in rendered:
+            w, h = surface.get_size()
+            if x+w > width:
+                x = 0
+                y += row_h
+                row_h = 0
+            positions.append((x, y))
+            x += w
+            row_h = max(row_h, h)
+
+        self.atlas = pygame.Surface((width, y+row_h), pygame.SRCALPHA)
+        for (char, surface), pos in zip(rendered, positions):
+            self.atlas.blit(surface, pos)
+            self.glyphs[char] = (self.atlas, pygame.Rect(pos, surface.get_size()))
+
+    def glyph(self, char):
+        '''Returns (surface, area) of a glyph, characters outside the atlas get their own surface'''
+
+        glyph = self.glyphs.get(char)
+        if glyph is None:
+            glyph = (self.font.render(char, self.antialias, self.colour), None)
+            self.glyphs[char] = glyph
+        return glyph
+
+    def blit_sequence(self, text, pos, offsets=None):
+        '''
+        Blit sequence for Surface.blits that draws the text at pos
+        offsets are the x offsets of each glyph, taken from the font (with kerning) if not given'''
+
+        if offsets is None: offsets = [self.font.size(text[:i])[0] for i in range(len(text))]
+
+        sequence = []
+        for char, offset in zip(text, offsets):
+            if char == ' ': continue
+            surface, area = self.glyph(char)
+            sequence.append((surface, (pos[0]+offset, pos[1]), area))
+        return sequence
+
+    def draw(self, display, text, pos):
+        '''Draws the text onto the display as one batch of glyph blits'''
+
+        display.blits(self.blit_sequence(text, pos), doreturn=False)
+
+
+ATLASES = {}
+
+def get_atlas(colour, font=None):
+    '''Returns the shared glyph atlas for the font and colour, building it the first time'''
+
+    if font is None: font = FONT
+    key = (font, colour)
+    if key not in ATLASES: ATLASES[key] = GlyphAtlas(font, colour)
+    return ATLASES[key]
 
+PACK_FILE = 'assets.pack'
+PACK_MAGIC = b'SNPK'
+PACK_VERSION = 1
+PACK_HEADER = struct.Struct('<4sII')  # Magic, version, manifest length
 
-class Player:
-    '''Player class with all player details'''
+
+def pack_data_start(manifest_length):
+    '''Offset of the first blob in a pack file, the data starts on a 16 byte boundary after the manifest'''
+
+    end = PACK_HEADER.size + manifest_length
+    return end + -end % 16
+
+
+class AssetManager:
+    '''
+    Loads, converts and scales every image once and hands out the same surface after that
+    Surfaces from image() are shared, use copy() if the surface is going to be changed (alpha etc.)
+    If a baked pack file (see bake.py) is open, images and sounds come straight from it without decoding
+    preload() decodes files on background threads, asking for one of them only waits for that one'''
 
     def __init__(self):
-        self.skill_points = 35
-        self.atk = 1
-        self.hp = 1
-        self.maxhp = self.hp
-        self.defence = 1
-        self.weapon = None
-        self.armour = None
-        self.level = 0
+        self.images = {}
+        self.sounds = {}
+        self.pending = {}  # Path: future of the decoded image or sound
+        self.loads = 0
+        self.scales = 0
+        self.copies = 0
+        self.from_pack = 0
+        self.waits = 0
+        self.waited = 0.0
+        self.unused = 0
+
+        self.pack = None
+        self.pack_images = {}
+        self.pack_paths = set()  # Source images with anything in the pack, preload leaves them alone
+        self.pack_sounds = {}
+        self.pack_format = None
+        self.pack_mixer = None
+
+    @staticmethod
+    def hash_file(path):
+        '''Content hash used to tell if a baked asset is stale'''
+
+        with open(path, 'rb') as f:
+            return hashlib.sha1(f.read()).hexdigest()
+
+    @staticmethod
+    def pixel_format(surface):
+        '''Name of the surface pixel format for tostring/frombuffer, None if it has none'''
+
+        return {
+            (0xff0000, 0xff00, 0xff, 0xff000000): 'BGRA',
+            (0xff, 0xff00, 0xff0000, 0xff000000): 'RGBA',
+            (0xff00, 0xff0000, 0xff000000, 0xff): 'ARGB',
+        }.get(tuple(surface.get_masks()))
+
+    def display_format(self):
+        '''Pixel format convert_alpha gives on this display'''
+        return self.pixel_format(pygame.Surface((1, 1)).convert_alpha())
+
+    def open_pack(self, path=PACK_FILE):
+        '''
+        Memory maps a baked pack file, returns False if there isn't a usable one
+        Entries whose source file changed since baking are left out and load from the loose files'''
+
+        try:
+            f = open(path, 'rb')
+        except OSError:
+            return False
+
+        with f:
+            magic, version, length = PACK_HEADER.unpack(f.read(PACK_HEADER.size))
+            if magic != PACK_MAGIC or version != PACK_VERSION:
+                return False
+            manifest = json.loads(f.read(length))
+            self.pack = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)  # Copy on write, so mapped surfaces can't corrupt the file
+
+        fresh = set()
+        for source, digest in manifest['sources'].items():
+            try:
+                if self.hash_file(source) == digest: fresh.add(source)
+            except OSError:
+                pass
+
+        start = pack_data_start(length)
+        for entry in manifest['images']:
+            if entry['path'] in fresh:
+                size = tuple(entry['size']) if entry['size'] is not None else None
+                self.pack_images[(entry['path'], size)] = (start+entry['offset'], entry['length'], tuple(entry['pixels']))
+                self.pack_paths.add(entry['path'])
+        for entry in manifest['sounds']:
+            if entry['path'] in fresh:
+                self.pack_sounds[entry['path']] = (start+entry['offset'], entry['length'])
+
+        self.pack_format = manifest['format']
+        self.pack_mixer = tuple(manifest['mixer'])
+        return True
+
+    def preload(self, images=(), sounds=(), workers=4):
+        '''
+        Starts decoding the image and sound files on a thread pool (decoding lets go of the GIL)
+        Anything already cached or in the pack (at any size) is skipped, converting still happens when image() asks for it'''
+
+        jobs = [(path, pygame.image.load) for path in images if (path, None) not in self.images and path not in self.pack_paths]
+        jobs += [(path, pygame.mixer.Sound) for path in sounds if path not in self.sounds and path not in self.pack_sounds]
+        jobs = [(path, load) for path, load in dict(jobs).items() if path not in self.pending]
+        if not jobs: return
+
+        pool = ThreadPoolExecutor(min(workers, len(jobs)), thread_name_prefix='assets')
+        for path, load in jobs:
+            self.pending[path] = pool.submit(load, path)
+        pool.shutdown(wait=False)  # The threads finish the queue and go
 
     @property
-    def hp(self):
-        '''Property decorator as hp has to update maxhp'''
-        return self._hp
+    def loading(self):
+        '''Whether background decoding is still going'''
+        return any(not future.done() for future in self.pending.values())
+
+    def drop_pending(self):
+        '''Forgets the decodes nothing asked for, so they don't hold their surfaces for the whole run'''
+
+        for future in self.pending.values():
+            future.cancel()
+        self.unused += len(self.pending)
+        self.pending.clear()
+
+    def decoded(self, path, load):
+        '''The decoded file from the background threads if it was preloaded, otherwise loads it now'''
+
+        self.loads += 1
+        future = self.pending.pop(path, None)
+        if future is None:
+            return load(path)
+
+        if not future.done():
+            self.waits += 1
+            start = perf_counter()
+            result = future.result()
+            self.waited += perf_counter()-start
+            return result
+        return future.result()
+
+    def image(self, path, size=None):
+        '''Returns the shared surface of the image at path, scaled to size if given'''
+
+        key = (path, size)
+        image = self.images.get(key)
+        if image is not None:
+            return image
+
+        if key in self.pack_images:
+            offset, length, pixels = self.pack_images[key]
+            image = pygame.image.frombuffer(memoryview(self.pack)[offset:offset+length], pixels, self.pack_format)
+            # Packs baked in another format (RGBA where pygame can't write the display's) take one convert
+            if self.pack_format != self.display_format(): image = image.convert_alpha()
+            self.from_pack += 1
+        elif size is None:
+            image = self.decoded(path, pygame.image.load).convert_alpha()
+        else:
+            image = pygame.transform.scale(self.image(path), size)
+            self.scales += 1
+
+        self.images[key] = image
+        return image
 
-    @hp.setter
-    def hp(self, value):
-        self._hp = value
-        self.max_hp = self._hp
+    def sound(self, path):
+        '''Returns the shared sound at path'''
+
+        sound = self.sounds.get(path)
+        if sound is not None:
+            return sound
+
+        if path in self.pack_sounds and self.pack_mixer == pygame.mixer.get_init():
+            offset, length = self.pack_sounds[path]
+            sound = pygame.mixer.Sound(buffer=memoryview(self.pack)[offset:offset+length])
+            self.from_pack += 1
+        else:
+            sound = self.decoded(path, pygame.mixer.Sound)
+
+        self.sounds[path] = sound
+        return sound
+
+    def adopt(self, atlas):
+        '''Swaps cached images for their handles in a packed SpriteAtlas'''
+
+        for key in self.images:
+            image = atlas.get(key)
+            if image is not None: self.images[key] = image
+
+    def copy(self, path, size=None):
+        '''Returns a copy of the image that can be changed without touching the shared one'''
+
+        self.copies += 1
+        return self.image(path, size).copy()
 
     @property
-    def sum(self):
-        '''Sum of all skills'''
-        return self.atk + self.hp + self.defence
+    def bytes(self):
+        '''Amount of pixel memory held by the cached surfaces, atlas pages are counted once'''
+
+        surfaces = {id(image.get_abs_parent()): image.get_abs_parent() for image in self.images.values()}
+        return sum(image.get_pitch()*image.get_height() for image in surfaces.values())
+
+    def stats(self):
+        '''Counters to check nothing is loaded from disk after warm-up'''
+
+        return {
+            'loads': self.loads, 'from_pack': self.from_pack, 'scales': self.scales, 'copies': self.copies,
+            'surfaces': len(self.images), 'bytes': self.bytes, 'waits': self.waits, 'waited_ms': round(self.waited*1000, 3),
+            'unused': self.unused
+        }
+
+
+ASSETS = AssetManager()
+ASSETS.open_pack()
+
+# Sounds are played through AUDIO, which decodes them all up front once the manager has loaded
+SOUND_SELECT = 'audios/select.wav'
+SOUND_CONFIRM = 'audios/confirm.ogg'
+SOUND_TAKE_ITEM = 'audios/take_item.wav'
+
+# voices: how many can play at once, priority: higher steals channels from lower, retrigger: ms before it can play again
+SOUND_SETTINGS = {
+    SOUND_SELECT: {'voices': 2, 'priority': 0, 'retrigger': 40},
+    SOUND_CONFIRM: {'voices': 2, 'priority': 1, 'retrigger': 60},
+    SOUND_TAKE_ITEM: {'voices': 1, 'priority': 2, 'retrigger': 100},
+}
+DEFAULT_SOUND_SETTING = {'voices': 1, 'priority': 0, 'retrigger': 50}
+AUDIO_CHANNELS = 8
+
+
+class AudioEngine:
+    '''
+    Plays the sound effects on a fixed pool of channels, with the limits in SOUND_SETTINGS
+    A sound at its voice limit restarts its oldest voice, when every channel is busy the lowest priority (then oldest) voice
+    is stolen unless it is more important than the new one, in which case the new one is dropped
+    Latency is from play() being called to the channel starting, so it includes any loading the sound needed'''
+
+    COUNTS = ('triggers', 'played', 'retriggers', 'voice_steals', 'priority_steals', 'dropped')
+
+    def __init__(self, channels=AUDIO_CHANNELS, settings=SOUND_SETTINGS):
+        self.channel_count = channels
+        self.settings = settings
+        self.channels = []
+        self.voices = {}  # Channel index: (path, priority, start time)
+        self.sounds = {}
+        self.last_trigger = {}
+        self.latencies = deque(maxlen=1000)
+        self.counts = dict.fromkeys(self.COUNTS, 0)
+
+    def ready(self):
+        '''Sets up the channel pool the first time, False if there is no mixer (then nothing plays)'''
+
+        if not self.channels and pygame.mixer.get_init():
+            pygame.mixer.set_num_channels(self.channel_count)
+            self.channels = [pygame.mixer.Channel(i) for i in range(self.channel_count)]
+        return bool(self.channels)
+
+    def load(self, paths):
+        '''Decodes the sounds now, so playing them never has to'''
+
+        if not self.ready(): return
+        for path in paths: self.sounds[path] = ASSETS.sound(path)
+
+    def playing(self):
+        '''Voices that are still playing, by channel index'''
+
+        self.voices = {index: voice for index, voice in self.voices.items() if self.channels[index].get_busy()}
+        return self.voices
+
+    def pick_channel(self, path, setting):
+        '''Index of the channel to play on, None if the sound should be dropped'''
+
+        playing = self.playing()
+
+        own = [(voice[2], index) for index, voice in playing.items() if voice[0] == path]
+        if len(own) >= setting['voices']:
+            self.counts['voice_steals'] += 1
+            return min(own)[1]
 
-    def change_hp(self, change):
-        '''Changes the hp'''
-        self._hp += change
-        if self._hp > self.max_hp: self._hp = self.max_hp
+        for index in range(len(self.channels)):
+            if index not in playing: return index
+
+        index, voice = min(playing.items(), key=lambda item: (item[1][1], item[1][2]))
+        if voice[1] > setting['priority']:
+            self.counts['dropped'] += 1
+            return None
+        self.counts['priority_steals'] += 1
+        return index
+
+    def play(self, path):
+        '''Plays the sound at path, returns the channel or None if it didn't play'''
+
+        if not self.ready(): return None
+
+        start = perf_counter()
+        self.counts['triggers'] += 1
+        setting = self.settings.get(path, DEFAULT_SOUND_SETTING)
+
+        last = self.last_trigger.get(path)
+        if last is not None and (start-last)*1000 < setting['retrigger']:
+            self.counts['retriggers'] += 1
+            return None
+        self.last_trigger[path] = start
+
+        index = self.pick_channel(path, setting)
+        if index is None: return None
+
+        sound = self.sounds.get(path)
+        if sound is None: sound = self.sounds[path] = ASSETS.sound(path)
+
+        channel = self.channels[index]
+        channel.play(sound)  # Stops whatever was on the channel
+        self.voices[index] = (path, setting['priority'], start)
+
+        self.counts['played'] += 1
+        self.latencies.append(perf_counter()-start)
+        return channel
+
+    def stats(self):
+        '''Counts and trigger to play latency in ms (mean and worst of the last 1000)'''
+
+        stats = dict(self.counts)
+        if self.latencies:
+            stats['latency_ms'] = round(sum(self.latencies) / len(self.latencies) * 1000, 4)
+            stats['worst_latency_ms'] = round(max(self.latencies) * 1000, 4)
+        return stats
+
+
+AUDIO = AudioEngine()
 
 
 class SpriteSheet:
@@ -69,10 +509,36 @@ class SpriteSheet:
     i love you <3'''
 
     def __init__(self, spritesheet):
-        self.sheet = pygame.image.load('{}.png'.format(spritesheet)).convert_alpha()
+        self.path = '{}.png'.format(spritesheet)
+
+    @property
+    def sheet(self):
+        '''Loaded when first needed, so making a sheet doesn't wait for the file'''
+        return ASSETS.image(self.path)
 
     def get_image(self, rect):
-        '''Extraction of sprite using rect as position, offset, etc...'''
+        '''
+        Extraction of sprite using rect as position, offset, etc...
+        Once the sprites are packed this is a handle into SPRITE_ATLAS, not a copy'''
+
+        image = SPRITE_ATLAS.get((self.path, tuple(rect)))
+        if image is not None:
+            return image
+
+        return self.extract(rect)
+
+    def get_scaled(self, rect, size, dest=None):
+        '''
+        Sprite scaled to size as its own surface, one that can be changed (alpha etc.)
+        Giving dest (a surface this returned before for the same size) scales into it instead of making a new one'''
+
+        image = self.get_image(rect)
+        if dest is None or image.get_colorkey() is not None: image = image.convert_alpha()
+        if dest is None: return pygame.transform.scale(image, size)
+        return pygame.transform.scale(image, size, dest)
+
+    def extract(self, rect):
+        '''Copies the sprite out of the sheet'''
 
         image = pygame.Surface((rect[2], rect[3])).convert_alpha()
         image.blit(self.sheet, (0, 0), rect)
@@ -81,6 +547,90 @@ class SpriteSheet:
         return image
 
 
+class SpriteAtlas:
+    '''
+    Packs lots of small sprites into a few big surfaces (pages)
+    get() hands out subsurfaces of the pages, so nothing is copied'''
+
+    def __init__(self, width=None, max_height=2048):
+        self.width = width  # Picked to waste the least memory if None
+        self.max_height = max_height
+        self.pending = {}
+        self.pages = []
+        self.sprites = {}
+
+    def add(self, key, image):
+        '''Queues an image to be packed under key'''
+        self.pending[key] = image
+
+    def shelve(self, order, width):
+        '''Places the images on shelves (rows) of the given width, returns the pages as lists of (key, image, pos)'''
+
+        pages = [[]]
+        x = y = shelf_h = 0
+        for key, image in order:
+            w, h = image.get_size()
+            if x+w > width:
+                x = 0
+                y += shelf_h
+                shelf_h = 0
+            if y+h > self.max_height:
+                pages.append([])
+                x = y = shelf_h = 0
+            pages[-1].append((key, image, (x, y)))
+            x += w
+            shelf_h = max(shelf_h, h)
+
+        return [placed for placed in pages if placed]
+
+    @staticmethod
+    def page_size(placed):
+        '''Smallest page that fits the placed images'''
+
+        return (
+            max(pos[0]+image.get_width() for key, image, pos in placed),
+            max(pos[1]+image.get_height() for key, image, pos in placed)
+        )
+
+    def pack(self):
+        '''
+        Packs the queued images, tallest images first
+        Without a set width, a few widths are tried and the one wasting the least memory wins'''
+
+        order = sorted(self.pending.items(), key=lambda item: (item[1].get_height(), item[1].get_width()), reverse=True)
+
+        if self.width is None:
+            widest = max(image.get_width() for image in self.pending.values())
+            widths = range(widest, max(widest, 2048)+1, 16)
+        else:
+            widths = (self.width,)
+
+        def area(pages):
+            return sum(w*h for w, h in map(self.page_size, pages))
+        pages = min((self.shelve(order, width) for width in widths), key=area)
+
+        for placed in pages:
+            page = pygame.Surface(self.page_size(placed), pygame.SRCALPHA)
+            for key, image, pos in placed:
+                page.blit(image, pos)
+                self.sprites[key] = page.subsurface(pygame.Rect(pos, image.get_size()))
+            self.pages.append(page)
+
+        self.pending.clear()
+
+    def get(self, key):
+        '''Returns the subsurface for key, None if it was never packed'''
+        return self.sprites.get(key)
+
+    @property
+    def bytes(self):
+        '''Pixel memory of all the pages'''
+        return sum(page.get_pitch()*page.get_height() for page in self.pages)
+
+
+SPRITE_ATLAS = SpriteAtlas()
+
+
 BATTLE_DICTS = {
     'fight': [0, 0, 32, 32],
     'sharpen': [32, 0, 32, 32],
@@ -94,53 +644,94 @@ ENEMY_DICTS = {
     'Goomba': [192, 0, 64, 64],
     'Gremlin': [256, 0, 64, 64],
 }
-WEAPON_DICTS = {
-    'Sword': [0, 0, 16, 16],
-    'Staff': [16, 0, 16, 16],
-    'Knife': [32, 0, 16, 16],
-    'Glass Bottle': [48, 0, 16, 16],
-    'Broomstick': [64, 0, 16, 16],
-    'Pan': [80, 0, 16, 16],
-    'Shuriken': [96, 0, 16, 16]
-}
-ARMOUR_DICTS = {
-    'Shield': [0, 0, 16, 16],
-    'Wall': [16, 0, 16, 16],
-    'Pillow': [32, 0, 16, 16],
-    'Turtle Shell': [48, 0, 16, 16],
-    'Car Door': [64, 0, 16, 16],
-}
+ROOM_IMAGES = ('assets/healroom', 'assets/enemyroom', 'assets/chestroom', 'assets/boostroom')
+SKILL_IMAGES = ('assets/attackskill', 'assets/healthskill', 'assets/defenceskill')
+SHEET_IMAGES = ('assets/weapons', 'assets/armour', 'assets/battleicons', 'assets/enemies')
+SOUNDS = (SOUND_SELECT, SOUND_CONFIRM, SOUND_TAKE_ITEM)
 
 
-class BlankRoom(pygame.sprite.Sprite):
-    '''A blank room; only to be inherited by other rooms'''
+def game_images():
+    '''Every (path, size) image the game asks ASSETS for, apart from the sprite sheets'''
 
-    def __init__(self, image, pos, name, desc):
+    images = [('{}.png'.format(room), size) for room in ROOM_IMAGES for size in BlankRoom.SIZES.values()]
+    images += [('{}.png'.format(skill), Skill.SIZE) for skill in SKILL_IMAGES]
+    images += [('assets/skillborder.png', (192, 132)), ('assets/chest_c.png', (128, 128)), ('assets/chest_o.png', (128, 128)), ('assets/healsprite.png', None)]
+    return images
+
+
+def startup_files():
+    '''Every image and sound file to decode at startup, for ASSETS.preload'''
+
+    images = ['{}.png'.format(sheet) for sheet in SHEET_IMAGES] + [path for path, size in game_images()]
+    return images, SOUNDS
+
+
+def pack_sprites(sheets):
+    '''
+    Packs every sprite in the game into SPRITE_ATLAS, run once the display is set
+    sheets is a list of (SpriteSheet, dict of sprite rects)'''
+
+    for sheet, rects in sheets:
+        for rect in rects.values():
+            # Colour keyed sprites become transparent pixels on the atlas
+            image = pygame.Surface((rect[2], rect[3]), pygame.SRCALPHA)
+            image.blit(sheet.extract(rect), (0, 0))
+            SPRITE_ATLAS.add((sheet.path, tuple(rect)), image)
+
+    for key in game_images():
+        SPRITE_ATLAS.add(key, ASSETS.image(*key))
+
+    SPRITE_ATLAS.pack()
+    ASSETS.adopt(SPRITE_ATLAS)
+
+
+class StateSprite(pygame.sprite.Sprite):
+    '''
+    Sprite with an image for each display state (normal, selected, ...)
+    Every state is built once from the original image, changing state just swaps the image'''
+
+    def __init__(self, states, pos, state='normal'):
         super().__init__()
-        self.image = pygame.image.load('{}.png'.format(image)).convert_alpha()
-        self.image = pygame.transform.scale(self.image, (128, 128))
+        self.states = states
+        self.state = state
+        self.image = self.states[state]
         self.rect = self.image.get_rect()
         self.rect.center = pos
-        self.name = name
-        self.desc = desc
 
-    def select(self):
-        '''Selects the room for selection'''
+    @staticmethod
+    def scaled_states(image, sizes):
+        '''Scales the original image to the size of each state'''
+        return {state: pygame.transform.scale(image, size) for state, size in sizes.items()}
 
-        if self.image.get_height() == 128:
+    def set_state(self, state):
+        '''Swaps to the image of the state, keeping the sprite centred'''
+
+        if state != self.state:
             pos = self.rect.center
-            self.image = pygame.transform.scale(self.image, (192, 192))
+            self.state = state
+            self.image = self.states[state]
             self.rect = self.image.get_rect()
             self.rect.center = pos
 
+    def select(self):
+        '''Selects the sprite'''
+        self.set_state('selected')
+
     def deselect(self):
-        '''Deselects the room for selection'''
+        '''Deselects the sprite'''
+        self.set_state('normal')
 
-        if self.image.get_height() != 128:
-            pos = self.rect.center
-            self.image = pygame.transform.scale(self.image, (128, 128))
-            self.rect = self.image.get_rect()
-            self.rect.center = pos
+
+class BlankRoom(StateSprite):
+    '''A blank room; only to be inherited by other rooms'''
+
+    SIZES = {'normal': (128, 128), 'selected': (192, 192)}
+
+    def __init__(self, image, pos, name, desc):
+        path = '{}.png'.format(image)
+        super().__init__({state: ASSETS.image(path, size) for state, size in self.SIZES.items()}, pos)
+        self.name = name
+        self.desc = desc
 
 
 class HealRoom(BlankRoom):
@@ -171,39 +762,95 @@ class BoostRoom(BlankRoom):
         super().__init__('assets/boostroom', pos, 'BOOST ROOM', 'A rare sight very few heros come across. Legend has it you become much stronger after entering!\n\nEnter?')
 
 
-ROOMS = (HealRoom, EnemyRoom, ChestRoom)
-
-def gen_random_rooms():
-    '''Generates random tuple of three rooms'''
+ROOMS = {'HEAL ROOM': HealRoom, 'ENEMY ROOM': EnemyRoom, 'CHEST ROOM': ChestRoom, 'BOOST ROOM': BoostRoom}
 
-    rooms = (
-        choice(ROOMS)((SCREEN_W/4-45, SCREEN_H/3)),
-        choice(ROOMS)((SCREEN_W/4*2, SCREEN_H/3)),
-        choice(ROOMS)((SCREEN_W/4*3+45, SCREEN_H/3))
-    )
+def gen_random_rooms(names=None):
+    '''Generates random tuple of three rooms, or the rooms named in names (the ones ahead on the dungeon map)'''
 
-    if round(random(), 2) <= 1/100:
-        rooms = (
-            choice(ROOMS)((SCREEN_W/4-45, SCREEN_H/3)),
-            BoostRoom((SCREEN_W/4*2, SCREEN_H/3)),
-            choice(ROOMS)((SCREEN_W/4*3+45, SCREEN_H/3))
-        )
-    return rooms
+    if names is None: names = room_names()
+    positions = ((SCREEN_W/4-45, SCREEN_H/3), (SCREEN_W/4*2, SCREEN_H/3), (SCREEN_W/4*3+45, SCREEN_H/3))
+    return tuple(ROOMS[name](pos) for name, pos in zip(names, positions))
 
 
 class Text:
-    '''Class for text animation'''
+    '''
+    Class for text animation
+    The wrapped layout is worked out once in change_text, revealing is just moving an index'''
 
-    def __init__(self, display, text, *, max_size=None, speed=0.5, pos=(60, 360)):
+    def __init__(self, display, text, *, max_size=None, speed=0.5, pos=(60, 360), renderer='font'):
         if max_size is None: self.max_size = (SCREEN_W/4*3, SCREEN_H/4)
+        else: self.max_size = max_size
         self.display = display
-        self.text = text
-        self.frame = 0
+        self.font = FONT
+        self.renderer = renderer  # 'font' renders whole lines, 'atlas' blits glyphs (opt-in, benchmarks.py found it no faster to animate and slower to draw)
+        self.colour = 'grey95'
         self.speed = speed
         self.pos = pos
-        self.lines = [{'text': '', 'x': self.pos[0], 'y': self.pos[1]}]
-        self.c_line = 0
-        self.height = FONT.size('Hello, World!')[1]
+        self.height = self.font.size('Hello, World!')[1]
+        self.change_text(text)
+
+    def layout(self):
+        '''
+        Wraps the text into lines and works out where every character ends up
+        stops[n] is (line, characters shown on that line) when n characters are revealed'''
+
+        self.lines = []
+        line = ''
+        sources = []  # Index in self.text of each character in line
+
+        def new_line(text, sources):
+            offsets = [self.font.size(text[:i])[0] for i in range(len(text)+1)]
+            self.lines.append({
+                'text': text,
+                'x': self.pos[0],
+                'y': self.pos[1]+self.height*len(self.lines),
+                'height': self.height,
+                'offsets': offsets,
+                'sources': sources,
+            })
+
+        for i, char in enumerate(self.text):
+            if char == '\n':
+                new_line(line, sources)
+                line, sources = '', []
+                continue
+
+            # Checking if the text goes out of bounds, the last word moves down a line
+            if line and self.font.size(line+char)[0] > self.max_size[0]:
+                split = line.rfind(' ')
+                if split == -1:
+                    new_line(line, sources)
+                    line, sources = '', []
+                else:
+                    new_line(line[:split], sources[:split])
+                    line, sources = line[split+1:], sources[split+1:]
+
+            line += char
+            sources.append(i)
+        new_line(line, sources)
+
+        # Maps the amount of revealed characters to a position in the layout
+        shown = [(0, 0)] * (len(self.text)+1)
+        for l, line in enumerate(self.lines):
+            for c, i in enumerate(line['sources']):
+                shown[i+1] = (l, c+1)
+        for n in range(1, len(shown)):
+            if shown[n] == (0, 0): shown[n] = shown[n-1]
+        self.stops = shown
+
+        if self.renderer == 'atlas':
+            atlas = get_atlas(self.colour, self.font)
+            for line in self.lines:
+                line['blits'] = atlas.blit_sequence(line['text'], (line['x'], line['y']), line['offsets'])
+                # Spaces are not blitted, so count how many blits each character count needs
+                line['n_blits'] = [0]
+                for char in line['text']:
+                    line['n_blits'].append(line['n_blits'][-1] + (char != ' '))
+
+    @property
+    def finished(self):
+        '''True once all the text is visible'''
+        return self.frame == len(self.text)
 
     def update(self):
         '''Updates amount of text visible'''
@@ -211,50 +858,37 @@ class Text:
         if self.frame == len(self.text):
             return
 
-        if int(self.frame) == self.frame:
-            # Newline if newline
-            if self.text[int(self.frame)] == '\n':
-                self.c_line += 1
-                self.lines.append({'text': '', 'x': self.pos[0], 'y': self.pos[1]+self.height*self.c_line})
-
-                self.frame += self.speed
-                return
-
-            self.t_text = self.lines[self.c_line]['text'] + self.text[int(self.frame)]
-
-            # Checking if the text goes out of bounds
-            if FONT.size(self.t_text)[0] > self.max_size[0]:
-                split_text = self.lines[self.c_line]['text'].split(' ')
-                last_word = split_text[-1]
-                split_text.pop()
-                self.lines[self.c_line]['text'] = ' '.join(split_text)
-                self.c_line += 1
-                self.lines.append({'text': last_word+self.text[int(self.frame)], 'x': self.pos[0], 'y': self.pos[1]+self.height*self.c_line})
-            else:
-                self.lines[self.c_line]['text'] += self.text[int(self.frame)]
-
-        self.frame += self.speed
+        self.frame = min(self.frame+self.speed, len(self.text))
+        self.c_line, self.c_chars = self.stops[ceil(self.frame)]
 
     def skip(self):
         '''Function for skipping the text animation'''
 
-        # Calls update function until all text is visible
-        for _ in range(len(self.text)*self.speed):
-            self.update()
+        self.frame = len(self.text)
+        self.c_line, self.c_chars = self.stops[-1]
 
     def draw(self):
         '''Function for displaying the text'''
 
-        for line in self.lines:
-            self.display.blit(FONT.render(line['text'], True, 'grey95'), (line['x'], line['y']))
+        # Finished lines never change so they come from the text cache
+        for line in self.lines[:self.c_line]:
+            self.display.blit(TEXT_CACHE.render(line['text'], True, self.colour), (line['x'], line['y']))
+
+        # The line being revealed changes every frame, the atlas avoids rendering a new string each time
+        line = self.lines[self.c_line]
+        if self.renderer == 'atlas':
+            self.display.blits(line['blits'][:line['n_blits'][self.c_chars]], doreturn=False)
+        elif self.c_chars:
+            self.display.blit(TEXT_CACHE.render(line['text'][:self.c_chars], True, self.colour), (line['x'], line['y']))
 
     def change_text(self, new_text):
         '''Function for changing the text'''
 
         self.text = new_text
         self.frame = 0
-        self.lines = [{'text': '', 'x': self.pos[0], 'y': self.pos[1]}]
         self.c_line = 0
+        self.c_chars = 0
+        self.layout()
 
 
 class Animation:
@@ -274,15 +908,616 @@ class Animation:
         else: return round(frame*self.ppixel)
 
 
+class Command:
+    '''
+    Something a scene script waits on, see Scheduler
+    step() runs once a frame (before it is drawn) until done() is true'''
+
+    idle = False  # True if nothing happens until there is input
+
+    def start(self):
+        pass
+
+    def step(self):
+        pass
+
+    def done(self):
+        return False
+
+    def press(self, action):
+        '''True if this was waiting for the action (its name, see Input)'''
+        return False
+
+
+class Wait(Command):
+    '''Waits for a number of frames'''
+
+    def __init__(self, frames):
+        self.frames = frames
+
+    def step(self):
+        self.frames -= 1
+
+    def done(self):
+        return self.frames <= 0
+
+
+class WaitAction(Command):
+    '''Waits for one of the actions (confirm, left etc.), the script gets the action's name back'''
+
+    idle = True
+
+    def __init__(self, *actions):
+        self.actions = actions
+
+    def press(self, action):
+        return action in self.actions
+
+
+class WaitText(Command):
+    '''Waits for a Text to be all out (shown or skipped)'''
+
+    def __init__(self, text):
+        self.text = text
+
+    @property
+    def idle(self):
+        return self.text.finished
+
+    def done(self):
+        return self.text.finished
+
+
+class Tween(Command):
+    '''
+    Changes obj.attr by the next of moves every frame, done when they run out
+    The first move is made straight away, so it shows on the frame the tween starts'''
+
+    def __init__(self, obj, attr, moves):
+        self.obj = obj
+        self.attr = attr
+        self.moves = iter(moves)
+        self.finished = False
+
+    def get(self):
+        return getattr(self.obj, self.attr)
+
+    def set(self, value):
+        setattr(self.obj, self.attr, value)
+
+    def start(self):
+        self.step()
+
+    def step(self):
+        move = next(self.moves, None)
+        if move is None: self.finished = True
+        else: self.set(self.get()+move)
+
+    def done(self):
+        return self.finished
+
+
+class AlphaTween(Tween):
+    '''Tween of a surface's alpha'''
+
+    def __init__(self, surface, moves):
+        super().__init__(surface, 'alpha', moves)
+
+    def get(self):
+        return self.obj.get_alpha()
+
+    def set(self, value):
+        self.obj.set_alpha(value)
+
+
+class All(Command):
+    '''Waits for all the commands, a script yielding a tuple of commands gets one of these'''
+
+    def __init__(self, commands):
+        self.commands = commands
+
+    @property
+    def idle(self):
+        return all(command.idle for command in self.commands)
+
+    def start(self):
+        for command in self.commands: command.start()
+
+    def step(self):
+        for command in self.commands:
+            if not command.done(): command.step()
+
+    def done(self):
+        return all(command.done() for command in self.commands)
+
+
+def wait_confirm(text):
+    '''Script steps for text that needs confirming once it is all out, use with yield from'''
+
+    yield WaitText(text)
+    yield WaitAction('confirm')
+
+
+class Scheduler:
+    '''
+    Runs scene scripts, generators that yield the Command they wait on (a tuple of them waits on all)
+    A script only runs again once its command is done, so a frame costs the waiting commands and nothing else
+    update() goes at the start of the scene's frame, before the events, and press() gets the actions'''
+
+    def __init__(self):
+        self.scripts = {}  # Script: command it waits on
+        self.starting = []
+
+    def start(self, script):
+        '''Script starts on the next update, its first command counts from that frame'''
+        self.starting.append(script)
+
+    def resume(self, script, value=None):
+        '''Carries a script on until it waits on a command that isn't done yet'''
+
+        while True:
+            try:
+                command = script.send(value)
+            except StopIteration:
+                self.scripts.pop(script, None)
+                return
+
+            if isinstance(command, tuple): command = All(command)
+            command.start()
+            if not command.done(): break
+            value = None
+        self.scripts[script] = command
+
+    def update(self):
+        '''
+        Steps every command a frame, carrying on the scripts whose command is done
+        Commands the scripts start now (or started on the last frame's keys) already made their first step'''
+
+        for script, command in list(self.scripts.items()):
+            command.step()
+            if command.done(): self.resume(script)
+
+        starting, self.starting = self.starting, []
+        for script in starting:
+            self.resume(script)
+
+    def press(self, action):
+        '''Hands an action's name to the scripts waiting on it'''
+
+        for script in list(self.scripts):
+            if self.scripts[script].done(): self.resume(script)  # Text skipped this frame etc.
+            command = self.scripts.get(script)
+            if command is not None and command.press(action): self.resume(script, action)
+
+    def idle(self):
+        '''True when every script is waiting on input'''
+        return not self.starting and all(command.idle for command in self.scripts.values())
+
+    @property
+    def running(self):
+        return bool(self.scripts or self.starting)
+
+    def cancel(self):
+        for script in self.scripts: script.close()
+        self.scripts = {}
+        self.starting = []
+
+
+class DirtySurface:
+    '''
+    Wraps a surface and records what is drawn on it each frame
+    Comparing a frame to the last one gives the rects that changed (dirty rects)
+    Deferred surfaces (the screen) only draw at end_frame, clearing and redrawing just the dirty rects'''
+
+    def __init__(self, surface, deferred=False, background=BG_COLOUR):
+        self.surface = surface
+        self.deferred = deferred
+        self.background = background
+        self.ops = []
+        self.last_ops = []
+        self.changed = []
+        self.full = True  # First frame has to be drawn everywhere
+
+    def __getattr__(self, name):
+        if name == 'surface': raise AttributeError(name)  # Not set yet, happens when copying
+        return getattr(self.surface, name)
+
+    def mark_dirty(self, rect=None):
+        '''For scenes to report a change the op comparison can't see, the whole surface if rect is None'''
+
+        if rect is None: self.full = True
+        else: self.changed.append(pygame.Rect(rect))
+
+    def blit(self, source, dest, area=None, special_flags=0):
+        pos = pygame.Rect(dest).topleft if len(dest) == 4 else pygame.Rect(dest, (0, 0)).topleft
+
+        if isinstance(source, DirtySurface):
+            # Whatever changed on the source surface is dirty here too
+            for rect in source.end_frame():
+                self.changed.append(rect.move(pos))
+            source = source.surface
+
+        if area is not None: area = pygame.Rect(area)
+        rect = pygame.Rect(pos, area.size if area is not None else source.get_size())
+        rect = rect.clip(self.surface.get_rect())
+
+        # The source is kept in the key (not its id) so it can't be freed and its id reused
+        key = (source, source.get_alpha(), pos, tuple(area) if area is not None else None, special_flags)
+        self.ops.append((key, rect, ('blit', source, pos, area, special_flags)))
+        if not self.deferred:
+            self.surface.blit(source, pos, area, special_flags)
+
+        return rect
+
+    def blits(self, blit_sequence, doreturn=1):
+        rects = [self.blit(*blit) for blit in blit_sequence]
+        if doreturn: return rects
+
+    def fill(self, colour, rect=None, special_flags=0):
+        rect = self.surface.get_rect() if rect is None else pygame.Rect(rect).clip(self.surface.get_rect())
+
+        key = ('fill', colour if isinstance(colour, str) else tuple(colour), tuple(rect), special_flags)
+        self.ops.append((key, rect, ('fill', colour, rect, special_flags)))
+        if not self.deferred:
+            self.surface.fill(colour, rect, special_flags)
+
+        return rect
+
+    def replay(self, op):
+        if op[0] == 'blit': self.surface.blit(*op[1:])
+        else: self.surface.fill(*op[1:])
+
+    def end_frame(self):
+        '''Finishes the frame and returns its dirty rects, drawing them if deferred'''
+
+        dirty = self.changed
+        if self.full or [key for key, _, _ in self.ops] != [key for key, _, _ in self.last_ops]:
+            current = {key for key, _, _ in self.ops}
+            last = {key for key, _, _ in self.last_ops}
+            if self.full or current == last:
+                # Same things drawn in a different order, or no history, so redraw everywhere
+                dirty = [self.surface.get_rect()]
+            else:
+                dirty += [rect for key, rect, _ in self.ops if key not in last]
+                dirty += [rect for key, rect, _ in self.last_ops if key not in current]
+
+        dirty = merge_rects([rect for rect in dirty if rect.size], self.surface.get_rect())
+
+        if self.deferred:
+            for rect in dirty:
+                self.surface.set_clip(rect)
+                self.surface.fill(self.background)
+                for _, op_rect, op in self.ops:
+                    if op_rect.colliderect(rect): self.replay(op)
+            self.surface.set_clip(None)
+
+        self.last_ops = self.ops
+        self.ops = []
+        self.changed = []
+        self.full = False
+        return dirty
+
+
+def merge_rects(rects, bounds, full=0.6):
+    '''
+    Joins rects that overlap, when the joined rect isn't bigger than the two apart
+    If they cover most of bounds anyway, just returns bounds'''
+
+    def area(rect):
+        return rect.w*rect.h
+
+    merged = []
+    rects = [rect.clip(bounds) for rect in rects]
+    while rects:
+        rect = rects.pop()
+        for i, other in enumerate(merged):
+            union = rect.union(other)
+            if rect.colliderect(other) and area(union) <= area(rect)+area(other):
+                # The union may now overlap other merged rects, so it goes round again
+                merged.pop(i)
+                rects.append(union)
+                break
+        else:
+            merged.append(rect)
+
+    if sum(map(area, merged)) > area(bounds)*full:
+        return [bounds.copy()]
+    return merged
+
+
+class EventSource:
+    '''
+    Where scenes get their events from, so the input can be recorded and played back
+    Recorded events are (frame, type, key), the manager moves the frame on
+    Every event is stamped with the perf_counter time it was first seen (event.arrived), for the input latency'''
+
+    def __init__(self):
+        self.frame = 0
+        self.pending = []  # Events taken off the queue early (poll) for the next get
+        self.recording = None
+        self.replaying = None
+        self.replay_end = None
+        self.hotkeys = {}  # Key: function, for debug toggles, these never reach the scenes or recordings
+        self.exposed = False  # One of REDRAW_EVENTS came in, the manager pushes the whole screen next
+
+    def record(self, events=()):
+        '''Starts recording from this frame on, events are any recorded before it (carrying on from a replay)'''
+        self.recording = [tuple(event) for event in events]
+
+    def replay(self, events, end=None):
+        '''
+        Plays back recorded events instead of the real input (apart from quitting)
+        The real input comes back at frame end, if given'''
+
+        self.replaying = {}
+        self.replay_end = end
+        for frame, type_, key in events:
+            self.replaying.setdefault(frame, []).append((type_, key))
+
+    def poll(self, events=None):
+        '''
+        Takes events off the queue now (or the ones given, already taken off it) and keeps them for the next get
+        The manager polls while it waits for the next frame, so events are stamped when they come in and not a frame later'''
+
+        if events is None: events = pygame.event.get()
+        now = perf_counter()
+        for event in events:
+            if not hasattr(event, 'arrived'): event.arrived = now
+            if event.type in REDRAW_EVENTS: self.exposed = True
+        self.pending += events
+        return events
+
+    def get(self):
+        '''Events for this frame, use instead of pygame.event.get'''
+
+        self.poll()
+        events, self.pending = self.pending, []
+        if self.hotkeys:
+            for event in events:
+                if event.type == pygame.KEYDOWN and event.key in self.hotkeys: self.hotkeys[event.key]()
+            events = [event for event in events if event.type != pygame.KEYDOWN or event.key not in self.hotkeys]
+
+        if self.replaying is not None:
+            events = [event for event in events if event.type == pygame.QUIT]
+            now = perf_counter()
+            events += [pygame.event.Event(type_, key=key, arrived=now) for type_, key in self.replaying.pop(self.frame, ())]
+        if self.recording is not None:
+            self.recording += [(self.frame, event.type, event.key) for event in events if event.type == pygame.KEYDOWN]
+
+        return events
+
+    def next_frame(self):
+        self.frame += 1
+        if self.replay_end is not None and self.frame >= self.replay_end: self.replaying = None
+
+
+EVENTS = EventSource()
+
+
+class FrameStats:
+    '''
+    Times every phase of every frame and which scene it was in, for finding stutters
+    Phases are events and draw (the scene), loop (all of loop_manager, so events and draw too), present,
+    prepare (making the next scenes ahead of time), tick and wait (idle)
+    Nothing is timed until start(), measure() just calls through'''
+
+    PHASES = ('events', 'draw', 'loop', 'present', 'prepare', 'tick', 'wait')
+    COLUMNS = ('frame', 'scene', 'total') + PHASES
+    GRAPH_FRAMES = 150
+    GRAPH_MS = 50  # Top of the graph
+    LOWS_EVERY = 15  # Frames between working out the lows for the overlay
+
+    def __init__(self):
+        self.enabled = False
+        self.overlay = False
+        self.samples = deque()
+        self.current = dict.fromkeys(self.PHASES, 0.0)
+        self.last = None
+        self.overlay_lows = (0, 0)
+
+    def start(self, keep=None):
+        '''Starts timing frames, only the last keep frames are kept if given'''
+
+        self.enabled = True
+        self.samples = deque(self.samples, maxlen=keep)
+        self.last = perf_counter()
+
+    def toggle_overlay(self):
+        self.overlay = not self.overlay
+        if self.overlay and not self.enabled: self.start(keep=3600)
+
+    def measure(self, phase, func, *args):
+        '''Calls func, adding the time it took to phase for this frame'''
+
+        if not self.enabled: return func(*args)
+
+        start = perf_counter()
+        result = func(*args)
+        self.current[phase] += perf_counter()-start
+        return result
+
+    def end_frame(self, frame, scene):
+        '''Stores the frame, total is the time since the last frame ended'''
+
+        if not self.enabled: return
+
+        now = perf_counter()
+        self.samples.append((frame, scene, now-self.last) + tuple(self.current[phase] for phase in self.PHASES))
+        self.last = now
+        for phase in self.PHASES: self.current[phase] = 0.0
+
+    @staticmethod
+    def busy(sample):
+        '''Frame time without idle waiting, which isn't a stutter'''
+        return sample[2] - sample[-1]
+
+    def lows(self, samples=None):
+        '''1% and 0.1% lows in fps, the average of the slowest 1% and 0.1% of frames'''
+
+        if samples is None: samples = self.samples
+        times = sorted((self.busy(sample) for sample in samples), reverse=True)
+        if not times: return 0, 0
+
+        def low(fraction):
+            slowest = times[:max(1, int(len(times)*fraction))]
+            mean = sum(slowest) / len(slowest)
+            return 1/mean if mean else 0
+        return low(0.01), low(0.001)
+
+    def summary(self):
+        '''Mean milliseconds per phase overall and for each scene class, plus the lows'''
+
+        def means(samples):
+            return {
+                'frames': len(samples),
+                'busy_ms': sum(self.busy(sample) for sample in samples) / len(samples) * 1000,
+                **{phase: sum(sample[3+i] for sample in samples) / len(samples) * 1000 for i, phase in enumerate(self.PHASES)},
+            }
+
+        if not self.samples: return {}
+
+        scenes = {}
+        for sample in self.samples: scenes.setdefault(sample[1], []).append(sample)
+
+        low_1, low_01 = self.lows()
+        return {'all': means(self.samples), 'low_1_fps': low_1, 'low_0.1_fps': low_01, 'scenes': {scene: means(samples) for scene, samples in scenes.items()}}
+
+    def export(self, path):
+        '''Writes the samples (in milliseconds) to path, CSV or JSON depending on the extension'''
+
+        rows = [sample[:2] + tuple(round(value*1000, 4) for value in sample[2:]) for sample in self.samples]
+
+        if path.lower().endswith('.json'):
+            with open(path, 'w') as file:
+                json.dump({'columns': self.COLUMNS, 'summary': self.summary(), 'samples': rows}, file)
+        else:
+            with open(path, 'w') as file:
+                file.write(','.join(self.COLUMNS) + '\n')
+                for row in rows: file.write(','.join(str(value) for value in row) + '\n')
+
+    def draw(self, surface):
+        '''Draws the overlay in the top right of surface: frame time graph, lows and scene, returns the rect drawn'''
+
+        width, height = self.GRAPH_FRAMES*2, 100
+        panel = pygame.Surface((width, height), pygame.SRCALPHA)
+        panel.fill((0, 0, 0, 170))
+
+        samples = list(self.samples)[-self.GRAPH_FRAMES:]
+        graph_h = 50
+        for i, sample in enumerate(samples):
+            ms = self.busy(sample)*1000
+            bar = min(ms/self.GRAPH_MS, 1) * graph_h
+            colour = '#00FF00' if ms <= 1000/FRAME_RATE else '#FFFF00' if ms <= 2000/FRAME_RATE else '#FF0000'
+            pygame.draw.line(panel, colour, (i*2, height-1), (i*2, height-1-bar))
+        budget = height-1 - 1000/FRAME_RATE/self.GRAPH_MS*graph_h
+        pygame.draw.line(panel, 'grey60', (0, budget), (width, budget))
+
+        if samples:
+            if samples[-1][0] % self.LOWS_EVERY == 0: self.overlay_lows = self.lows(list(self.samples)[-600:])
+            ms = self.busy(samples[-1])*1000
+            # Changes every frame, so it stays out of the text cache
+            panel.blit(FONT.render('{:.1f} ms  {}'.format(ms, samples[-1][1]), True, 'grey95'), (4, 2))
+            panel.blit(FONT.render('1% {:.0f}  0.1% {:.0f} fps'.format(*self.overlay_lows), True, 'grey95'), (4, 24))
+
+        return surface.blit(panel, (surface.get_width()-width, 0))
+
+
+FRAME_STATS = FrameStats()
+
+
+WAKE_EVENT = pygame.USEREVENT
+IDLE_TIMEOUT = 1000
+
+# The window was uncovered or restored, whatever was on it is gone and the whole screen has to be pushed again
+REDRAW_EVENTS = (pygame.WINDOWEXPOSED, pygame.WINDOWRESTORED, pygame.VIDEOEXPOSE)
+# The only events the game uses, the rest are blocked so they never get queued
+ALLOWED_EVENTS = (pygame.QUIT, pygame.KEYDOWN, WAKE_EVENT) + REDRAW_EVENTS
+
+KEYMAP = {
+    pygame.K_RETURN: 'confirm',
+    pygame.K_x: 'skip',
+    pygame.K_w: 'up',
+    pygame.K_s: 'down',
+    pygame.K_a: 'left',
+    pygame.K_d: 'right',
+}
+ACTION_NAMES = frozenset(KEYMAP.values())
+
+Action = namedtuple('Action', 'name key time')  # time is when the key came in (perf_counter)
+
+
+class Input:
+    '''
+    Turns key presses into actions through a rebindable keymap and hands them to the scene (see Scene.handle)
+    Actions handled in a frame are timed until the frame is presented, kept by scene'''
+
+    def __init__(self, keymap=KEYMAP):
+        self.keymap = dict(keymap)  # Key: action name
+        self.handled = []  # Actions handled this frame, not presented yet
+        self.latencies = {}  # Scene name: seconds from the key coming in to the frame being presented (last 1000)
+
+    def allow(self):
+        '''Blocks every event type but ALLOWED_EVENTS, call once the display is up'''
+
+        pygame.event.set_blocked(None)
+        pygame.event.set_allowed(ALLOWED_EVENTS)
+
+    def bind(self, name, *keys):
+        '''Makes the keys (and only them) do the action name'''
+
+        if name not in ACTION_NAMES: raise ValueError('no action called {} ({})'.format(name, ', '.join(sorted(ACTION_NAMES))))
+        self.keymap = {key: action for key, action in self.keymap.items() if action != name and key not in keys}
+        for key in keys: self.keymap[key] = name
+
+    def dispatch(self, scene, event):
+        '''Hands a KEYDOWN event to the scene as an action, unbound keys do nothing'''
+
+        name = self.keymap.get(event.key)
+        if name is None: return
+
+        action = Action(name, event.key, getattr(event, 'arrived', None) or perf_counter())
+        self.handled.append(action)
+        scene.handle(action)
+
+    def presented(self, scene):
+        '''The frame is on screen, scene is the name of the scene that handled its actions'''
+
+        if not self.handled: return
+
+        now = perf_counter()
+        latencies = self.latencies.setdefault(scene, deque(maxlen=1000))
+        for action in self.handled: latencies.append(now-action.time)
+        self.handled = []
+
+    def latency_stats(self):
+        '''Input to present latency in ms of each scene (mean and worst of the last 1000 actions)'''
+
+        return {
+            scene: {'mean_ms': round(sum(times) / len(times) * 1000, 4), 'worst_ms': round(max(times) * 1000, 4), 'actions': len(times)}
+            for scene, times in self.latencies.items()
+        }
+
+
+INPUT = Input()
+
+
 class Scene:
     '''Class for a basic scene able to be run'''
 
+    ACTIONS = {}  # Action name: name of the method that handles it, see Input
+
     def __init__(self, display, sprites, player):
+        self.ui = pygame.sprite.Group()
+        self.start(display, sprites, player)
+
+    def start(self, display, sprites, player):
+        '''Sets the scene up to run, scenes that can be pooled call this again from reset()'''
+
         self.display = display
         self.player = player
-        self.ui = pygame.sprite.Group()
         self.running = True
 
+        self.ui.empty()
         for sprite in sprites:
             self.ui.add(sprite)
 
@@ -290,13 +1525,39 @@ class Scene:
         '''Draws everything in the UI group'''
         self.ui.draw(self.display)
 
+    def arrive(self):
+        '''
+        The player walked into this scene's room (see Manager.enter_room)
+        Anything the room does to the player goes here, a scene made ahead of time must not change them until then'''
+
+    def idle(self):
+        '''
+        True when nothing changes on screen until there is input (no animation, text fully visible)
+        The manager then waits for events instead of redrawing every frame'''
+        return False
+
+    def handle(self, action):
+        '''Runs the scene's handler for an action, ones it has no handler for do nothing'''
+
+        method = self.ACTIONS.get(action.name)
+        if method is not None: getattr(self, method)(action)
+
+    def skip_text(self, action):
+        self.text.skip()
+
+    def wake_in(self, ms):
+        '''Makes an idle manager run a frame after ms, for scenes that need a timer'''
+        pygame.time.set_timer(WAKE_EVENT, ms, 1)
+
     def get_events(self):
         '''Control all user input (events)'''
 
-        for event in pygame.event.get():
+        for event in EVENTS.get():
             if event.type == pygame.QUIT:
                 pygame.quit()
                 exit()
+            if event.type == pygame.KEYDOWN:
+                INPUT.dispatch(self, event)
 
     def run(self):
         '''Run each frame by the PyGame loop'''
@@ -304,13 +1565,15 @@ class Scene:
         if not self.running:
             return True
 
-        self.get_events()
-        self.update_display()
+        FRAME_STATS.measure('events', self.get_events)
+        FRAME_STATS.measure('draw', self.update_display)
 
 
 class TitleScene(Scene):
     '''Scene for the title screen'''
 
+    ACTIONS = {'up': 'choice_up', 'down': 'choice_down', 'confirm': 'confirm', 'skip': 'skip_controls'}
+
     def __init__(self, display, player):
         super().__init__(display, (), player)
 
@@ -326,64 +1589,65 @@ class TitleScene(Scene):
 
     def update_display(self):
         if self.scene == 0:
-            font_size = FONT.size('DUNGEON PROJECT')
-            self.display.blit(FONT.render('DUNGEON PROJECT', True, 'grey95'), (360-font_size[0]/2, 96-font_size[1]/2))
+            font_size = TEXT_CACHE.size('DUNGEON PROJECT')
+            self.display.blit(TEXT_CACHE.render('DUNGEON PROJECT', True, 'grey95'), (360-font_size[0]/2, 96-font_size[1]/2))
 
             for choice, pos in zip(self.choices, ((360, 192), (360, 288), (360, 384))):
-                font_size = FONT.size(choice)
+                font_size = TEXT_CACHE.size(choice)
 
                 if self.choices[self.choice] == choice:
-                    self.display.blit(FONT.render(choice, True, '#FFFF00'), (pos[0]-font_size[0]/2, pos[1]-font_size[1]/2))
+                    self.display.blit(TEXT_CACHE.render(choice, True, '#FFFF00'), (pos[0]-font_size[0]/2, pos[1]-font_size[1]/2))
                 else:
-                    self.display.blit(FONT.render(choice, True, 'grey95'), (pos[0]-font_size[0]/2, pos[1]-font_size[1]/2))
+                    self.display.blit(TEXT_CACHE.render(choice, True, 'grey95'), (pos[0]-font_size[0]/2, pos[1]-font_size[1]/2))
 
         elif self.scene == 1:
-            font_size = FONT.size('CONTROLS')
-            self.display.blit(FONT.render('CONTROLS', True, 'grey95'), (360-font_size[0]/2, 96-font_size[1]/2))
+            font_size = TEXT_CACHE.size('CONTROLS')
+            self.display.blit(TEXT_CACHE.render('CONTROLS', True, 'grey95'), (360-font_size[0]/2, 96-font_size[1]/2))
 
             self.text.update()
             self.text.draw()
 
-            font_size = FONT.size('Go back')
-            self.display.blit(FONT.render('Go back', True, '#FFFF00'), (360-font_size[0]/2, 384-font_size[1]/2))
+            font_size = TEXT_CACHE.size('Go back')
+            self.display.blit(TEXT_CACHE.render('Go back', True, '#FFFF00'), (360-font_size[0]/2, 384-font_size[1]/2))
 
-    def get_events(self):
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                pygame.quit()
-                exit()
-            if event.type == pygame.KEYDOWN:
-                if self.scene == 0:
-                    # Controls the changing choices
-                    if event.key == pygame.K_w:
-                        pygame.mixer.Sound.play(SOUND_SELECT)
-                        if self.choice != 0:
-                            self.choice -= 1
-                    if event.key == pygame.K_s:
-                        pygame.mixer.Sound.play(SOUND_SELECT)
-                        if self.choice != len(self.choices)-1:
-                            self.choice += 1
-                    # Next scene
-                    if event.key == pygame.K_RETURN:
-                        pygame.mixer.Sound.play(SOUND_CONFIRM)
-                        if self.choices[self.choice] != 'Controls':
-                            self.running = False
-                        else:
-                            self.scene = 1
-                elif self.scene == 1:
-                    if event.key == pygame.K_RETURN:
-                        pygame.mixer.Sound.play(SOUND_CONFIRM)
-                        self.text.skip()
-                        self.scene = 0
-                    if event.key == pygame.K_x:
-                        self.text.skip()
+    def idle(self):
+        return self.scene == 0 or self.text.finished
+
+    # Controls the changing choices
+    def choice_up(self, action):
+        if self.scene != 0: return
+        AUDIO.play(SOUND_SELECT)
+        if self.choice != 0:
+            self.choice -= 1
+
+    def choice_down(self, action):
+        if self.scene != 0: return
+        AUDIO.play(SOUND_SELECT)
+        if self.choice != len(self.choices)-1:
+            self.choice += 1
+
+    def confirm(self, action):
+        AUDIO.play(SOUND_CONFIRM)
+        if self.scene == 0:
+            # Next scene
+            if self.choices[self.choice] != 'Controls':
+                self.running = False
+            else:
+                self.scene = 1
+        elif self.scene == 1:
+            self.text.skip()
+            self.scene = 0
+
+    def skip_controls(self, action):
+        if self.scene == 1:
+            self.text.skip()
 
     def run(self):
         if not self.running:
             return self.choices[self.choice]
 
-        self.get_events()
-        self.update_display()
+        FRAME_STATS.measure('events', self.get_events)
+        FRAME_STATS.measure('draw', self.update_display)
 
 
 class NameScene(Scene):
@@ -392,6 +1656,8 @@ class NameScene(Scene):
     This was also unreasonably hard >:(
     no but fr this was the hardest part of the whole game'''
 
+    ACTIONS = {'up': 'move_up', 'down': 'move_down', 'left': 'move_left', 'right': 'move_right', 'confirm': 'choose'}
+
     def __init__(self, display, player):
         super().__init__(display, (), player)
 
@@ -413,8 +1679,8 @@ class NameScene(Scene):
         if self.scene == 0:
             self.ee2 = False
 
-            font_size = FONT.size(''.join(self.useless_name))
-            self.display.blit(FONT.render(''.join(self.useless_name), True, 'grey95'), (360-font_size[0]/2, 96-font_size[1]/2))
+            font_size = TEXT_CACHE.size(''.join(self.useless_name))
+            self.display.blit(TEXT_CACHE.render(''.join(self.useless_name), True, 'grey95'), (360-font_size[0]/2, 96-font_size[1]/2))
 
             for y, row in enumerate(self.choices):
                 for x, choice_ in enumerate(row):
@@ -422,127 +1688,131 @@ class NameScene(Scene):
                         x = 11.25  # this gonna reduce my lifespan by 10 years
 
                     if self.choices[self.y_choice][self.x_choice] == choice_:
-                        self.display.blit(FONT.render(choice_, True, '#FFFF00'), (90+x*48-font_size[0]/2, 192+y*48-font_size[1]/2))
+                        self.display.blit(TEXT_CACHE.render(choice_, True, '#FFFF00'), (90+x*48-font_size[0]/2, 192+y*48-font_size[1]/2))
                     else:
-                        self.display.blit(FONT.render(choice_, True, 'grey95'), (90+x*48-font_size[0]/2, 192+y*48-font_size[1]/2))
+                        self.display.blit(TEXT_CACHE.render(choice_, True, 'grey95'), (90+x*48-font_size[0]/2, 192+y*48-font_size[1]/2))
 
         elif self.scene == 1:
             if not ''.join(self.useless_name).replace('_', '') and not self.ee2:
                 message = ('No Name', 'Unnamed Idiot', 'Are you dumb?', 'Name?', 'Guess your parents didn\'t love you enough to give you a name', 'Can\'t read?', 'ooo who\'s this?', 'hi,     !', 'D U M B', 'y r u dumb', 'You\'re a mistake')
-                self.name = choice(message)
+                self.name = RNG.flavour.choice(message)
                 self.ee2 = True
             elif ''.join(self.useless_name).replace('_', ''):
                 self.ee2 = False
                 self.name = ''.join(self.useless_name).replace('_', '')
-            font_size = FONT.size(self.name)
-            self.display.blit(FONT.render(self.name, True, 'grey95'), (360-font_size[0]/2, 96-font_size[1]/2))
+            font_size = TEXT_CACHE.size(self.name)
+            self.display.blit(TEXT_CACHE.render(self.name, True, 'grey95'), (360-font_size[0]/2, 96-font_size[1]/2))
 
 
             if not ''.join(self.useless_name).replace('_', ''):
-                font_size = FONT.size('Go back')
-                self.display.blit(FONT.render('Go back', True, '#FFFF00'), (240-font_size[0]/2, 384-font_size[1]/2))
+                font_size = TEXT_CACHE.size('Go back')
+                self.display.blit(TEXT_CACHE.render('Go back', True, '#FFFF00'), (240-font_size[0]/2, 384-font_size[1]/2))
                 self.confirm = 0
                 return
 
             if self.confirm == 0:
-                font_size = FONT.size('Go back')
-                self.display.blit(FONT.render('Go back', True, '#FFFF00'), (240-font_size[0]/2, 384-font_size[1]/2))
-                font_size = FONT.size('Continue')
-                self.display.blit(FONT.render('Continue', True, 'grey95'), (480-font_size[0]/2, 384-font_size[1]/2))
+                font_size = TEXT_CACHE.size('Go back')
+                self.display.blit(TEXT_CACHE.render('Go back', True, '#FFFF00'), (240-font_size[0]/2, 384-font_size[1]/2))
+                font_size = TEXT_CACHE.size('Continue')
+                self.display.blit(TEXT_CACHE.render('Continue', True, 'grey95'), (480-font_size[0]/2, 384-font_size[1]/2))
             elif self.confirm == 1:
-                font_size = FONT.size('Go back')
-                self.display.blit(FONT.render('Go back', True, 'grey95'), (240-font_size[0]/2, 384-font_size[1]/2))
-                font_size = FONT.size('Continue')
-                self.display.blit(FONT.render('Continue', True, '#FFFF00'), (480-font_size[0]/2, 384-font_size[1]/2))
+                font_size = TEXT_CACHE.size('Go back')
+                self.display.blit(TEXT_CACHE.render('Go back', True, 'grey95'), (240-font_size[0]/2, 384-font_size[1]/2))
+                font_size = TEXT_CACHE.size('Continue')
+                self.display.blit(TEXT_CACHE.render('Continue', True, '#FFFF00'), (480-font_size[0]/2, 384-font_size[1]/2))
+
+    def idle(self):
+        return True
+
+    # Controls the changing characters (or yes/no on the confirming screen)
+    def move_up(self, action):
+        if self.scene != 0: return
+        AUDIO.play(SOUND_SELECT)
+        if self.y_choice != 0:
+            self.y_choice -= 1
+
+    def move_down(self, action):  # just kill me already
+        if self.scene != 0: return
+        AUDIO.play(SOUND_SELECT)
+        if self.y_choice != len(self.choices)-1:
+            if self.x_choice > len(self.choices[self.y_choice+1])-1:
+                self.x_choice = len(self.choices[self.y_choice+1])-1
+            self.y_choice += 1
+
+    def move_left(self, action):
+        AUDIO.play(SOUND_SELECT)
+        if self.scene == 0:
+            if self.x_choice != 0:
+                self.x_choice -= 1
+            else:
+                self.x_choice = len(self.choices[self.y_choice])-1
+        elif self.scene == 1:
+            if self.confirm != 0:
+                self.confirm -= 1
+            else:
+                self.confirm = 1
 
-    def get_events(self):
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                pygame.quit()
-                exit()
-            if event.type == pygame.KEYDOWN:
-                if self.scene == 0:
-                    # Controls the changing characters
-                    if event.key == pygame.K_w:
-                        pygame.mixer.Sound.play(SOUND_SELECT)
-                        if self.y_choice != 0:
-                            self.y_choice -= 1
-                    if event.key == pygame.K_s:  # just kill me already
-                        pygame.mixer.Sound.play(SOUND_SELECT)
-                        if self.y_choice != len(self.choices)-1:
-                            if self.x_choice > len(self.choices[self.y_choice+1])-1:
-                                self.x_choice = len(self.choices[self.y_choice+1])-1
-                            self.y_choice += 1
-                    if event.key == pygame.K_a:
-                        pygame.mixer.Sound.play(SOUND_SELECT)
-                        if self.x_choice != 0:
-                            self.x_choice -= 1
-                        else:
-                            self.x_choice = len(self.choices[self.y_choice])-1
-                    if event.key == pygame.K_d:
-                        pygame.mixer.Sound.play(SOUND_SELECT)
-                        if self.x_choice != len(self.choices[self.y_choice])-1:
-                            self.x_choice += 1
-                        else:
-                            self.x_choice = 0
-                    if event.key == pygame.K_RETURN:
-                        pygame.mixer.Sound.play(SOUND_CONFIRM)
-                        if self.choices[self.y_choice][self.x_choice] == 'Backspace':
-                            self.useless_name[self.name_index-1] = '_'
-                            if self.name_index != 0:
-                                self.name_index -= 1
-                        elif self.choices[self.y_choice][self.x_choice] == 'Continue':
-                            self.scene = 1
-                        else:
-                            if self.name_index != 8:
-                                self.useless_name[self.name_index] = self.choices[self.y_choice][self.x_choice]
-                                self.name_index += 1
-                elif self.scene == 1:
-                    if event.key == pygame.K_a:
-                        pygame.mixer.Sound.play(SOUND_SELECT)
-                        if self.confirm != 0:
-                            self.confirm -= 1
-                        else:
-                            self.confirm = 1
-                    if event.key == pygame.K_d:
-                        pygame.mixer.Sound.play(SOUND_SELECT)
-                        if self.confirm != 1:
-                            self.confirm += 1
-                        else:
-                            self.confirm = 0
-                    if event.key == pygame.K_RETURN:
-                        pygame.mixer.Sound.play(SOUND_CONFIRM)
-                        if self.confirm == 0:
-                            self.scene = 0
-                        elif self.confirm == 1:
-                            self.running = False
+    def move_right(self, action):
+        AUDIO.play(SOUND_SELECT)
+        if self.scene == 0:
+            if self.x_choice != len(self.choices[self.y_choice])-1:
+                self.x_choice += 1
+            else:
+                self.x_choice = 0
+        elif self.scene == 1:
+            if self.confirm != 1:
+                self.confirm += 1
+            else:
+                self.confirm = 0
+
+    def choose(self, action):
+        AUDIO.play(SOUND_CONFIRM)
+        if self.scene == 0:
+            if self.choices[self.y_choice][self.x_choice] == 'Backspace':
+                self.useless_name[self.name_index-1] = '_'
+                if self.name_index != 0:
+                    self.name_index -= 1
+            elif self.choices[self.y_choice][self.x_choice] == 'Continue':
+                self.scene = 1
+            else:
+                if self.name_index != 8:
+                    self.useless_name[self.name_index] = self.choices[self.y_choice][self.x_choice]
+                    self.name_index += 1
+        elif self.scene == 1:
+            if self.confirm == 0:
+                self.scene = 0
+            elif self.confirm == 1:
+                self.running = False
 
 
 class Skill:
     '''Class for player skills'''
 
+    SIZE = (180, 120)
+
     def __init__(self, display, player, pos, skill, image):
         self.display = display
         self.player = player
         self.pos = pos
         self.skill = skill
         self.amount = getattr(self.player, self.skill)
-        self.image = pygame.image.load('{}.png'.format(image)).convert_alpha()
-        self.image = pygame.transform.scale(self.image, (180, 120))
+        self.image = ASSETS.image('{}.png'.format(image), self.SIZE)
         self.rect = self.image.get_rect()
         self.rect.center = pos
 
     def update_display(self):
         self.amount = getattr(self.player, self.skill)
         self.display.blit(self.image, self.rect)
-        font_size = FONT.size(str(self.amount))
-        self.display.blit(FONT.render(str(self.amount), True, 'grey95'), (self.pos[0]-font_size[0]/2, self.pos[1]-font_size[1]/2))
+        font_size = TEXT_CACHE.size(str(self.amount))
+        self.display.blit(TEXT_CACHE.render(str(self.amount), True, 'grey95'), (self.pos[0]-font_size[0]/2, self.pos[1]-font_size[1]/2))
 
 
 class SkillScene(Scene):
     '''Scene for changing the player skills'''
 
-    def __init__(self, display, player):
+    ACTIONS = {'left': 'skill_left', 'right': 'skill_right', 'up': 'skill_up', 'down': 'skill_down', 'skip': 'skip_text', 'confirm': 'finish'}
+
+    def __init__(self, display, player, text=None):
         super().__init__(display, (), player)
 
         self.player = player
@@ -552,14 +1822,14 @@ class SkillScene(Scene):
             Skill(self.display, self.player, (SCREEN_W/4*2, SCREEN_H/3), 'hp', 'assets/healthskill'),
             Skill(self.display, self.player, (SCREEN_W/4*3+45, SCREEN_H/3), 'defence', 'assets/defenceskill'),
         )
-        self.border = pygame.image.load('assets/skillborder.png').convert_alpha()
-        self.border = pygame.transform.scale(self.border, (192, 132))
+        self.border = ASSETS.image('assets/skillborder.png', (192, 132))
         self.border_rect = self.border.get_rect()
         self.border_rect.center = self.choices[0].rect.center
 
-        text = 'Select your skills, make sure to use them all!\n' \
-            'Navigate through the skills using the WASD keys:\n- W/S to increase/decrease\n- A/D to move left/right\n\n' \
-            'Press ENTER when ready'
+        if text is None:
+            text = 'Select your skills, make sure to use them all!\n' \
+                'Navigate through the skills using the WASD keys:\n- W/S to increase/decrease\n- A/D to move left/right\n\n' \
+                'Press ENTER when ready'
         self.text = Text(self.display, text, speed=1, pos=(60, 270))
 
         self.ee1 = False
@@ -579,57 +1849,73 @@ class SkillScene(Scene):
         # Text business
         if not self.ee1:
             self.sp_text = 'You have {} skill points remaining'.format(self.player.skill_points-self.player.sum)
-        font_size = FONT.size(self.sp_text)
-        self.display.blit(FONT.render(self.sp_text, True, 'grey95'), (360-font_size[0]/2, 48-font_size[1]/2))
+        font_size = TEXT_CACHE.size(self.sp_text)
+        self.display.blit(TEXT_CACHE.render(self.sp_text, True, 'grey95'), (360-font_size[0]/2, 48-font_size[1]/2))
 
         self.text.update()
         self.text.draw()
 
-    def get_events(self):
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                pygame.quit()
-                exit()
-            if event.type == pygame.KEYDOWN:
-                self.ee1 = False
-
-                # Controls the changing of skill
-                if event.key == pygame.K_a:
-                    pygame.mixer.Sound.play(SOUND_SELECT)
-                    if self.choice != 0:
-                        self.choice -= 1
-                if event.key == pygame.K_d:
-                    pygame.mixer.Sound.play(SOUND_SELECT)
-                    if self.choice != len(self.choices)-1:
-                        self.choice += 1
-                # Controls the changing of skill amount
-                if event.key == pygame.K_w:
-                    pygame.mixer.Sound.play(SOUND_SELECT)
-                    setattr(self.player, self.choices[self.choice].skill, getattr(self.player, self.choices[self.choice].skill)+1)
-                    if self.player.sum > self.player.skill_points:
-                        setattr(self.player, self.choices[self.choice].skill, getattr(self.player, self.choices[self.choice].skill)-1)
-                        self.sp_text = choice(('You think you have any skill points left to spend?', 'With what skill points?', 'nah', 'no.', 'Keep trying.', 'uh oh, 0 left', 'L', ':clown:', 'ZERO LOL IMAGINE', 'no skill points'))
-                        self.ee1 = True
-                if event.key == pygame.K_s:
-                    pygame.mixer.Sound.play(SOUND_SELECT)
-                    if getattr(self.player, self.choices[self.choice].skill) > 1:
-                        setattr(self.player, self.choices[self.choice].skill, getattr(self.player, self.choices[self.choice].skill)-1)
-                    else:
-                        self.sp_text = choice(('Really?', '...', '?', 'How?', 'Keep trying.', 'how does that work, eh?'))
-                        self.ee1 = True
-                if event.key == pygame.K_x:
-                    self.text.skip()
-                # Next scene
-                if event.key == pygame.K_RETURN:
-                    pygame.mixer.Sound.play(SOUND_CONFIRM)
-                    self.running = False
+    def idle(self):
+        return self.border_rect.centerx == self.choices[self.choice].rect.centerx and self.text.finished
+
+    def handle(self, action):
+        self.ee1 = False
+        super().handle(action)
+
+    # Controls the changing of skill
+    def skill_left(self, action):
+        AUDIO.play(SOUND_SELECT)
+        if self.choice != 0:
+            self.choice -= 1
+
+    def skill_right(self, action):
+        AUDIO.play(SOUND_SELECT)
+        if self.choice != len(self.choices)-1:
+            self.choice += 1
+
+    def set_skill(self, amount):
+        '''Sets the chosen skill, hp spent here is the new max_hp'''
+
+        skill = self.choices[self.choice].skill
+        setattr(self.player, skill, amount)
+        if skill == 'hp': self.player.max_hp = amount
+
+    # Controls the changing of skill amount
+    def skill_up(self, action):
+        AUDIO.play(SOUND_SELECT)
+        self.set_skill(getattr(self.player, self.choices[self.choice].skill)+1)
+        if self.player.sum > self.player.skill_points:
+            self.set_skill(getattr(self.player, self.choices[self.choice].skill)-1)
+            self.sp_text = RNG.flavour.choice(('You think you have any skill points left to spend?', 'With what skill points?', 'nah', 'no.', 'Keep trying.', 'uh oh, 0 left', 'L', ':clown:', 'ZERO LOL IMAGINE', 'no skill points'))
+            self.ee1 = True
+
+    def skill_down(self, action):
+        AUDIO.play(SOUND_SELECT)
+        if getattr(self.player, self.choices[self.choice].skill) > 1:
+            self.set_skill(getattr(self.player, self.choices[self.choice].skill)-1)
+        else:
+            self.sp_text = RNG.flavour.choice(('Really?', '...', '?', 'How?', 'Keep trying.', 'how does that work, eh?'))
+            self.ee1 = True
+
+    # Next scene
+    def finish(self, action):
+        AUDIO.play(SOUND_CONFIRM)
+        self.running = False
 
 
 class SelectionScene(Scene):
     '''Scene only for selection of multiple choices'''
 
+    ACTIONS = {'left': 'select_left', 'right': 'select_right', 'skip': 'skip_text', 'confirm': 'enter'}
+
     def __init__(self, display, choices, player):
         super().__init__(display, choices, player)
+        self.reset(display, choices, player)
+
+    def reset(self, display, choices, player):
+        '''Sets the scene up for new choices, same arguments as __init__'''
+
+        self.start(display, choices, player)
 
         self.c_choice = 0
         self.o_choice = 0
@@ -655,60 +1941,62 @@ class SelectionScene(Scene):
         self.text.update()
         self.text.draw()
 
-    def get_events(self):
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                pygame.quit()
-                exit()
-            # Controls the changing of selection
-            if event.type == pygame.KEYDOWN:
-                if event.key == pygame.K_a:
-                    pygame.mixer.Sound.play(SOUND_SELECT)
-                    if self.c_choice != 0:
-                        self.o_choice = self.c_choice
-                        self.c_choice -= 1
-                        self.not_loaded = True
-                if event.key == pygame.K_d:
-                    pygame.mixer.Sound.play(SOUND_SELECT)
-                    if self.c_choice != len(self.choices)-1:
-                        self.o_choice = self.c_choice
-                        self.c_choice += 1
-                        self.not_loaded = True
-                if event.key == pygame.K_x:
-                    self.text.skip()
-                # Entering a room
-                if event.key == pygame.K_RETURN:
-                    pygame.mixer.Sound.play(SOUND_CONFIRM)
-                    self.running = False
+    def idle(self):
+        return not self.not_loaded and self.text.finished
+
+    # Controls the changing of selection
+    def select_left(self, action):
+        AUDIO.play(SOUND_SELECT)
+        if self.c_choice != 0:
+            self.o_choice = self.c_choice
+            self.c_choice -= 1
+            self.not_loaded = True
+
+    def select_right(self, action):
+        AUDIO.play(SOUND_SELECT)
+        if self.c_choice != len(self.choices)-1:
+            self.o_choice = self.c_choice
+            self.c_choice += 1
+            self.not_loaded = True
+
+    # Entering a room
+    def enter(self, action):
+        AUDIO.play(SOUND_CONFIRM)
+        self.running = False
 
     def run(self):
         if not self.running:
             return self.choices[self.c_choice].name
 
-        self.get_events()
-        self.update_display()
+        FRAME_STATS.measure('events', self.get_events)
+        FRAME_STATS.measure('draw', self.update_display)
 
 
 class HealScene(Scene):
     '''Scene for the heal room'''
 
+    ACTIONS = {'confirm': 'leave', 'skip': 'skip_text'}
+
     def __init__(self, display, player):
         super().__init__(display, (), player)
 
-        self.heal_sprite = pygame.image.load('assets/healsprite.png').convert_alpha()
+        self.heal_sprite = ASSETS.image('assets/healsprite.png')
         self.heal_rect = self.heal_sprite.get_rect()
         self.heal_rect.center = 360, 120
+        self.text = Text(self.display, '', speed=1, pos=(60, 192))
+
+    def arrive(self):
+        '''The pond heals the player'''
 
-        if player.hp != player.max_hp:
-            self.heal_amount = randint(int(self.player.max_hp*0.5), int(self.player.max_hp*0.75))
+        if self.player.hp != self.player.max_hp:
+            self.heal_amount = heal_amount(self.player)
             self.player.change_hp(self.heal_amount)
-            text = 'The peaceful pond replenishes your soul\n\nYou regain {} HP!\n({}/{})'.format(self.heal_amount, self.player.hp, self.player.maxhp)
+            text = 'The peaceful pond replenishes your soul\n\nYou regain {} HP!\n({}/{})'.format(self.heal_amount, self.player.hp, self.player.max_hp)
         else:
             text = 'The sight of the peaceful pond would replenish your soul...\n' \
                 'However, this sight does not satisfy your greedy soul and thus you gained nothing\n\n' \
                 'You gained 0 HP!\n\n>>'
-
-        self.text = Text(self.display, text, speed=1, pos=(60, 192))
+        self.text.change_text(text)
 
     def update_display(self):
         self.display.blit(self.heal_sprite, self.heal_rect)
@@ -716,393 +2004,336 @@ class HealScene(Scene):
         self.text.update()
         self.text.draw()
 
-    def get_events(self):
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                pygame.quit()
-                exit()
-            if event.type == pygame.KEYDOWN:
-                if event.key == pygame.K_RETURN:
-                    if self.text.frame == len(self.text.text):
-                        pygame.mixer.Sound.play(SOUND_CONFIRM)
-                        self.running = False
-                if event.key == pygame.K_x:
-                    self.text.skip()
+    def idle(self):
+        return self.text.finished
 
+    def leave(self, action):
+        if self.text.frame == len(self.text.text):
+            AUDIO.play(SOUND_CONFIRM)
+            self.running = False
 
 
-class FightIcon(pygame.sprite.Sprite):
+class FightIcon(StateSprite):
     '''Icon class for battle'''
 
-    def __init__(self, b_spritesheet, icon, pos):
-        super().__init__()
-        self.image = b_spritesheet.get_image(BATTLE_DICTS[icon]).convert_alpha()
-        self.image = pygame.transform.scale(self.image, (64, 64))
-        self.rect = self.image.get_rect()
-        self.rect.center = pos
-
-    def select(self):
-        '''Selects the icon for selection'''
+    SIZES = {'normal': (64, 64), 'selected': (96, 96)}
 
-        if self.image.get_height() == 64:
-            pos = self.rect.center
-            self.image = pygame.transform.scale(self.image, (96, 96))
-            self.rect = self.image.get_rect()
-            self.rect.center = pos
+    def __init__(self, b_spritesheet, icon, pos):
+        super().__init__(self.scaled_states(b_spritesheet.get_image(BATTLE_DICTS[icon]), self.SIZES), pos)
 
-    def deselect(self):
-        '''Deselects the icon for selection'''
+    def place(self, pos):
+        '''Back to normal at pos, for a reused battle'''
 
-        if self.image.get_height() != 64:
-            pos = self.rect.center
-            self.image = pygame.transform.scale(self.image, (64, 64))
-            self.rect = self.image.get_rect()
-            self.rect.center = pos
+        self.deselect()
+        self.rect.center = pos
 
 
 class EnemyScene(Scene):
     'Scene for enemy room'
 
+    ACTIONS = {'skip': 'skip_text'}  # The rest only go to the script
+
+    ICON_STARTS = {'fight': (-216, 384), 'sharpen': (-72, 384), 'defend': (792, 384), 'heal': (936, 384)}
+
     def __init__(self, display, player, e_spritesheet, b_spritesheet, type_=None):
         super().__init__(display, (), player)
 
+        # The surfaces are made once, reset() draws the next battle on them
         self.screen = pygame.Surface((SCREEN_W, SCREEN_H))
+        if isinstance(display, DirtySurface): self.screen = DirtySurface(self.screen)
 
         # bruh ctrl-c and ctrl-v
-        self.fight_icon = FightIcon(b_spritesheet, 'fight', (-216, 384))
-        self.sharpen_icon = FightIcon(b_spritesheet, 'sharpen', (-72, 384))
-        self.defend_icon = FightIcon(b_spritesheet, 'defend', (792, 384))
-        self.heal_icon = FightIcon(b_spritesheet, 'heal', (936, 384))
-
-        self.extra_atk = 1
-        self.extra_def = 1
-        self.heals = 5
-
-        self.enemy = choice(ENEMY_NAME)
-        self.enemy_image = e_spritesheet.get_image(ENEMY_DICTS[self.enemy]).convert_alpha()
-        self.enemy_image = pygame.transform.scale(self.enemy_image, (96, 96))
+        self.fight_icon = FightIcon(b_spritesheet, 'fight', self.ICON_STARTS['fight'])
+        self.sharpen_icon = FightIcon(b_spritesheet, 'sharpen', self.ICON_STARTS['sharpen'])
+        self.defend_icon = FightIcon(b_spritesheet, 'defend', self.ICON_STARTS['defend'])
+        self.heal_icon = FightIcon(b_spritesheet, 'heal', self.ICON_STARTS['heal'])
+        self.choices = [self.fight_icon, self.sharpen_icon, self.defend_icon, self.heal_icon]
+
+        self.enemy_image = None
+        self.scripts = Scheduler()
+        self.reset(display, player, e_spritesheet, b_spritesheet, type_)
+
+    def reset(self, display, player, e_spritesheet, b_spritesheet, type_=None):
+        '''Sets up a new battle, same arguments as __init__ (the random rolls are the same too)'''
+
+        self.start(display, (), player)
+        if isinstance(self.screen, DirtySurface): self.screen.mark_dirty()
+        for icon, name in zip(self.choices, self.ICON_STARTS):
+            icon.place(self.ICON_STARTS[name])
+
+        self.enemy = RNG.enemies.choice(ENEMY_NAME)
+        self.enemy_image = e_spritesheet.get_scaled(ENEMY_DICTS[self.enemy], (96, 96), self.enemy_image)
+        self.enemy_image.set_alpha(255)
         self.enemy_rect = self.enemy_image.get_rect()
         self.enemy_rect.center = 360, 120
 
         self.type_ = type_
+        self.battle = Battle(self.player, type_)
 
-        self.enemy_hp = randint(2*(self.player.level+1), 5*(self.player.level+1))
-        self.enemy_def = randint(2*(self.player.level+1), 5*(self.player.level+1))
-        if self.type_ == 'boss':
-            self.enemy_hp *= randint(2, 5)
-            self.enemy_def *= randint(2, 5)
-        if self.type_ == 'final':
-            # just get better smh
-            self.enemy_hp *= randint(4, 7)
-            self.enemy_def *= randint(4, 7)
-        
         self.c_choice = 0
         self.o_choice = 0
-        self.choices = [self.fight_icon, self.sharpen_icon, self.defend_icon, self.heal_icon]
-
-        self.scene = 0
 
         self.anim = Animation(25, 360)
-        self.frame = 0
         self.shake = 50
-
-        self.screen_pos = [0, 0]
+        self.shake_x = 0
 
         if type_ == 'boss': self.text = Text(self.screen, 'BOSS BATTLE\nThe {} blocks your way!\n\n>>'.format(self.enemy), speed=1, pos=(60, 320))
         elif type_ == 'final': self.text = Text(self.screen, 'THE FINAL BOSS BATTLE\nThe {} blocks your way!\n\n>>'.format(self.enemy), speed=1, pos=(60, 320))
         else: self.text = Text(self.screen, 'The {} blocks your way!\n\n>>'.format(self.enemy), speed=1, pos=(60, 320))
 
-    def update_display(self):
-        self.screen.fill(BG_COLOUR)
-        if self.scene == 0:
-            self.screen.blit(self.enemy_image, self.enemy_rect)
+        self.scripts.cancel()
+        self.scripts.start(self.script())
+
+    def script(self):
+        '''The battle from start to end, self.view is what gets drawn until the next step'''
+
+        self.view = self.draw_intro
+        yield WaitAction('confirm')
+        AUDIO.play(SOUND_CONFIRM)
+
+        while True:
+            self.view = self.draw_icons
+            yield self.slide_icons(True)
+
+            self.view = self.draw_choosing
+            action = None
+            while action != 'confirm':
+                action = yield WaitAction('left', 'right', 'confirm')
+                if action == 'left' and self.c_choice != 0:
+                    AUDIO.play(SOUND_SELECT)
+                    self.o_choice = self.c_choice
+                    self.c_choice -= 1
+                if action == 'right' and self.c_choice != len(self.choices)-1:
+                    AUDIO.play(SOUND_SELECT)
+                    self.o_choice = self.c_choice
+                    self.c_choice += 1
+            AUDIO.play(SOUND_CONFIRM)
+            self.choose()
+
+            self.view = self.draw_icons
+            yield self.slide_icons(False)
+
+            self.view = self.draw_result
+            yield from wait_confirm(self.text)
+            self.enemy_image.set_alpha(255)
+            if self.battle.won:
+                self.enemy_image.set_alpha(0)
+                self.text.change_text('You win!\n\n>>')
+                self.view = self.draw_text
+                yield from wait_confirm(self.text)
+
+                self.running = False
+                if self.type_ == 'boss': self.status = 'POST ENEMY ROOM - WON - BOSS'
+                else: self.status = 'POST ENEMY ROOM - WON'
+                return
 
-            self.text.update()
-            self.text.draw()
-        elif self.scene == 0.5:
-            self.fight_icon.rect.centerx += self.anim.get_move(self.frame)
-            self.sharpen_icon.rect.centerx += self.anim.get_move(self.frame)
-            self.defend_icon.rect.centerx -= self.anim.get_move(self.frame)
-            self.heal_icon.rect.centerx -= self.anim.get_move(self.frame)
-
-            self.screen.blit(self.enemy_image, self.enemy_rect)
-            self.screen.blit(self.fight_icon.image, self.fight_icon.rect)
-            self.screen.blit(self.sharpen_icon.image, self.sharpen_icon.rect)
-            self.screen.blit(self.defend_icon.image, self.defend_icon.rect)
-            self.screen.blit(self.heal_icon.image, self.heal_icon.rect)
-
-            self.frame += 1
-            if self.frame > 25:
-                self.frame = 0
-                self.scene = 1
-        elif self.scene == 1:
-            o_sprite = self.choices[self.o_choice]
-            c_sprite = self.choices[self.c_choice]
-
-            o_sprite.deselect()
-            c_sprite.select()
-
-            self.screen.blit(self.enemy_image, self.enemy_rect)
-            self.screen.blit(self.fight_icon.image, self.fight_icon.rect)
-            self.screen.blit(self.sharpen_icon.image, self.sharpen_icon.rect)
-            self.screen.blit(self.defend_icon.image, self.defend_icon.rect)
-            self.screen.blit(self.heal_icon.image, self.heal_icon.rect)
-        elif self.scene == 2:
-            self.fight_icon.rect.centerx -= self.anim.get_move(self.frame, False)
-            self.sharpen_icon.rect.centerx -= self.anim.get_move(self.frame, False)
-            self.defend_icon.rect.centerx += self.anim.get_move(self.frame, False)
-            self.heal_icon.rect.centerx += self.anim.get_move(self.frame, False)
-
-            self.screen.blit(self.enemy_image, self.enemy_rect)
-            self.screen.blit(self.fight_icon.image, self.fight_icon.rect)
-            self.screen.blit(self.sharpen_icon.image, self.sharpen_icon.rect)
-            self.screen.blit(self.defend_icon.image, self.defend_icon.rect)
-            self.screen.blit(self.heal_icon.image, self.heal_icon.rect)
-
-            self.frame += 1
-            if self.frame > 25:
-                self.frame = 0
-                self.scene += 1
-        elif self.scene == 3:
-            if self.c_choice == 0:
-                self.enemy_image.set_alpha(50)
-            
-            self.text.update()
-            self.text.draw()
+            # The enemy's turn, a pause then the screen shakes
+            self.view = self.draw_enemy
+            yield Wait(26)
+            atk = self.battle.enemy_attack()
+            self.text.change_text('{} attacked for {} damage!\n\n>>'.format(self.enemy, atk))
+            yield Tween(self, 'shake_x', self.shake_moves(20))
+
+            self.view = self.draw_enemy_turn
+            yield from wait_confirm(self.text)
+            if self.battle.lost:
+                self.enemy_image.set_alpha(0)
+                self.text.change_text('You died...\nBut at least you get more skills points!\n\nLevel: {}\n\n>>'.format(self.player.level))
+                self.view = self.draw_text
+                yield from wait_confirm(self.text)
+
+                self.running = False
+                self.status = 'POST ENEMY ROOM - DEAD'
+                return
 
-            c_sprite = self.choices[self.c_choice]
-            c_sprite.deselect()
-
-            self.screen.blit(self.enemy_image, self.enemy_rect)
-
-            if self.enemy_hp < 0: text = 'Enemy HP: 0'
-            else: text = 'Enemy HP: {}'.format(self.enemy_hp)
-            font_size = FONT.size(text)
-            self.screen.blit(FONT.render(text, True, 'grey95'), (360-font_size[0]/2, 48-font_size[1]/2))
-
-        elif self.scene == 4:
-            self.screen.blit(self.enemy_image, self.enemy_rect)
-
-            self.frame += 1
-            if self.frame > 25:
-                self.frame = 0
-                self.state = 0
-                self.scene += 1
-                self.enemy_atk = randint(2*(self.player.level+1), 5*(self.player.level+1))
-                if self.type_ == 'boss': self.enemy_atk *= randint(2, 5)
-                if self.type_ == 'final': self.enemy_atk *= randint(4, 7)  # get  better
-                if getattr(self.player, 'armour') is not None: player_def = self.player.defence + self.player.armour['def']
-                else: player_def = self.player.defence
-                player_def = round(player_def*self.extra_def)
-                atk = round(self.enemy_atk/(player_def/self.enemy_atk+1))+1
-                self.text.change_text('{} attacked for {} damage!\n\n>>'.format(self.enemy, atk))
-                self.player.change_hp(-atk)
-        elif self.scene == 5:
-            if self.state == 0:
-                self.screen_pos[0] -= self.shake
-            elif self.state == 2:
-                self.screen_pos[0] += self.shake
-            elif self.state == 4:
-                self.screen_pos[0] += self.shake
-            elif self.state == 6:
-                self.screen_pos[0] -= self.shake
+    def slide_icons(self, inward):
+        '''Tweens the icons on screen (inward) or back off it, the two on each side move together'''
+
+        moves = [self.anim.get_move(frame, inward) for frame in range(self.anim.frames+1)]
+        if not inward: moves = [-move for move in moves]
+        return tuple(Tween(icon.rect, 'centerx', [move*side for move in moves]) for icon, side in zip(self.choices, (1, 1, -1, -1)))
+
+    def shake_moves(self, frames):
+        '''Moves of the screen shake, it gets weaker every swing (and stays weaker for the next one)'''
+
+        state = 0
+        for frame in range(frames):
+            move = 0
+            if state == 0:
+                move = -self.shake
+            elif state == 2:
+                move = self.shake
+            elif state == 4:
+                move = self.shake
+            elif state == 6:
+                move = -self.shake
                 self.shake *= 0.95
-                self.state = -2
-            
-            self.screen.blit(self.enemy_image, self.enemy_rect)
-
-            self.state += 1
-            self.frame += 1
-            if self.frame == 20:
-                self.frame = 0
-                self.scene = 5.5
-        elif self.scene == 5.5:
-            self.screen.blit(self.enemy_image, self.enemy_rect)
-            self.screen.blit(self.fight_icon.image, self.fight_icon.rect)
-            self.screen.blit(self.sharpen_icon.image, self.sharpen_icon.rect)
-            self.screen.blit(self.defend_icon.image, self.defend_icon.rect)
-            self.screen.blit(self.heal_icon.image, self.heal_icon.rect)
-
-            if self.player.hp < 0: text = 'Your HP: 0'
-            else: text = 'Your HP: {}'.format(self.player.hp)
-            font_size = FONT.size(text)
-            self.screen.blit(FONT.render(text, True, 'grey95'), (360-font_size[0]/2, 48-font_size[1]/2))
+                state = -2
+            yield move
+            state += 1
+
+    def choose(self):
+        '''Does the chosen move and says how it went'''
+
+        if self.c_choice == 0:
+            self.damage = self.battle.fight()
+            self.text.change_text('You did {} damage!\n\n>>'.format(self.damage))
+        elif self.c_choice == 1:
+            if self.battle.sharpen():
+                self.text.change_text('Your attack increased by {:.2} times!\n\n>>'.format(self.battle.extra_atk))
+            else:
+                self.text.change_text('Your weapon is too sharp and you\'re afraid of ruining it by sharpening further!\n\n>>')
+        elif self.c_choice == 2:
+            if self.battle.defend():
+                self.text.change_text('Your defence increased by {:.2} times!\n\n>>'.format(self.battle.extra_def))
+            else:
+                self.text.change_text('You try to raise your guard further, but you could not reach any higher!\n\n>>')
+        elif self.c_choice == 3:
+            heal = self.battle.heal()
+            if heal is not None:
+                self.text.change_text('You healed {} HP\n\n>>'.format(heal))
+            else:
+                self.text.change_text('You cannot heal any fruther!\n\n>>')
 
-            self.text.update()
-            self.text.draw()
-        elif self.scene == 6:
-            self.text.update()
-            self.text.draw()
-        elif self.scene == 7:
-            self.text.update()
-            self.text.draw()
+    def battle_blits(self):
+        '''The enemy and all the fight icons as one blit sequence'''
+        return [(self.enemy_image, self.enemy_rect)] + [(icon.image, icon.rect) for icon in self.choices]
 
-        self.display.blit(self.screen, self.screen_pos)
+    def draw_hp(self, text):
+        font_size = TEXT_CACHE.size(text)
+        self.screen.blit(TEXT_CACHE.render(text, True, 'grey95'), (360-font_size[0]/2, 48-font_size[1]/2))
+
+    def draw_intro(self):
+        self.screen.blit(self.enemy_image, self.enemy_rect)
+
+        self.text.update()
+        self.text.draw()
+
+    def draw_icons(self):
+        self.screen.blits(self.battle_blits(), doreturn=False)
+
+    def draw_choosing(self):
+        o_sprite = self.choices[self.o_choice]
+        c_sprite = self.choices[self.c_choice]
+
+        o_sprite.deselect()
+        c_sprite.select()
+
+        self.screen.blits(self.battle_blits(), doreturn=False)
+
+    def draw_result(self):
+        if self.c_choice == 0:
+            self.enemy_image.set_alpha(50)
+
+        self.text.update()
+        self.text.draw()
+
+        c_sprite = self.choices[self.c_choice]
+        c_sprite.deselect()
+
+        self.screen.blit(self.enemy_image, self.enemy_rect)
+
+        if self.battle.enemy_hp < 0: self.draw_hp('Enemy HP: 0')
+        else: self.draw_hp('Enemy HP: {}'.format(self.battle.enemy_hp))
+
+    def draw_enemy(self):
+        self.screen.blit(self.enemy_image, self.enemy_rect)
+
+    def draw_enemy_turn(self):
+        self.screen.blits(self.battle_blits(), doreturn=False)
+
+        if self.player.hp < 0: self.draw_hp('Your HP: 0')
+        else: self.draw_hp('Your HP: {}'.format(self.player.hp))
+
+        self.text.update()
+        self.text.draw()
+
+    def draw_text(self):
+        self.text.update()
+        self.text.draw()
+
+    def update_display(self):
+        self.screen.fill(BG_COLOUR)
+        self.view()
+        self.display.blit(self.screen, (self.shake_x, 0))
+
+    def idle(self):
+        # Waiting for a key with the text (shown everywhere but the choosing) all out
+        return self.scripts.idle() and (self.text.finished or self.view == self.draw_choosing)
+
+    def handle(self, action):
+        super().handle(action)
+        self.scripts.press(action.name)
 
-    def get_events(self):
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                pygame.quit()
-                exit()
-            if event.type == pygame.KEYDOWN:
-                if event.key == pygame.K_a:
-                    if self.scene == 1:
-                        if self.c_choice != 0:
-                            pygame.mixer.Sound.play(SOUND_SELECT)
-                            self.o_choice = self.c_choice
-                            self.c_choice -= 1
-                if event.key == pygame.K_d:
-                    if self.scene == 1:
-                        if self.c_choice != len(self.choices)-1:
-                            pygame.mixer.Sound.play(SOUND_SELECT)
-                            self.o_choice = self.c_choice
-                            self.c_choice += 1
-                if event.key == pygame.K_x:
-                    self.text.skip()
-                if event.key == pygame.K_RETURN:
-                    if self.scene == 0:
-                        pygame.mixer.Sound.play(SOUND_CONFIRM)
-                        self.scene = 0.5
-                    elif self.scene == 1:
-                        pygame.mixer.Sound.play(SOUND_CONFIRM)
-                        if self.c_choice == 0:
-                            if getattr(self.player, 'weapon') is not None: player_atk = self.player.atk + self.player.weapon['atk']
-                            else: player_atk = self.player.atk
-                            player_atk = round(player_atk*self.extra_atk)
-                            self.damage = round(player_atk/(self.enemy_def/player_atk+1))+1
-                            self.text.change_text('You did {} damage!\n\n>>'.format(self.damage))
-
-                            self.enemy_hp -= self.damage
-                        elif self.c_choice == 1:
-                            if self.extra_atk < 3:
-                                self.extra_atk += 0.3
-                                self.text.change_text('Your attack increased by {:.2} times!\n\n>>'.format(self.extra_atk))
-                            else:
-                                self.text.change_text('Your weapon is too sharp and you\'re afraid of ruining it by sharpening further!\n\n>>')
-                        elif self.c_choice == 2:
-                            if self.extra_def < 3:
-                                self.extra_def += 0.3
-                                self.text.change_text('Your defence increased by {:.2} times!\n\n>>'.format(self.extra_def))
-                            else:
-                                self.text.change_text('You try to raise your guard further, but you could not reach any higher!\n\n>>')
-                        elif self.c_choice == 3:
-                            if self.heals != 0:
-                                heal = randint(25, 50)/100 * self.player.hp
-                                self.text.change_text('You healed {} HP\n\n>>'.format(heal))
-                                self.heals -= 1
-                            else:
-                                self.text.change_text('You cannot heal any fruther!\n\n>>')
-                        self.scene += 1
-                    elif self.scene == 3 and self.text.frame == len(self.text.text):
-                        self.enemy_image.set_alpha(255)
-                        if self.enemy_hp <= 0:
-                            self.scene = 6
-                            self.enemy_image.set_alpha(0)
-                            self.text.change_text('You win!\n\n>>')
-                        else:
-                            self.scene += 1
-                    elif self.scene == 5.5 and self.text.frame == len(self.text.text):
-                        if self.player.hp <= 0:
-                            self.scene = 7
-                            self.enemy_image.set_alpha(0)
-                            self.text.change_text('You died...\nBut at least you get more skills points!\n\nLevel: {}\n\n>>'.format(self.player.level))
-                        else:
-                            self.scene = 0.5
-                    elif self.scene == 6 and self.text.frame == len(self.text.text):
-                        self.running = False
-                        if self.type_ == 'boss': self.status = 'POST ENEMY ROOM - WON - BOSS'
-                        else: self.status = 'POST ENEMY ROOM - WON'
-                    elif self.scene == 7 and self.text.frame == len(self.text.text):
-                        self.running = False
-                        self.status = 'POST ENEMY ROOM - DEAD'
-        
     def run(self):
         if not self.running:
             return self.status
 
-        self.get_events()
-        self.update_display()
+        self.scripts.update()
+        FRAME_STATS.measure('events', self.get_events)
+        FRAME_STATS.measure('draw', self.update_display)
 
 
 class ChestScene(Scene):
     'Scene for chest room'
 
+    ACTIONS = {'left': 'choice_left', 'right': 'choice_right', 'skip': 'skip_text'}  # Confirming only goes to the script
+
     def __init__(self, display, player, w_spritesheet, a_spritesheet, type_=None):
         super().__init__(display, (), player)
 
-        self.chest_c_image = pygame.image.load('assets/chest_c.png').convert_alpha()
-        self.chest_c_image = pygame.transform.scale(self.chest_c_image, (128, 128))
+        self.chest_c_image = ASSETS.image('assets/chest_c.png', (128, 128))
         self.chest_c_rect = self.chest_c_image.get_rect()
         self.chest_c_rect.center = 360, 120
 
-        self.chest_o_image = pygame.image.load('assets/chest_o.png').convert_alpha()
-        self.chest_o_image = pygame.transform.scale(self.chest_o_image, (128, 128))
+        self.chest_o_image = ASSETS.copy('assets/chest_o.png', (128, 128))  # Fades out, so needs its own copy
         self.chest_o_rect = self.chest_o_image.get_rect()
         self.chest_o_rect.center = 360, 120
 
-        self.stage = 0
-        self.timer = 0
+        # Made by the first reset(), the ones after scale the next items into them
+        self.item_image = None
+        self.pitem_image = None
+        self.scripts = Scheduler()
+        self.reset(display, player, w_spritesheet, a_spritesheet, type_)
 
-        self.item_type = choice(('weapon', 'armour'))
-        if self.item_type == 'weapon':
-            item = choice(tuple(WEAPON_DICTS.keys()))
-            self.item_image = w_spritesheet.get_image(WEAPON_DICTS[item]).convert_alpha()
-            self.item_image = pygame.transform.scale(self.item_image, (128, 128))
-            self.item_rect = self.item_image.get_rect()
-            self.item_rect.center = 360, 120
-            self.item_image.set_alpha(0)
-            self.anim_x_vel = 30
-
-            if type_ == 'enemy': item_atk = randint(self.player.level-1, self.player.level+3)
-            elif type_ == 'boss': item_atk= randint(self.player.level+1, self.player.level+5)
-            else: item_atk = randint(self.player.level-3, self.player.level+3)
-            if item_atk < 1: item_atk = 1
-            item_name = '{} Of {} {}'.format(item, choice(WEAPON_ADJ), choice(WEAPON_END))
-            self.item = {'name': item_name, 'atk': item_atk, 'sprite': WEAPON_DICTS[item]}
+    def reset(self, display, player, w_spritesheet, a_spritesheet, type_=None):
+        '''Sets up a new chest, same arguments as __init__ (the random rolls are the same too)'''
+
+        self.start(display, (), player)
+        self.chest_o_image.set_alpha(255)
 
+        self.item_type, self.item = roll_item(self.player.level, type_)
+        sheet = w_spritesheet if self.item_type == 'weapon' else a_spritesheet
+        self.item_image = sheet.get_scaled(self.item.sprite, (128, 128), self.item_image)
+        self.item_rect = self.item_image.get_rect()
+        self.item_rect.center = 360, 120
+        self.item_image.set_alpha(0)
+
+        p_item = getattr(self.player, self.item_type)
+        if p_item is not None:
+            self.pitem_image = sheet.get_scaled(p_item.sprite, (128, 128), self.pitem_image)
+            self.pitem_rect = self.pitem_image.get_rect()
+            self.pitem_rect.center = 0, 120
+
+        if self.item_type == 'weapon':
             if self.player.weapon is None:
                 text = 'You found a new weapon!\n' \
-                    'New weapon: {}\nATK {}\n\n'.format(self.item['name'], self.item['atk']) + \
+                    'New weapon: {}\nATK {}\n\n'.format(self.item.name, self.item.amount) + \
                     'As you have nothing, you decide to take the new found weapon\n\n>>'
             else:
-                self.pitem_image = w_spritesheet.get_image(self.player.weapon['sprite']).convert_alpha()
-                self.pitem_image = pygame.transform.scale(self.pitem_image, (128, 128))
-                self.pitem_rect = self.pitem_image.get_rect()
-                self.pitem_rect.center = 0, 120
-
                 text = 'You found a new weapon!\n' \
-                    'Your weapon: {}\nATK {}\n\n'.format(self.player.weapon['name'], self.player.weapon['atk']) + \
-                    'New weapon: {}\nATK {}\n\n'.format(self.item['name'], self.item['atk']) + \
+                    'Your weapon: {}\nATK {}\n\n'.format(self.player.weapon.name, self.player.weapon.amount) + \
+                    'New weapon: {}\nATK {}\n\n'.format(self.item.name, self.item.amount) + \
                     'Replace?'
         elif self.item_type == 'armour':
-            item = choice(tuple(ARMOUR_DICTS.keys()))
-            self.item_image = a_spritesheet.get_image(ARMOUR_DICTS[item]).convert_alpha()
-            self.item_image = pygame.transform.scale(self.item_image, (128, 128))
-            self.item_rect = self.item_image.get_rect()
-            self.item_rect.center = 360, 120
-            self.item_image.set_alpha(0)
-            self.anim_x_vel = 30
-
-            if type_ == 'enemy': item_def = randint(self.player.level-1, self.player.level+3)
-            elif type_ == 'boss': item_def= randint(self.player.level+1, self.player.level+5)
-            else: item_def = randint(self.player.level-3, self.player.level+3)
-            if item_def < 1: item_def = 1
-            item_name = '{} Of {} {}'.format(item, choice(ARMOUR_ADJ), choice(ARMOUR_END))
-            self.item = {'name': item_name, 'def': item_def, 'sprite': ARMOUR_DICTS[item]}
-
             if self.player.armour is None:
                 text = 'You found new armour!\n' \
-                    'New item: {}\nDEF {}\n\n'.format(self.item['name'], self.item['def']) + \
+                    'New item: {}\nDEF {}\n\n'.format(self.item.name, self.item.amount) + \
                     'As you have nothing, you decide to take the new found armour\n\n>>'
             else:
-                self.pitem_image = a_spritesheet.get_image(self.player.armour['sprite']).convert_alpha()
-                self.pitem_image = pygame.transform.scale(self.pitem_image, (128, 128))
-                self.pitem_rect = self.pitem_image.get_rect()
-                self.pitem_rect.center = 0, 120
-
                 text = 'You found new armour!\n' \
-                    'Your armour: {}\nDEF {}\n\n'.format(self.player.armour['name'], self.player.armour['def']) + \
-                    'New armour: {}\nDEF {}\n\n'.format(self.item['name'], self.item['def']) + \
+                    'Your armour: {}\nDEF {}\n\n'.format(self.player.armour.name, self.player.armour.amount) + \
+                    'New armour: {}\nDEF {}\n\n'.format(self.item.name, self.item.amount) + \
                     'Replace?'
 
         self.text = Text(self.display, text, speed=1, pos=(60, 192))
@@ -1110,198 +2341,250 @@ class ChestScene(Scene):
         self.anim = Animation(20, 180)
 
         self.choice = 0
+        self.revealed = False  # The text can only be skipped once it is up
 
-    def update_display(self):
-        if self.stage == 0:
-            self.timer += 1
-            self.display.blit(self.chest_c_image, self.chest_c_rect)
-
-            if self.timer == 25:
-                self.timer = 0
-                self.stage += 1
-        elif self.stage == 1:
-            self.timer += 1
-            self.display.blit(self.chest_o_image, self.chest_o_rect)
-
-            self.item_image.set_alpha(self.item_image.get_alpha()+5)
-            self.display.blit(self.item_image, self.item_rect)
-
-            if self.timer == 51:
-                self.timer = 0
-                self.stage += 1
-        elif self.stage == 2:
-            self.timer += 1
-            self.chest_o_image.set_alpha(self.chest_o_image.get_alpha()-7)
-            self.display.blit(self.chest_o_image, self.chest_o_rect)
-
-            if getattr(self.player, self.item_type) is not None:
-                self.pitem_rect.centerx += self.anim.get_move(self.timer-1)
-                self.item_rect.centerx += self.anim.get_move(self.timer-1)
-
-            if self.item_rect.centerx >= 540:
-                self.item_rect.centerx = 540
-                self.pitem_rect.centerx = 180
-                self.timer = 0
-                self.stage += 1
-
-            self.display.blit(self.item_image, self.item_rect)
-            if getattr(self.player, self.item_type) is not None:
-                self.display.blit(self.pitem_image, self.pitem_rect)
-
-            if self.timer == 25:
-                self.stage = 4
+        self.scripts.cancel()
+        self.scripts.start(self.script())
+
+    def script(self):
+        '''Opens the chest, then either swaps the items or just takes the new one'''
+
+        self.view = self.draw_closed
+        yield Wait(25)
+
+        self.view = self.draw_opening
+        yield AlphaTween(self.item_image, [5]*51)
+
+        # The old item comes in from the left as the chest fades out
+        moves, swapping = self.swap_moves()
+        tweens = [AlphaTween(self.chest_o_image, [-7]*len(moves)), Tween(self.item_rect, 'centerx', moves)]
+        if getattr(self.player, self.item_type) is not None: tweens.append(Tween(self.pitem_rect, 'centerx', moves))
+        self.view = self.draw_swapping
+        yield tuple(tweens)
+
+        self.revealed = True
+        if swapping:
+            self.view = self.draw_choosing
+            yield from wait_confirm(self.text)
+            if self.choice == 0:
                 setattr(self.player, self.item_type, self.item)
-        elif self.stage == 3:
-            self.display.blit(self.item_image, self.item_rect)
+                AUDIO.play(SOUND_TAKE_ITEM)
+            else:
+                AUDIO.play(SOUND_CONFIRM)
+        else:
+            setattr(self.player, self.item_type, self.item)
+            self.view = self.draw_taken
+            yield from wait_confirm(self.text)
+            AUDIO.play(SOUND_TAKE_ITEM)
+        self.running = False
+
+    def swap_moves(self):
+        '''
+        Moves of the new item (the old one moves with it) until it is at x 540, and whether it got there
+        With no old item nothing moves, the chest just fades for 25 frames'''
+
+        if getattr(self.player, self.item_type) is None: return [0]*25, False
+
+        moves = []
+        x = self.item_rect.centerx
+        for frame in range(25):
+            move = self.anim.get_move(frame)
+            if x+move >= 540:
+                moves.append(540-x)
+                return moves, True
+            moves.append(move)
+            x += move
+        return moves, False
+
+    def draw_closed(self):
+        self.display.blit(self.chest_c_image, self.chest_c_rect)
+
+    def draw_opening(self):
+        self.display.blit(self.chest_o_image, self.chest_o_rect)
+        self.display.blit(self.item_image, self.item_rect)
+
+    def draw_swapping(self):
+        self.display.blit(self.chest_o_image, self.chest_o_rect)
+        self.display.blit(self.item_image, self.item_rect)
+        if getattr(self.player, self.item_type) is not None:
             self.display.blit(self.pitem_image, self.pitem_rect)
 
-            self.text.update()
-            self.text.draw()
+    def draw_choosing(self):
+        self.display.blit(self.item_image, self.item_rect)
+        self.display.blit(self.pitem_image, self.pitem_rect)
 
-            if self.choice == 0:
-                font_size = FONT.size('Yes')
-                self.display.blit(FONT.render('Yes', True, '#FFFF00'), (240-font_size[0]/2, 384-font_size[1]/2))
-                font_size = FONT.size('No')
-                self.display.blit(FONT.render('No', True, 'grey95'), (480-font_size[0]/2, 384-font_size[1]/2))
-            elif self.choice == 1:
-                font_size = FONT.size('Yes')
-                self.display.blit(FONT.render('Yes', True, 'grey95'), (240-font_size[0]/2, 384-font_size[1]/2))
-                font_size = FONT.size('No')
-                self.display.blit(FONT.render('No', True, '#FFFF00'), (480-font_size[0]/2, 384-font_size[1]/2))
-
-        elif self.stage == 4:  # No weapon
-            self.display.blit(self.item_image, self.item_rect)
+        self.text.update()
+        self.text.draw()
 
-            self.text.update()
-            self.text.draw()
+        if self.choice == 0:
+            font_size = TEXT_CACHE.size('Yes')
+            self.display.blit(TEXT_CACHE.render('Yes', True, '#FFFF00'), (240-font_size[0]/2, 384-font_size[1]/2))
+            font_size = TEXT_CACHE.size('No')
+            self.display.blit(TEXT_CACHE.render('No', True, 'grey95'), (480-font_size[0]/2, 384-font_size[1]/2))
+        elif self.choice == 1:
+            font_size = TEXT_CACHE.size('Yes')
+            self.display.blit(TEXT_CACHE.render('Yes', True, 'grey95'), (240-font_size[0]/2, 384-font_size[1]/2))
+            font_size = TEXT_CACHE.size('No')
+            self.display.blit(TEXT_CACHE.render('No', True, '#FFFF00'), (480-font_size[0]/2, 384-font_size[1]/2))
 
-    def get_events(self):
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                pygame.quit()
-                exit()
-            if event.type == pygame.KEYDOWN:
-                if event.key == pygame.K_a:
-                    pygame.mixer.Sound.play(SOUND_SELECT)
-                    if self.choice != 0:
-                        self.choice -= 1
-                    else:
-                        self.choice = 1
-                if event.key == pygame.K_d:
-                    pygame.mixer.Sound.play(SOUND_SELECT)
-                    if self.choice != 1:
-                        self.choice += 1
-                    else:
-                        self.choice = 0
-                if event.key == pygame.K_RETURN:
-                    if self.stage == 3:
-                        if self.choice == 0 and self.text.frame == len(self.text.text):
-                            setattr(self.player, self.item_type, self.item)
-                            pygame.mixer.Sound.play(SOUND_TAKE_ITEM)
-                            self.running = False
-                        elif self.text.frame == len(self.text.text):
-                            pygame.mixer.Sound.play(SOUND_CONFIRM)
-                            self.running = False
-                    if self.stage == 4:
-                        if self.text.frame == len(self.text.text):
-                            pygame.mixer.Sound.play(SOUND_TAKE_ITEM)
-                            self.running = False
-                if event.key == pygame.K_x:
-                    if self.stage >= 3:
-                        self.text.skip()
-
-
-class BoostScene(Scene):
-    '''Scene for changing the player skills'''
+    def draw_taken(self):  # No weapon
+        self.display.blit(self.item_image, self.item_rect)
 
-    def __init__(self, display, player, type_=None):
-        super().__init__(display, (), player)
+        self.text.update()
+        self.text.draw()
 
-        self.player = player
-        self.choice = 0
-        self.choices = (
-            Skill(self.display, self.player, (SCREEN_W/4-45, SCREEN_H/3), 'atk', 'assets/attackskill'),
-            Skill(self.display, self.player, (SCREEN_W/4*2, SCREEN_H/3), 'hp', 'assets/healthskill'),
-            Skill(self.display, self.player, (SCREEN_W/4*3+45, SCREEN_H/3), 'defence', 'assets/defenceskill'),
-        )
-        self.border = pygame.image.load('assets/skillborder.png').convert_alpha()
-        self.border = pygame.transform.scale(self.border, (192, 132))
-        self.border_rect = self.border.get_rect()
-        self.border_rect.center = self.choices[0].rect.center
+    def update_display(self):
+        self.view()
+
+    def idle(self):
+        return self.scripts.idle()
+
+    def handle(self, action):
+        super().handle(action)
+        self.scripts.press(action.name)
+
+    def choice_left(self, action):
+        AUDIO.play(SOUND_SELECT)
+        if self.choice != 0:
+            self.choice -= 1
+        else:
+            self.choice = 1
+
+    def choice_right(self, action):
+        AUDIO.play(SOUND_SELECT)
+        if self.choice != 1:
+            self.choice += 1
+        else:
+            self.choice = 0
+
+    def skip_text(self, action):
+        if self.revealed:
+            self.text.skip()
+
+    def run(self):
+        if not self.running:
+            return True
+
+        self.scripts.update()
+        FRAME_STATS.measure('events', self.get_events)
+        FRAME_STATS.measure('draw', self.update_display)
 
+
+class BoostScene(SkillScene):
+    '''Scene for changing the player skills after a boost room (or dying), the skill scene with its own text'''
+
+    def __init__(self, display, player, type_=None):
+        self.type_ = type_
         if type_ == 'dead':
             text = 'You died but at least you gain 5 more skills points\n\n>>'
         else:
-            self.player.skill_points += 10
             text = 'The legends were right!\nYou do become stronger after entering\n\n' \
                 'You gained 10 skill points!\n\n>>'
-        self.text = Text(self.display, text, speed=1, pos=(60, 270))
+        super().__init__(display, player, text)
 
-        self.ee1 = False
+    def arrive(self):
+        '''A boost room gives its skill points, dying gave them already (see die)'''
+        if self.type_ != 'dead': boost(self.player)
 
-    def update_display(self):
-        for skill in self.choices:
-            skill.update_display()
 
-        # Moves the border to the current pos
-        if self.border_rect.centerx > self.choices[self.choice].rect.centerx:
-            self.border_rect.centerx -= 15
-        elif self.border_rect.centerx < self.choices[self.choice].rect.centerx:
-            self.border_rect.centerx += 15
-        # self.border_rect.center = self.choices[self.choice].rect.center
-        self.display.blit(self.border, self.border_rect)
+class LeaderboardScene(Scene):
+    '''
+    Scene for the endless leaderboard after dying, with the run that just ended on it
+    A page of the board is read at a time, A/D change the page and W/S the time window'''
 
-        # Text business
-        if not self.ee1:
-            self.sp_text = 'You have {} skill points remaining'.format(self.player.skill_points-self.player.sum)
-        font_size = FONT.size(self.sp_text)
-        self.display.blit(FONT.render(self.sp_text, True, 'grey95'), (360-font_size[0]/2, 48-font_size[1]/2))
+    ACTIONS = {'left': 'page_back', 'right': 'page_on', 'up': 'window_back', 'down': 'window_on', 'confirm': 'leave'}
+    WINDOWS = (('ALL TIME', None), ('THIS MONTH', 30), ('THIS WEEK', 7), ('TODAY', 1))  # Name, days
+    PAGE_SIZE = 8
 
-        self.text.update()
-        self.text.draw()
+    def __init__(self, display, player, board, run):
+        super().__init__(display, (), player)
 
-    def get_events(self):
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                pygame.quit()
-                exit()
-            if event.type == pygame.KEYDOWN:
-                self.ee1 = False
-                # Controls the changing of skill
-                if event.key == pygame.K_a:
-                    pygame.mixer.Sound.play(SOUND_SELECT)
-                    if self.choice != 0:
-                        self.choice -= 1
-                if event.key == pygame.K_d:
-                    pygame.mixer.Sound.play(SOUND_SELECT)
-                    if self.choice != len(self.choices)-1:
-                        self.choice += 1
-                # Controls the changing of skill amount
-                if event.key == pygame.K_w:
-                    pygame.mixer.Sound.play(SOUND_SELECT)
-                    setattr(self.player, self.choices[self.choice].skill, getattr(self.player, self.choices[self.choice].skill)+1)
-                    if self.player.sum > self.player.skill_points:
-                        setattr(self.player, self.choices[self.choice].skill, getattr(self.player, self.choices[self.choice].skill)-1)
-                        self.sp_text = choice(('You think you have any skill points left to spend?', 'With what skill points?', 'nah', 'no.', 'Keep trying.', 'uh oh, 0 left', 'L', ':clown:', 'ZERO LOL IMAGINE', 'no skill points'))
-                        self.ee1 = True
-                if event.key == pygame.K_s:
-                    pygame.mixer.Sound.play(SOUND_SELECT)
-                    if getattr(self.player, self.choices[self.choice].skill) > 1:
-                        setattr(self.player, self.choices[self.choice].skill, getattr(self.player, self.choices[self.choice].skill)-1)
-                    else:
-                        self.sp_text = choice(('Really?', '...', '?', 'How?', 'Keep trying.', 'how does that work, eh?'))
-                        self.ee1 = True
-                if event.key == pygame.K_x:
-                    self.text.skip()
-                # Next scene
-                if event.key == pygame.K_RETURN:
-                    pygame.mixer.Sound.play(SOUND_CONFIRM)
-                    self.running = False
+        self.board = board
+        self.run_ended = run  # See leaderboard.new_run, it is written in the background
+        self.window = 0
+        self.cursors = [None]  # The last run before each page so far, for going back
+        self.rows = None  # Read once the board has the run
+        self.more = False
+        self.rank = None
+
+    def load_page(self):
+        '''Reads the current page (and one more run to know if there is a next page)'''
+
+        start = since(self.WINDOWS[self.window][1])
+        rows = self.board.page(self.cursors[-1], start, self.PAGE_SIZE+1)
+        self.rows = rows[:self.PAGE_SIZE]
+        self.more = len(rows) > self.PAGE_SIZE
+        self.rank = self.board.rank(self.run_ended.level, self.run_ended.boss_kills, self.run_ended.duration, start)
+
+    def update_display(self):
+        if self.rows is None:
+            if not self.board.written_all(): return
+            self.load_page()
+
+        title = 'LEADERBOARD - {}'.format(self.WINDOWS[self.window][0])
+        font_size = TEXT_CACHE.size(title)
+        self.display.blit(TEXT_CACHE.render(title, True, 'grey95'), (360-font_size[0]/2, 40-font_size[1]/2))
+
+        run = self.run_ended
+        text = 'You reached level {} with {} boss kills, #{}'.format(run.level, run.boss_kills, self.rank)
+        font_size = TEXT_CACHE.size(text)
+        self.display.blit(TEXT_CACHE.render(text, True, 'grey95'), (360-font_size[0]/2, 80-font_size[1]/2))
+
+        first = (len(self.cursors)-1) * self.PAGE_SIZE
+        for place, row in enumerate(self.rows, first+1):
+            colour = '#FFFF00' if row[1:] == run[1:] else 'grey95'
+            minutes, seconds = divmod(int(row.duration), 60)
+            self.display.blit(TEXT_CACHE.render('{}. {}'.format(place, row.name[:16]), True, colour), (60, 112+(place-first-1)*32))
+            self.display.blit(TEXT_CACHE.render('Level {}   Bosses {}   {}:{:02}'.format(row.level, row.boss_kills, minutes, seconds), True, colour), (330, 112+(place-first-1)*32))
+
+        text = '{}Page {}{}   W/S time   >>'.format('< ' if len(self.cursors) > 1 else '', len(self.cursors), ' >' if self.more else '')
+        font_size = TEXT_CACHE.size(text)
+        self.display.blit(TEXT_CACHE.render(text, True, '#FFFF00'), (360-font_size[0]/2, 440-font_size[1]/2))
+
+    def idle(self):
+        return self.rows is not None
+
+    def page_on(self, action):
+        AUDIO.play(SOUND_SELECT)
+        if self.rows and self.more:
+            self.cursors.append(self.rows[-1])
+            self.load_page()
+
+    def page_back(self, action):
+        AUDIO.play(SOUND_SELECT)
+        if self.rows is not None and len(self.cursors) > 1:
+            self.cursors.pop()
+            self.load_page()
+
+    def change_window(self, step):
+        AUDIO.play(SOUND_SELECT)
+        self.window = (self.window+step) % len(self.WINDOWS)
+        self.cursors = [None]
+        if self.rows is not None: self.load_page()
+
+    def window_back(self, action):
+        self.change_window(-1)
+
+    def window_on(self, action):
+        self.change_window(1)
+
+    def leave(self, action):
+        AUDIO.play(SOUND_CONFIRM)
+        self.running = False
+
+    def run(self):
+        if not self.running:
+            return 'POST LEADERBOARD'
+
+        FRAME_STATS.measure('events', self.get_events)
+        FRAME_STATS.measure('draw', self.update_display)
 
 
 class WonScene(Scene):
     '''Scene for the win scene'''
 
+    ACTIONS = {'confirm': 'close', 'skip': 'skip_text'}
+
     def __init__(self, display, player):
         super().__init__(display, (), player)
 
@@ -1315,16 +2598,11 @@ class WonScene(Scene):
         self.text.update()
         self.text.draw()
 
-    def get_events(self):
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                pygame.quit()
-                exit()
-            if event.type == pygame.KEYDOWN:
-                if event.key == pygame.K_RETURN:
-                    if self.text.frame == len(self.text.text):
-                        pygame.mixer.Sound.play(SOUND_CONFIRM)
-                        pygame.quit()
-                        exit()
-                if event.key == pygame.K_x:
-                    self.text.skip()
+    def idle(self):
+        return self.text.finished
+
+    def close(self, action):
+        if self.text.frame == len(self.text.text):
+            AUDIO.play(SOUND_CONFIRM)
+            pygame.quit()
+            exit()
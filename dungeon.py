@@ -0,0 +1,202 @@
+'''
+The dungeon map: rooms joined by corridors on a grid that goes on forever
+The map is made a chunk at a time from the seed, only when something looks at it. Chunks far from the player are
+dropped and made again (exactly the same) if they are looked at again, so a run can go as deep as it likes in the same memory
+Every room on the map holds one of the game's rooms (heal, enemy, chest or the rare boost room) as its feature
+Run it to print part of the map and time a walk down it (python dungeon.py --help)'''
+
+
+import random
+from collections import deque, namedtuple
+from time import perf_counter
+
+from rules import ROOM_NAMES
+
+
+CHUNK_SIZE = 32  # Cells along each side of a chunk
+KEEP_RADIUS = 2  # Chunks kept around the player's chunk in every direction, the rest are dropped
+ROOM_TRIES = 12  # Rooms a chunk tries to place, the ones that would touch another room are skipped
+ROOM_SIZE = (3, 7)  # Smallest and biggest width or height of a room
+BOOST_CHANCE = 1/100
+
+WALL, ROOM, CORRIDOR = 0, 1, 2
+CELL_CHARS = {WALL: '#', ROOM: '.', CORRIDOR: ','}
+FEATURE_CHARS = {'HEAL ROOM': 'H', 'ENEMY ROOM': 'E', 'CHEST ROOM': 'C', 'BOOST ROOM': 'B'}
+
+Chunk = namedtuple('Chunk', 'x y cells rooms features')  # cells is a bytearray by row, rooms are (x, y, w, h) in the chunk
+Feature = namedtuple('Feature', 'name x y')  # A room's feature, at the room's centre in map cells
+
+
+def carve(cells, x0, y0, x1, y1, horizontal_first):
+    '''Corridor between two cells of a chunk, along one axis then the other, rooms it goes through stay rooms'''
+
+    if horizontal_first: path = [(x, y0) for x in range(min(x0, x1), max(x0, x1)+1)] + [(x1, y) for y in range(min(y0, y1), max(y0, y1)+1)]
+    else: path = [(x0, y) for y in range(min(y0, y1), max(y0, y1)+1)] + [(x, y1) for x in range(min(x0, x1), max(x0, x1)+1)]
+    for x, y in path:
+        i = y*CHUNK_SIZE + x
+        if cells[i] == WALL: cells[i] = CORRIDOR
+
+
+def centre(room):
+    x, y, w, h = room
+    return x + w//2, y + h//2
+
+
+class Dungeon:
+    '''
+    The map of a run, made from seed
+    chunk() makes chunks as they are needed, visit() moves the player and drops the chunks out of range'''
+
+    def __init__(self, seed, keep_radius=KEEP_RADIUS):
+        self.seed = seed
+        self.keep_radius = keep_radius
+        self.chunks = {}
+        self.generated = 0
+        self.evicted = 0
+        self.generate_times = deque(maxlen=1000)
+
+    def random(self, *key):
+        '''A generator seeded by the map seed and key, the same every time'''
+        return random.Random(':'.join(str(part) for part in (self.seed,) + key))
+
+    def door(self, axis, x, y):
+        '''
+        Where a corridor crosses the chunk border on axis ('x' is the left side of chunk x, y, 'y' its top)
+        Both chunks on the border work it out the same way, so they join up without making each other'''
+        return self.random(axis, x, y).randrange(2, CHUNK_SIZE-2)
+
+    def chunk(self, x, y):
+        '''The chunk at chunk coordinates x, y, made now if it isn't kept'''
+
+        chunk = self.chunks.get((x, y))
+        if chunk is None:
+            start = perf_counter()
+            chunk = self.chunks[x, y] = self.generate(x, y)
+            self.generate_times.append(perf_counter()-start)
+            self.generated += 1
+        return chunk
+
+    def generate(self, cx, cy):
+        '''Makes a chunk: rooms first, then corridors joining each room to the nearest one before it and to the doors'''
+
+        rng = self.random(cx, cy)
+        cells = bytearray(CHUNK_SIZE*CHUNK_SIZE)
+        low, high = ROOM_SIZE
+
+        rooms = []
+        for _ in range(ROOM_TRIES):
+            w, h = rng.randint(low, high), rng.randint(low, high)
+            x, y = rng.randint(1, CHUNK_SIZE-w-1), rng.randint(1, CHUNK_SIZE-h-1)
+            # Rooms keep a wall between them
+            if any(x <= rx+rw and rx <= x+w and y <= ry+rh and ry <= y+h for rx, ry, rw, rh in rooms): continue
+            rooms.append((x, y, w, h))
+        if not rooms: rooms.append(((CHUNK_SIZE-high)//2, (CHUNK_SIZE-high)//2, high, high))
+
+        for x, y, w, h in rooms:
+            for row in range(y, y+h):
+                cells[row*CHUNK_SIZE+x:row*CHUNK_SIZE+x+w] = bytes((ROOM,)) * w
+
+        centres = [centre(room) for room in rooms]
+        for i in range(1, len(centres)):
+            x0, y0 = centres[i]
+            x1, y1 = min(centres[:i], key=lambda c: abs(c[0]-x0) + abs(c[1]-y0))
+            carve(cells, x0, y0, x1, y1, rng.random() < 0.5)
+
+        last = CHUNK_SIZE-1
+        doors = (
+            (0, self.door('x', cx, cy)), (last, self.door('x', cx+1, cy)),
+            (self.door('y', cx, cy), 0), (self.door('y', cx, cy+1), last),
+        )
+        for x0, y0 in doors:
+            x1, y1 = min(centres, key=lambda c: abs(c[0]-x0) + abs(c[1]-y0))
+            carve(cells, x0, y0, x1, y1, x0 in (0, last))
+
+        features = []
+        for (x, y), room in zip(centres, rooms):
+            name = 'BOOST ROOM' if rng.random() < BOOST_CHANCE else rng.choice(ROOM_NAMES)
+            features.append(Feature(name, cx*CHUNK_SIZE + x, cy*CHUNK_SIZE + y))
+        return Chunk(cx, cy, cells, tuple(rooms), tuple(features))
+
+    def cell(self, x, y):
+        '''WALL, ROOM or CORRIDOR at map cell x, y'''
+
+        chunk = self.chunk(x // CHUNK_SIZE, y // CHUNK_SIZE)
+        return chunk.cells[(y % CHUNK_SIZE)*CHUNK_SIZE + x % CHUNK_SIZE]
+
+    def start(self):
+        '''Where a run starts, the top room of the first chunk'''
+
+        feature = min(self.chunk(0, 0).features, key=lambda feature: (feature.y, feature.x))
+        return feature.x, feature.y
+
+    def visit(self, x, y):
+        '''The player is at map cell x, y, drops the chunks more than keep_radius chunks away'''
+
+        cx, cy = x // CHUNK_SIZE, y // CHUNK_SIZE
+        far = [key for key in self.chunks if max(abs(key[0]-cx), abs(key[1]-cy)) > self.keep_radius]
+        for key in far: del self.chunks[key]
+        self.evicted += len(far)
+
+    def choices(self, x, y, count=3):
+        '''
+        The count rooms nearest map cell x, y that are deeper down the map (further down than y), left to right
+        Looks through the chunks below and beside the one x, y is in, a row at a time until there are enough'''
+
+        cx, cy = x // CHUNK_SIZE, y // CHUNK_SIZE
+        found = []
+        row = cy
+        while len(found) < count:
+            for column in (cx-1, cx, cx+1):
+                found += [feature for feature in self.chunk(column, row).features if feature.y > y]
+            row += 1
+
+        nearest = sorted(found, key=lambda feature: (abs(feature.x-x) + feature.y-y, feature.x, feature.y))[:count]
+        return tuple(sorted(nearest, key=lambda feature: (feature.x, feature.y)))
+
+    def render(self, x0, y0, w, h, marks=None):
+        '''Text picture of the map cells from x0, y0, features as letters and marks ({(x, y): char}) over them'''
+
+        marks = dict(marks or {})
+        for cx in range(x0 // CHUNK_SIZE, (x0+w-1) // CHUNK_SIZE + 1):
+            for cy in range(y0 // CHUNK_SIZE, (y0+h-1) // CHUNK_SIZE + 1):
+                for feature in self.chunk(cx, cy).features:
+                    marks.setdefault((feature.x, feature.y), FEATURE_CHARS[feature.name])
+        return '\n'.join(''.join(marks.get((x, y)) or CELL_CHARS[self.cell(x, y)] for x in range(x0, x0+w)) for y in range(y0, y0+h))
+
+    def stats(self):
+        '''Chunks kept, made and dropped, and ms to make a chunk (mean and worst of the last 1000)'''
+
+        stats = {'chunks': len(self.chunks), 'generated': self.generated, 'evicted': self.evicted}
+        if self.generate_times:
+            stats['generate_ms'] = round(sum(self.generate_times) / len(self.generate_times) * 1000, 4)
+            stats['worst_generate_ms'] = round(max(self.generate_times) * 1000, 4)
+        return stats
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Prints part of the dungeon map and times walking down it')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--width', type=int, default=CHUNK_SIZE*2, help='cells of the map to print across')
+    parser.add_argument('--height', type=int, default=CHUNK_SIZE, help='cells of the map to print down')
+    parser.add_argument('--walk', type=int, default=1000, metavar='ROOMS', help='rooms to walk through, picking at random')
+    args = parser.parse_args()
+
+    dungeon = Dungeon(args.seed)
+    x, y = dungeon.start()
+    print(dungeon.render(x - args.width//2, 0, args.width, args.height, {(x, y): '@'}))
+
+    rng = random.Random(args.seed)
+    start = perf_counter()
+    for _ in range(args.walk):
+        dungeon.visit(x, y)
+        _, x, y = rng.choice(dungeon.choices(x, y))
+    taken = perf_counter()-start
+
+    print('Walked {} rooms to {}, {} deep, in {:.1f} ms ({:.3f} ms a room)'.format(args.walk, (x, y), y // CHUNK_SIZE, taken*1000, taken/max(args.walk, 1)*1000))
+    print(dungeon.stats())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,291 @@
+'''
+Runs the game headless and uncapped on the SDL dummy drivers, for soak tests and performance checks
+Input comes from a script (a function of the frame number) or a recording, the run stops after a number of frames or when a condition is met'''
+
+
+import os
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+
+import random
+import sys
+from time import perf_counter
+
+import pygame
+
+from dependencies import *
+from Snungeon import Manager
+from leaderboard import Leaderboard
+from save import Saver, apply_save, load_save
+
+
+KEYS = {'return': pygame.K_RETURN, 'w': pygame.K_w, 'a': pygame.K_a, 's': pygame.K_s, 'd': pygame.K_d, 'x': pygame.K_x}
+
+
+def cycle_keys(keys, every=3):
+    '''Script that presses the keys in order, one every few frames'''
+
+    def script(frame):
+        if frame % every: return ()
+        return (keys[frame//every % len(keys)],)
+    return script
+
+
+def random_keys(keys, every=3, seed=None):
+    '''Script that mashes random keys, one every few frames'''
+
+    rng = random.Random(seed)
+
+    def script(frame):
+        if frame % every: return ()
+        return (rng.choice(keys),)
+    return script
+
+
+# Mostly confirming gets through the menus and into the rooms, the rest moves around and skips text
+MASH = [pygame.K_RETURN]*6 + [pygame.K_x, pygame.K_a, pygame.K_d, pygame.K_w, pygame.K_s]
+
+
+def scene_is(name):
+    '''Condition for run, stops once the current scene is the named class'''
+    return lambda manager: type(manager.current_scene).__name__ == name
+
+
+def level_reached(level):
+    '''Condition for run, stops once the player gets to level'''
+    return lambda manager: manager.player.level >= level
+
+
+class Harness:
+    '''
+    Boots a Manager and runs it frame by frame with no frame cap and no idle waiting
+    script(frame) returns the keys to press on that frame, a recording (see replay.py) can be given instead'''
+
+    def __init__(self, script=None, recording=None, seed=None, dirty=False, prepare=True, pool=True, count_allocations=False, save=None, resume=None, leaderboard=None, dungeon=False):
+        if recording is not None: seed = recording['seed']
+        RNG.seed(seed)
+        EVENTS.frame = 0
+        INPUT.latencies.clear()
+
+        self.manager = Manager(dirty=dirty)
+        self.manager.prepare = prepare
+        self.manager.pool = pool
+        self.manager.count_allocations = count_allocations
+        self.script = script
+        if recording is not None:
+            EVENTS.replay(recording['events'], recording['frames'])
+            dungeon = dungeon or recording.get('dungeon', False)
+        if dungeon: self.manager.start_dungeon(RNG.master)
+
+        # A save to resume (a snapshot, see save.py) and where to autosave to
+        if resume is not None: apply_save(self.manager, resume)
+        if save is not None: self.manager.saver = Saver(save)
+        if leaderboard is not None: self.manager.leaderboard = Leaderboard(leaderboard)
+
+    def step(self):
+        if self.script is not None:
+            for key in self.script(EVENTS.frame):
+                pygame.event.post(pygame.event.Event(pygame.KEYDOWN, key=key))
+        self.manager.frame()
+
+    def run(self, frames=None, until=None):
+        '''
+        Runs until frames have been played or until(manager) is true, at least one of them should be given
+        Returns a dict describing the run'''
+
+        start_frame = EVENTS.frame
+        start = perf_counter()
+        stopped = False
+        while frames is None or EVENTS.frame - start_frame < frames:
+            self.step()
+            if until is not None and until(self.manager):
+                stopped = True
+                break
+        taken = perf_counter()-start
+
+        played = EVENTS.frame - start_frame
+        return {
+            'frames': played,
+            'seconds': taken,
+            'fps': played / taken if taken else 0,
+            'stopped': stopped,
+            'scene': type(self.manager.current_scene).__name__,
+            'level': self.manager.player.level,
+            'seed': RNG.master,
+            'startup': self.manager.startup,
+            'audio': AUDIO.stats(),
+            'transitions': self.manager.transition_stats(),
+            'scenes': dict(self.manager.pool_stats),
+            'allocations': dict(self.manager.allocations),
+            'input': INPUT.latency_stats(),
+            'save': self.save_stats(),
+            'leaderboard': self.leaderboard_stats(),
+            'dungeon': self.manager.dungeon.stats() if self.manager.dungeon is not None else {},
+        }
+
+    def leaderboard_stats(self):
+        board = self.manager.leaderboard
+        if board is None: return {}
+        board.flush()
+        return board.stats()
+
+    def save_stats(self):
+        saver = self.manager.saver
+        if saver is None: return {}
+        saver.flush()
+        return saver.stats()
+
+
+def final_state(manager):
+    '''What a run comes down to, for checking two runs that should have played out the same'''
+
+    player = manager.player
+    return {
+        'scene': type(manager.current_scene).__name__,
+        'player': (player.skill_points, player.atk, player.hp, player.max_hp, player.defence, player.level, player.weapon, player.armour),
+        'status': manager.status,
+        'rng': RNG.getstate(),
+    }
+
+
+def check_prepare(seed, frames, every=3):
+    '''
+    Plays the same key mashing with the room scenes made ahead of time and without
+    Making them ahead must not change the run, returns the two final states'''
+
+    if seed is None: seed = random.randrange(2**32)
+    states = []
+    for prepare in (True, False):
+        harness = Harness(random_keys(MASH, every, seed), seed=seed, prepare=prepare)
+        harness.run(frames)
+        states.append(final_state(harness.manager))
+    return states
+
+
+def check_replay(seed, frames, every=3):
+    '''
+    Records key mashing live, then plays the recording back through a Replayer with a new Manager
+    The playback must end the same as the live run, returns the two final states'''
+
+    from replay import Replayer
+
+    harness = Harness(random_keys(MASH, every, seed), seed=seed)
+    EVENTS.record()
+    harness.run(frames)
+    live = final_state(harness.manager)
+    recording = {'seed': RNG.master, 'frames': EVENTS.frame, 'events': EVENTS.recording}
+    EVENTS.recording = None
+
+    RNG.seed(recording['seed'])
+    replayer = Replayer(Manager(), recording)
+    replayer.run_to_end()
+    return live, final_state(replayer.manager)
+
+
+def report_check(name, first, second):
+    '''Prints whether two final states match, and what differs if they don't, returns True if they match'''
+
+    differ = [key for key in first if first[key] != second[key]]
+    if not differ:
+        print('{}: same final state ({}, player {})'.format(name, first['scene'], first['player'][:6]))
+        return True
+    for key in differ:
+        print('{}: {} differs'.format(name, key) + ('' if key == 'rng' else ', {} vs {}'.format(first[key], second[key])))
+    return False
+
+
+def report(result):
+    '''Prints a run'''
+
+    print('{} frames in {:.2f}s: {:.1f} fps ({:.3f} ms/frame)'.format(result['frames'], result['seconds'], result['fps'], result['seconds']/max(result['frames'], 1)*1000))
+    print('Seed {}, ended on {} at level {}{}'.format(result['seed'], result['scene'], result['level'], ' (condition met)' if result['stopped'] else ''))
+    for kind, stats in result['transitions'].items():
+        print('Entering {} rooms: {:.3f} ms mean, {:.3f} ms worst ({} rooms)'.format(kind, stats['mean_ms'], stats['worst_ms'], stats['rooms']))
+    if result['scenes']: print('Scenes: {} made, {} reused from the pool'.format(result['scenes'].get('made', 0), result['scenes'].get('reused', 0)))
+    if result['allocations']:
+        levels = sorted(result['allocations'])
+        print('New surfaces by level: {}'.format(', '.join('{}: {}'.format(level, result['allocations'][level]) for level in levels)))
+        warm = [result['allocations'][level] for level in levels[5:]]
+        if warm: print('New surfaces per level after level {}: {:.2f} mean'.format(levels[4], sum(warm)/len(warm)))
+    for scene, stats in result['input'].items():
+        print('Input to present in {}: {:.3f} ms mean, {:.3f} ms worst ({} actions)'.format(scene, stats['mean_ms'], stats['worst_ms'], stats['actions']))
+    if result['save']: print('Autosave: {}'.format(result['save']))
+    if result['leaderboard']: print('Leaderboard: {}'.format(result['leaderboard']))
+    if result['dungeon']: print('Dungeon: {}'.format(result['dungeon']))
+    if result['audio']['triggers']: print('Audio: {}'.format(result['audio']))
+    if 'first_frame' in result['startup']:
+        print('Startup: first frame at {:.1f} ms, everything loaded at {:.1f} ms'.format(result['startup']['first_frame']*1000, result['startup']['loaded']*1000))
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Runs the game headless as fast as it can')
+    parser.add_argument('--frames', type=int, help='frames to run, 3600 if there is no other way to stop')
+    parser.add_argument('--until-scene', metavar='CLASS', help='stop when this scene comes up (e.g. WonScene)')
+    parser.add_argument('--until-level', type=int, help='stop when the player gets to this level')
+    parser.add_argument('--keys', help='comma separated keys to press in order ({}), random mashing if not given'.format(', '.join(KEYS)))
+    parser.add_argument('--every', type=int, default=3, help='frames between key presses')
+    parser.add_argument('--replay', metavar='PATH', help='use a recording for the input instead')
+    parser.add_argument('--seed', type=int, help='seed for the game and the key mashing')
+    parser.add_argument('--dirty', action='store_true', help='dirty rect mode')
+    parser.add_argument('--frame-stats', metavar='PATH', help='time every frame and save them to PATH (.csv or .json)')
+    parser.add_argument('--overlay', action='store_true', help='draw the frame time overlay too')
+    parser.add_argument('--no-prepare', action='store_true', help="don't make the room scenes ahead of time")
+    parser.add_argument('--no-pool', action='store_true', help="don't reuse finished scenes")
+    parser.add_argument('--allocations', action='store_true', help='count the new surfaces the scenes of each level hold')
+    parser.add_argument('--save', metavar='PATH', help='autosave to PATH at every room transition and report the save times')
+    parser.add_argument('--resume', metavar='PATH', help='start from a save instead of the title screen')
+    parser.add_argument('--leaderboard', metavar='PATH', help='put endless runs on the leaderboard at PATH and report the write times')
+    parser.add_argument('--dungeon', action='store_true', help='go down the dungeon map and report how long its chunks took to make')
+    parser.add_argument('--check-prepare', action='store_true', help='check the run ends the same without making room scenes ahead of time')
+    parser.add_argument('--check-replay', action='store_true', help='record the run and check playing it back ends the same')
+    args = parser.parse_args()
+    if args.seed is not None and not -SEED_LIMIT <= args.seed < SEED_LIMIT: parser.error('seed {} does not fit in 64 bits'.format(args.seed))
+
+    if args.check_prepare:
+        first, second = check_prepare(args.seed, args.frames or 3600, args.every)
+        if not report_check('Prepared vs not prepared', first, second): sys.exit(1)
+        return
+    if args.check_replay:
+        first, second = check_replay(args.seed, args.frames or 3600, args.every)
+        if not report_check('Live vs replayed', first, second): sys.exit(1)
+        return
+
+    recording = script = None
+    if args.replay:
+        from replay import load_recording
+        recording = load_recording(args.replay)
+    elif args.keys:
+        script = cycle_keys([KEYS[key.strip().lower()] for key in args.keys.split(',')], args.every)
+    else:
+        script = random_keys(MASH, args.every, args.seed)
+
+    conditions = []
+    if args.until_scene: conditions.append(scene_is(args.until_scene))
+    if args.until_level: conditions.append(level_reached(args.until_level))
+    until = (lambda manager: any(condition(manager) for condition in conditions)) if conditions else None
+
+    frames = args.frames
+    if frames is None and until is None: frames = recording['frames'] if recording else 3600
+
+    resume = None
+    if args.resume:
+        if recording is not None: parser.error('--resume can not be used with --replay')
+        resume, load_time = load_save(args.resume)
+        if resume is None: parser.error('no save at {}'.format(args.resume))
+        print('Loaded {} in {:.3f} ms'.format(args.resume, load_time*1000))
+
+    harness = Harness(script, recording, args.seed, args.dirty, not args.no_prepare, not args.no_pool, args.allocations, args.save, resume, args.leaderboard, args.dungeon)
+    if args.frame_stats: FRAME_STATS.start()
+    if args.overlay: FRAME_STATS.toggle_overlay()
+    report(harness.run(frames, until))
+
+    if FRAME_STATS.enabled:
+        low_1, low_01 = FRAME_STATS.lows()
+        print('Busy frame lows: 1% {:.1f} fps, 0.1% {:.1f} fps'.format(low_1, low_01))
+    if args.frame_stats: FRAME_STATS.export(args.frame_stats)
+
+
+if __name__ == '__main__':
+    main()
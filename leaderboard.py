@@ -0,0 +1,227 @@
+'''
+Endless mode leaderboard, every run that ends in death is kept in an SQLite database
+Runs rank by level, then boss kills, then the shortest time. Pages are read with a cursor (the last run of the page)
+so no query ever reads more than a page, and runs are written in batches on a background thread
+Run it to print the board (python leaderboard.py --help)'''
+
+
+import sqlite3
+import threading
+import time
+from collections import deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter
+
+
+LEADERBOARD_FILE = 'leaderboard.db'
+PAGE_SIZE = 8
+
+RUN_COLUMNS = (
+    'name', 'level', 'atk', 'hp', 'defence', 'skill_points',
+    'weapon', 'weapon_atk', 'armour', 'armour_def', 'boss_kills', 'duration', 'finished',
+)
+Run = namedtuple('Run', ('id',) + RUN_COLUMNS)  # duration is seconds played, finished is a unix time
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    level INTEGER NOT NULL,
+    atk INTEGER NOT NULL,
+    hp INTEGER NOT NULL,
+    defence INTEGER NOT NULL,
+    skill_points INTEGER NOT NULL,
+    weapon TEXT,
+    weapon_atk INTEGER,
+    armour TEXT,
+    armour_def INTEGER,
+    boss_kills INTEGER NOT NULL,
+    duration REAL NOT NULL,
+    finished REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS runs_rank ON runs (level DESC, boss_kills DESC, duration);
+CREATE INDEX IF NOT EXISTS runs_player ON runs (name, level DESC, boss_kills DESC, duration);
+CREATE INDEX IF NOT EXISTS runs_finished ON runs (finished);
+'''
+
+# The rank order, the ids (in every index after the columns) break ties so every run has one place
+ORDER = 'ORDER BY level DESC, boss_kills DESC, duration, id'
+AFTER = 'level <= :level AND (level < :level OR boss_kills < :boss_kills OR (boss_kills = :boss_kills AND (duration > :duration OR (duration = :duration AND id > :id))))'
+BETTER = 'level > :level OR (level = :level AND (boss_kills > :boss_kills OR (boss_kills = :boss_kills AND duration < :duration)))'
+SELECT = 'SELECT id, {} FROM runs'.format(', '.join(RUN_COLUMNS))
+INSERT = 'INSERT INTO runs ({}) VALUES ({})'.format(', '.join(RUN_COLUMNS), ', '.join('?'*len(RUN_COLUMNS)))
+
+
+def since(days):
+    '''Unix time days ago, None (all time) if days is None'''
+    return time.time()-days*86400 if days is not None else None
+
+
+def new_run(name, player, boss_kills, duration, finished=None):
+    '''A run to record() from the player as it died, it has no id until it is written'''
+
+    weapon, armour = player.weapon, player.armour
+    return Run(
+        None, name, player.level, player.atk, player.max_hp, player.defence, player.skill_points,
+        weapon and weapon.name, weapon and weapon.amount, armour and armour.name, armour and armour.amount,
+        boss_kills, duration, time.time() if finished is None else finished,
+    )
+
+
+class Leaderboard:
+    '''
+    The runs database, record() queues a run and returns straight away
+    Queries run on the thread that calls them with its own connection (WAL lets them read while a batch is written)'''
+
+    def __init__(self, path=LEADERBOARD_FILE):
+        self.path = path
+        self.pool = ThreadPoolExecutor(1, thread_name_prefix='leaderboard')
+        self.lock = threading.Lock()
+        self.batch = []  # Runs waiting to be written
+        self.pending = None
+        self.writer = None  # Connection of the write thread
+        self.reader = None
+        self.written = 0
+        self.batches = 0
+        self.write_times = deque(maxlen=1000)
+
+        with self.connect() as connection:
+            connection.executescript(SCHEMA)
+        connection.close()
+
+    def connect(self):
+        connection = sqlite3.connect(self.path)
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute('PRAGMA synchronous=NORMAL')  # Safe with WAL, only the last batch can be lost in a power cut
+        return connection
+
+    def record(self, *runs):
+        '''Queues runs (see new_run) to be written, everything queued while a batch is being written goes in the next one'''
+
+        with self.lock:
+            start_batch = not self.batch
+            self.batch += [run[1:] for run in runs]
+            if start_batch and runs: self.pending = self.pool.submit(self.write)
+
+    def write(self):
+        '''Runs on the write thread, one transaction for the whole batch'''
+
+        with self.lock:
+            runs, self.batch = self.batch, []
+        if not runs: return
+
+        start = perf_counter()
+        if self.writer is None: self.writer = self.connect()
+        with self.writer:
+            self.writer.executemany(INSERT, runs)
+        self.written += len(runs)
+        self.batches += 1
+        self.write_times.append(perf_counter()-start)
+
+    def written_all(self):
+        '''True if every recorded run is in the database'''
+        return self.pending is None or self.pending.done()
+
+    def flush(self):
+        '''Waits for the queued runs to be written'''
+        if self.pending is not None: self.pending.result()
+
+    def query(self, sql, params=()):
+        if self.reader is None: self.reader = self.connect()
+        return self.reader.execute(sql, params)
+
+    @staticmethod
+    def window(where, since):
+        '''Adds the time window to the where clauses, since is a unix time or None for all time'''
+        return where + ['finished >= :since'] if since is not None else where
+
+    def page(self, after=None, since=None, size=PAGE_SIZE):
+        '''
+        The next size runs in rank order after the run after (None for the top), finished since since if given
+        Only the page is read, the runs_rank index is already in rank order'''
+
+        where = self.window([AFTER] if after is not None else [], since)
+        params = dict(after._asdict()) if after is not None else {}
+        params.update(since=since, size=size)
+        sql = '{} {} {} LIMIT :size'.format(SELECT, 'WHERE ' + ' AND '.join(where) if where else '', ORDER)
+        return [Run(*row) for row in self.query(sql, params)]
+
+    def top(self, count=10, since=None):
+        return self.page(None, since, count)
+
+    def best(self, name):
+        '''The best run of a player, None if they have none'''
+
+        row = self.query('{} WHERE name = ? {} LIMIT 1'.format(SELECT, ORDER), (name,)).fetchone()
+        return Run(*row) if row is not None else None
+
+    def rank(self, level, boss_kills, duration, since=None):
+        '''Place a run with these scores has (or would have) on the board'''
+
+        sql = 'SELECT COUNT(*) FROM runs WHERE ' + ' AND '.join(self.window(['({})'.format(BETTER)], since))
+        return self.query(sql, {'level': level, 'boss_kills': boss_kills, 'duration': duration, 'since': since}).fetchone()[0] + 1
+
+    def count(self, since=None):
+        sql = 'SELECT COUNT(*) FROM runs' + (' WHERE finished >= ?' if since is not None else '')
+        return self.query(sql, (since,) if since is not None else ()).fetchone()[0]
+
+    def stats(self):
+        '''Runs and batches written, and ms per batch on the write thread (mean and worst of the last 1000)'''
+
+        stats = {'runs': self.written, 'batches': self.batches}
+        if self.write_times:
+            stats['write_ms'] = round(sum(self.write_times) / len(self.write_times) * 1000, 4)
+            stats['worst_write_ms'] = round(max(self.write_times) * 1000, 4)
+        return stats
+
+    def close(self):
+        self.flush()
+        if self.writer is not None: self.pool.submit(self.writer.close).result()
+        self.pool.shutdown()
+        if self.reader is not None: self.reader.close()
+
+
+def main():
+    import argparse
+    import random
+
+    from rules import Player
+
+    parser = argparse.ArgumentParser(description='Prints the endless mode leaderboard')
+    parser.add_argument('--db', default=LEADERBOARD_FILE, metavar='PATH')
+    parser.add_argument('--top', type=int, default=10, help='runs to show')
+    parser.add_argument('--days', type=float, help='only runs from the last DAYS days')
+    parser.add_argument('--player', help="show a player's best run")
+    parser.add_argument('--fill', type=int, metavar='RUNS', help='add this many made up runs first (for trying out big boards)')
+    args = parser.parse_args()
+
+    board = Leaderboard(args.db)
+    if args.fill:
+        rng = random.Random()
+        start = perf_counter()
+        for _ in range(args.fill):
+            player = Player()
+            player.level = rng.randint(1, 60)
+            board.record(new_run('{}{}'.format(rng.choice(('ANNA', 'BEN', 'CHLOE', 'DAVID', 'EVE')), rng.randint(1, 999)), player, rng.randint(0, player.level//5), rng.uniform(60, 3600), time.time()-rng.uniform(0, 90*86400)))
+        board.flush()
+        print('Added {} runs in {:.1f} ms ({})'.format(args.fill, (perf_counter()-start)*1000, board.stats()))
+
+    start_time = since(args.days)
+    start = perf_counter()
+    runs = board.top(args.top, start_time)
+    taken = perf_counter()-start
+    print('Top {} of {} runs{} ({:.3f} ms)'.format(len(runs), board.count(start_time), ' in the last {} days'.format(args.days) if start_time is not None else '', taken*1000))
+    for place, run in enumerate(runs, 1):
+        print('{:>4}. {:<10} level {:<4} bosses {:<3} {:>6.0f}s  {} / {}'.format(place, run.name, run.level, run.boss_kills, run.duration, run.weapon or '-', run.armour or '-'))
+
+    if args.player:
+        start = perf_counter()
+        run = board.best(args.player)
+        taken = perf_counter()-start
+        if run is None: print('{} has no runs'.format(args.player))
+        else: print('Best run of {}: level {}, {} bosses, {:.0f}s, rank {} ({:.3f} ms)'.format(run.name, run.level, run.boss_kills, run.duration, board.rank(run.level, run.boss_kills, run.duration), taken*1000))
+    board.close()
+
+
+if __name__ == '__main__':
+    main()
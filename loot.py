@@ -0,0 +1,153 @@
+'''
+Items and the loot they come from
+Every name an item can have is made once here, an item only keeps which name it has (its code) and its stat,
+so rolling one doesn't build any strings and it holds no dict. Run it to time rolling (python loot.py --help)'''
+
+
+from rules import RNG, WEAPON_ADJ, WEAPON_END, WEAPON_DICTS, ARMOUR_ADJ, ARMOUR_END, ARMOUR_DICTS
+
+
+KINDS = ('weapon', 'armour')
+
+# How far an item's stat can be from the player's level, by where it was found (None is a chest room)
+STAT_RANGES = {None: (-3, 3), 'enemy': (-1, 3), 'boss': (1, 5)}
+
+
+class LootTable:
+    '''
+    One kind of item: its stat, its bases (sword, shield...) and every name and sprite
+    Names are base, adjective and ending, an item's code is the index of its name in names'''
+
+    __slots__ = ('kind', 'stat', 'bases', 'adjs', 'ends', 'per_base', 'base_range', 'adj_range', 'end_range', 'names', 'sprites')
+
+    def __init__(self, kind, stat, sprites, adjs, ends):
+        self.kind = kind
+        self.stat = stat
+        self.bases = tuple(sprites)
+        self.adjs = adjs
+        self.ends = ends
+        self.per_base = len(adjs) * len(ends)
+        # Rolls pick an index from each of these
+        self.base_range, self.adj_range, self.end_range = range(len(self.bases)), range(len(adjs)), range(len(ends))
+        self.names = tuple('{} Of {} {}'.format(base, adj, end) for base in self.bases for adj in adjs for end in ends)
+        self.sprites = tuple(sprites[base] for base in self.bases)
+
+    def code(self, base, adj, end):
+        '''Code of the item named base Of adj end'''
+        return (self.bases.index(base)*len(self.adjs) + self.adjs.index(adj)) * len(self.ends) + self.ends.index(end)
+
+
+TABLES = {
+    'weapon': LootTable('weapon', 'atk', WEAPON_DICTS, WEAPON_ADJ, WEAPON_END),
+    'armour': LootTable('armour', 'def', ARMOUR_DICTS, ARMOUR_ADJ, ARMOUR_END),
+}
+
+
+class Item:
+    '''
+    A weapon or armour, amount is its atk or def
+    The name and sprite are looked up from its table when shown'''
+
+    __slots__ = ('kind', 'code', 'amount')
+
+    def __init__(self, kind, code, amount):
+        self.kind = kind
+        self.code = code
+        self.amount = amount
+
+    @property
+    def name(self):
+        '''Full name, e.g. Sword Of Piercing Time'''
+        return TABLES[self.kind].names[self.code]
+
+    @property
+    def sprite(self):
+        '''Rect of its base on the weapon or armour sprite sheet'''
+
+        table = TABLES[self.kind]
+        return table.sprites[self.code // table.per_base]
+
+    @property
+    def stat(self):
+        '''atk or def'''
+        return TABLES[self.kind].stat
+
+    def __eq__(self, other):
+        if not isinstance(other, Item): return NotImplemented
+        return (self.kind, self.code, self.amount) == (other.kind, other.code, other.amount)
+
+    def __hash__(self):
+        return hash((self.kind, self.code, self.amount))
+
+    def __repr__(self):
+        return 'Item({!r}, {!r}, {})'.format(self.kind, self.name, self.amount)
+
+
+def roll_item(level, type_=None, rng=None):
+    '''
+    Random item from a chest, type_ is None (chest room), 'enemy' or 'boss' (after a battle)
+    Returns the item type ('weapon' or 'armour') and the item'''
+
+    if rng is None: rng = RNG.loot
+
+    kind = rng.choice(KINDS)
+    table = TABLES[kind]
+    # Picking from ranges takes the same random numbers as picking the names did, so seeds give the same items
+    base = rng.choice(table.base_range)
+    low, high = STAT_RANGES[type_]
+    amount = rng.randint(level+low, level+high)
+    if amount < 1: amount = 1
+    adj = rng.choice(table.adj_range)
+    end = rng.choice(table.end_range)
+    return kind, Item(kind, base*table.per_base + adj*len(table.ends) + end, amount)
+
+
+def roll_items(count, level, type_=None, rng=None):
+    '''
+    count items rolled one after the other, the same items (and random numbers) as calling roll_item count times
+    For simulations, it picks indexes with randrange (what choice and randint use) and skips building a range each time'''
+
+    if rng is None: rng = RNG.loot
+
+    randrange = rng.randrange
+    low, high = STAT_RANGES[type_]
+    low, high = level+low, level+high+1
+    tables = [(kind, len(table.bases), len(table.adjs), len(table.ends), table.per_base) for kind, table in TABLES.items()]
+    kinds = len(tables)
+
+    items = []
+    append = items.append
+    for _ in range(count):
+        kind, bases, adjs, ends, per_base = tables[randrange(kinds)]
+        base = randrange(bases)
+        amount = randrange(low, high)
+        if amount < 1: amount = 1
+        append(Item(kind, base*per_base + randrange(adjs)*ends + randrange(ends), amount))
+    return items
+
+
+def main():
+    import argparse
+    import random
+    import sys
+    from time import perf_counter
+
+    parser = argparse.ArgumentParser(description='Times rolling items in bulk')
+    parser.add_argument('--n', type=int, default=1000000, help='items to roll')
+    parser.add_argument('--level', type=int, default=10)
+    parser.add_argument('--type', choices=('chest', 'enemy', 'boss'), default='chest')
+    parser.add_argument('--seed', type=int)
+    args = parser.parse_args()
+    type_ = None if args.type == 'chest' else args.type
+
+    start = perf_counter()
+    items = roll_items(args.n, args.level, type_, random.Random(args.seed))
+    taken = perf_counter()-start
+
+    best = max(items, key=lambda item: item.amount)
+    print('{} {} items at level {} in {:.2f}s ({:.3f} us each), {} bytes each'.format(args.n, args.type, args.level, taken, taken/args.n*1e6, sys.getsizeof(best)))
+    print('Best: {} ({} {})'.format(best.name, best.stat.upper(), best.amount))
+
+
+if __name__ == '__main__':
+    main()
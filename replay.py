@@ -0,0 +1,173 @@
+'''
+Recording and playing back games
+A recording is the RNG seed and the key presses with the frame they happened on, every frame after that follows from them
+The replayer keeps copies of the game state every so often (keyframes) so it can seek without playing from the start
+Scenes running a script (see Scheduler) can't be copied, so a keyframe waits until the current scene isn't'''
+
+
+import copy
+import copyreg
+import json
+
+import pygame
+
+from dependencies import ASSETS, ATLASES, EVENTS, RNG, SPRITE_ATLAS, TEXT_CACHE, DirtySurface
+
+
+RECORDING_VERSION = 1
+KEYFRAME_EVERY = 300  # Frames, 5 seconds of play at 60 fps
+
+
+class _Shared:
+    '''Stands in for an object that keyframes share instead of copying'''
+
+    def __init__(self, obj):
+        self.obj = obj
+
+    def __deepcopy__(self, memo):
+        return self
+
+
+def _unwrap(shared):
+    return shared.obj
+
+
+def _reduce_shared(obj):
+    return _unwrap, (_Shared(obj),)
+
+
+def _reduce_surface(surface):
+    return _unwrap, (_Shared(surface.copy()),)
+
+
+# Fonts and sounds never change so keyframes keep them, surfaces get copied unless they are assets (see Replayer.shared)
+copyreg.pickle(pygame.font.Font, _reduce_shared)
+copyreg.pickle(pygame.mixer.Sound, _reduce_shared)
+copyreg.pickle(pygame.Surface, _reduce_surface)
+
+
+def save_recording(path, seed, events, frames, dungeon=False):
+    '''Writes a recording as JSON, events are (frame, type, key), dungeon is whether the game was on the dungeon map'''
+
+    with open(path, 'w') as file:
+        json.dump({'version': RECORDING_VERSION, 'seed': seed, 'frames': frames, 'dungeon': dungeon, 'events': [list(event) for event in events]}, file)
+
+
+def load_recording(path):
+    with open(path) as file:
+        recording = json.load(file)
+
+    if recording.get('version') != RECORDING_VERSION:
+        raise ValueError('{} is a version {} recording, expected version {}'.format(path, recording.get('version'), RECORDING_VERSION))
+    return recording
+
+
+class Replayer:
+    '''
+    Plays a recording through a Manager, make the Manager after seeding RNG with the recording seed
+    step() plays one frame without drawing it to the display or waiting, seek() jumps to any frame'''
+
+    def __init__(self, manager, recording, keyframe_every=KEYFRAME_EVERY):
+        self.manager = manager
+        self.events = recording['events']
+        self.frames = recording['frames']
+        self.keyframe_every = keyframe_every
+        self.keyframes = {}
+        self.keyframe_due = False
+
+        EVENTS.frame = 0
+        EVENTS.replay(self.events, self.frames)
+        self.keyframe()
+
+    @property
+    def frame(self):
+        return EVENTS.frame
+
+    def shared(self):
+        '''Memo for deepcopy, objects every keyframe shares with the live game'''
+
+        shared = [self.manager, self.manager.screen, self.manager.weapon_sheet, self.manager.armour_sheet, self.manager.battleicon_sheet, self.manager.enemies_sheet]
+        shared += [getattr(RNG, name) for name in RNG.NAMES]
+
+        # Assets are shared with everything, scenes copy them before changing them
+        shared += list(ASSETS.images.values()) + list(TEXT_CACHE.surfaces.values())
+        shared += SPRITE_ATLAS.pages + list(SPRITE_ATLAS.sprites.values())
+        shared += [atlas.atlas for atlas in ATLASES.values()]
+        return {id(obj): obj for obj in shared}
+
+    def keyframe(self):
+        '''Copies the game state at this frame, returns False if the current scene is running a script'''
+
+        mgr = self.manager
+        scripts = getattr(mgr.current_scene, 'scripts', None)
+        if scripts is not None and scripts.running: return False
+        state = {
+            'player': mgr.player,
+            'scene': mgr.scene,
+            'current_scene': mgr.current_scene,
+            'status': mgr.status,
+            'level_type': getattr(mgr, 'level_type', None),
+            'name': mgr.name,
+            'boss_kills': mgr.boss_kills,
+            'map_pos': mgr.map_pos,
+            'map_choices': mgr.map_choices,
+        }
+        self.keyframes[self.frame] = (copy.deepcopy(state, self.shared()), RNG.getstate())
+        return True
+
+    def restore(self, frame):
+        '''Puts the game back to the keyframe at frame'''
+
+        state, rng_state = self.keyframes[frame]
+        state = copy.deepcopy(state, self.shared())  # The keyframe has to stay as it was for the next seek
+
+        mgr = self.manager
+        mgr.player = state['player']
+        mgr.scene = state['scene']
+        mgr.current_scene = state['current_scene']
+        mgr.status = state['status']
+        mgr.level_type = state['level_type']
+        mgr.name = state['name']
+        mgr.boss_kills = state['boss_kills']
+        mgr.map_pos = state['map_pos']
+        mgr.map_choices = state['map_choices']
+        mgr.prepared = {}
+        mgr.prepared_for = None
+        RNG.setstate(rng_state)
+
+        EVENTS.frame = frame
+        EVENTS.replay(self.events, self.frames)
+        self.keyframe_due = False
+
+        # What was last drawn has nothing to do with the restored state
+        for surface in [mgr.screen] + list(vars(mgr.current_scene).values()):
+            if isinstance(surface, DirtySurface): surface.mark_dirty()
+
+    def step(self):
+        '''Plays one frame, returns False at the end of the recording'''
+
+        if self.frame >= self.frames: return False
+
+        # The same steps as Manager.frame, without drawing to the display
+        self.manager.loop_manager()
+        if not self.manager.loaded: self.manager.finish_loading()
+        self.manager.prepare_rooms()
+        if isinstance(self.manager.screen, DirtySurface): self.manager.screen.end_frame()
+        EVENTS.next_frame()
+
+        if self.frame % self.keyframe_every == 0: self.keyframe_due = True
+        if self.keyframe_due and (self.frame in self.keyframes or self.keyframe()): self.keyframe_due = False
+        return True
+
+    def seek(self, frame):
+        '''Jumps to frame, from the closest keyframe before it'''
+
+        frame = max(0, min(frame, self.frames))
+        start = max(keyframe for keyframe in self.keyframes if keyframe < frame or keyframe == 0)  # At least a frame back so the screen gets drawn
+        if not start <= self.frame <= frame: self.restore(start)
+
+        while self.frame < frame:
+            self.step()
+
+    def run_to_end(self):
+        while self.step(): pass
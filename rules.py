@@ -0,0 +1,152 @@
+'''
+Run rules without any rendering: the player, rooms, heals and dying (items are in loot.py)
+The scenes and the run simulator (simulation.py) both use these'''
+
+
+import random
+
+
+__all__ = [
+    'WEAPON_NAME', 'WEAPON_ADJ', 'WEAPON_END', 'ARMOUR_NAME', 'ARMOUR_ADJ', 'ARMOUR_END', 'ENEMY_NAME', 'ENEMY_ADJ',
+    'WEAPON_DICTS', 'ARMOUR_DICTS', 'ROOM_NAMES', 'BOSS_CHANCE', 'FINAL_LEVEL', 'SEED_LIMIT',
+    'RandomStreams', 'RNG', 'Player', 'room_names', 'is_boss', 'heal_amount', 'boost', 'die',
+]
+
+
+WEAPON_NAME = ('Sword', 'Staff', 'Shuriken', 'Broomstick', 'Knife', 'Pan', 'Glass Bottle')
+WEAPON_ADJ = ('Thunderous', 'Unstoppable', 'Piercing', 'Formidable', 'Inconceivable')
+WEAPON_END = ('Power', 'Vengeance', 'Strength', 'Bravery', 'Courage', 'Soul', 'Space', 'Mind', 'Time', 'Reality', 'Death', 'Life')
+ARMOUR_NAME = ('Shield', 'Wall', 'Pillow', 'Turtle Shell', 'Car Door')
+ARMOUR_ADJ = ('Iron', 'Unbreakable', 'Mighty', 'Unweilding', 'Defensive')
+ARMOUR_END = ('Defence', 'Safety', 'Might', 'Protection', 'Prowess')
+ENEMY_NAME = ('Goblin', 'Ogre', 'Pixie', 'Goomba', 'Gremlin')
+ENEMY_ADJ = ('Stinky', 'Green', 'Mischievious', 'Naughty', 'Short', 'Ugly', 'Cruel', 'Slimy', 'Evil')
+
+# Items keep their sprite rect on the sprite sheet
+WEAPON_DICTS = {
+    'Sword': [0, 0, 16, 16],
+    'Staff': [16, 0, 16, 16],
+    'Knife': [32, 0, 16, 16],
+    'Glass Bottle': [48, 0, 16, 16],
+    'Broomstick': [64, 0, 16, 16],
+    'Pan': [80, 0, 16, 16],
+    'Shuriken': [96, 0, 16, 16]
+}
+ARMOUR_DICTS = {
+    'Shield': [0, 0, 16, 16],
+    'Wall': [16, 0, 16, 16],
+    'Pillow': [32, 0, 16, 16],
+    'Turtle Shell': [48, 0, 16, 16],
+    'Car Door': [64, 0, 16, 16],
+}
+
+ROOM_NAMES = ('HEAL ROOM', 'ENEMY ROOM', 'CHEST ROOM')
+BOSS_CHANCE = {'Story': 1/25, 'Endless': 1/2}
+FINAL_LEVEL = 99
+SEED_LIMIT = 2**63  # Saves keep the seed as a 64 bit signed int (see save.MANAGER)
+
+
+class RandomStreams:
+    '''
+    A seeded random generator for each part of the game, so a run can be played back exactly
+    Streams are reseeded in place, so holding on to one (or its methods) is fine'''
+
+    NAMES = ('rooms', 'enemies', 'loot', 'heals', 'flavour')
+
+    def __init__(self, seed=None):
+        for name in self.NAMES:
+            setattr(self, name, random.Random())
+        self.seed(seed)
+
+    def seed(self, seed=None):
+        '''Seeds every stream from one seed, a random one if None, ValueError if it doesn't fit in a save'''
+
+        if seed is None: seed = random.randrange(2**32)
+        if not -SEED_LIMIT <= seed < SEED_LIMIT: raise ValueError('seed {} does not fit in 64 bits'.format(seed))
+        self.master = seed
+        for name in self.NAMES:
+            getattr(self, name).seed('{}:{}'.format(seed, name))
+
+    def getstate(self):
+        return {name: getattr(self, name).getstate() for name in self.NAMES}
+
+    def setstate(self, state):
+        for name in self.NAMES:
+            getattr(self, name).setstate(state[name])
+
+
+RNG = RandomStreams()
+
+
+class Player:
+    '''
+    Player class with all player details
+    weapon and armour are loot.Items or None'''
+
+    __slots__ = ('skill_points', 'atk', 'hp', 'max_hp', 'defence', 'weapon', 'armour', 'level')
+
+    def __init__(self):
+        self.skill_points = 35
+        self.atk = 1
+        self.hp = 1
+        self.max_hp = 1
+        self.defence = 1
+        self.weapon = None
+        self.armour = None
+        self.level = 0
+
+    @property
+    def sum(self):
+        '''Sum of all skills'''
+        return self.atk + self.hp + self.defence
+
+    def change_hp(self, change):
+        '''Changes the hp, up to max_hp'''
+        self.hp += change
+        if self.hp > self.max_hp: self.hp = self.max_hp
+
+
+def room_names(rng=None):
+    '''Names of three random rooms, very rarely the middle one is a boost room'''
+
+    if rng is None: rng = RNG.rooms
+
+    rooms = (rng.choice(ROOM_NAMES), rng.choice(ROOM_NAMES), rng.choice(ROOM_NAMES))
+
+    if round(rng.random(), 2) <= 1/100:
+        rooms = (rng.choice(ROOM_NAMES), 'BOOST ROOM', rng.choice(ROOM_NAMES))
+    return rooms
+
+
+def is_boss(mode, rng=None):
+    '''Whether an enemy room has a boss in it, mode is 'Story' or 'Endless' '''
+
+    if rng is None: rng = RNG.enemies
+    return round(rng.random(), 2) <= BOSS_CHANCE[mode]
+
+
+def heal_amount(player, rng=None):
+    '''HP a heal room gives back, nothing if already at max hp'''
+
+    if rng is None: rng = RNG.heals
+
+    if player.hp == player.max_hp: return 0
+    return rng.randint(int(player.max_hp*0.5), int(player.max_hp*0.75))
+
+
+def boost(player):
+    '''A boost room gives 10 skill points'''
+    player.skill_points += 10
+
+
+def die(player):
+    '''Dying resets the player but gives skill points for the level reached (up to 5)'''
+
+    player.skill_points += min(player.level, 5)
+    player.level = 0
+    player.atk = 1
+    player.hp = 1
+    player.max_hp = 1
+    player.defence = 1
+    player.weapon = None
+    player.armour = None
@@ -0,0 +1,236 @@
+'''
+Saving and resuming runs
+A save is the player, the manager's fields (with the run so far, for the leaderboard) and the room being entered, with the RNG streams as they were just before
+its scene was made, so resuming makes the exact same scene again (see Manager.enter)
+The file is packed binary: a header (magic, version, checksum) and then the fields in a fixed order'''
+
+
+import os
+import struct
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter
+
+from dungeon import Dungeon
+from loot import Item
+from rules import RNG
+
+
+SAVE_FILE = 'snungeon.sav'
+SAVE_MAGIC = b'SNSV'
+SAVE_VERSION = 5
+SAVE_HEADER = struct.Struct('<4sHI')  # Magic, version, crc32 of the rest
+
+PLAYER = struct.Struct('<6i')  # skill_points, atk, hp, max_hp, defence, level
+PLAYER_FIELDS = ('skill_points', 'atk', 'hp', 'max_hp', 'defence', 'level')
+ITEM = struct.Struct('<Hi')  # Code (its name and sprite, see loot.LootTable), stat
+MANAGER = struct.Struct('<BBqId')  # scene, status, RNG seed, boss kills and seconds played this run
+MAP = struct.Struct('<Bqq')  # Whether the run is on the dungeon map (made from the seed) and where the player is on it
+RNG_STATE = struct.Struct('<B625IBd')  # Version, Mersenne Twister words and position, whether there is a gauss_next and it
+ITEM_SLOTS = ('weapon', 'armour')
+
+# Kinds of scene a save can resume into, with Manager.enter's arguments after them
+SCENE_KINDS = ('room', 'chest', 'dead', 'selection', 'final', 'won')
+
+
+def _pack_str(value):
+    data = value.encode()
+    return struct.pack('<B', len(data)) + data
+
+
+def _unpack_str(data, offset):
+    length = data[offset]
+    return data[offset+1:offset+1+length].decode(), offset+1+length
+
+
+def snapshot(manager, kind, args):
+    '''The state to save for entering a room, take it before the room's scene is made (it is only plain values and items, which never change)'''
+
+    player = manager.player
+    return {
+        'player': tuple(getattr(player, field) for field in PLAYER_FIELDS),
+        'items': {slot: getattr(player, slot) for slot in ITEM_SLOTS},
+        'scene': manager.scene,
+        'status': manager.status,
+        'level_type': getattr(manager, 'level_type', None),
+        'name': manager.name,
+        'boss_kills': manager.boss_kills,
+        'run_time': manager.run_time(),
+        'map_pos': manager.map_pos if manager.dungeon is not None else None,
+        'room': (kind,) + tuple(args),
+        'seed': RNG.master,
+        'rng': RNG.getstate(),
+    }
+
+
+def encode_save(state):
+    '''Packs a snapshot into the bytes of a save file'''
+
+    parts = [PLAYER.pack(*state['player'])]
+    for slot in ITEM_SLOTS:
+        item = state['items'][slot]
+        if item is None: parts.append(b'\0')
+        else: parts += [b'\1', ITEM.pack(item.code, item.amount)]
+
+    parts.append(MANAGER.pack(state['scene'], state['status'], state['seed'], state['boss_kills'], state['run_time']))
+    parts.append(MAP.pack(state['map_pos'] is not None, *(state['map_pos'] or (0, 0))))
+    parts.append(_pack_str(state['level_type'] or ''))
+    parts.append(_pack_str(state['name'] or ''))
+
+    kind, *args = state['room']
+    parts.append(struct.pack('<BB', SCENE_KINDS.index(kind), len(args)))
+    parts += [_pack_str(arg or '') for arg in args]
+
+    for name in RNG.NAMES:
+        version, internal, gauss_next = state['rng'][name]
+        parts.append(RNG_STATE.pack(version, *internal, gauss_next is not None, gauss_next or 0.0))
+
+    body = b''.join(parts)
+    return SAVE_HEADER.pack(SAVE_MAGIC, SAVE_VERSION, zlib.crc32(body)) + body
+
+
+def decode_save(data):
+    '''Unpacks the bytes of a save file into a snapshot, raises ValueError if they aren't a save this version can load'''
+
+    if len(data) < SAVE_HEADER.size: raise ValueError('not a save, too short')
+    magic, version, checksum = SAVE_HEADER.unpack_from(data)
+    if magic != SAVE_MAGIC or version != SAVE_VERSION:
+        raise ValueError('not a version {} save (version {})'.format(SAVE_VERSION, version if magic == SAVE_MAGIC else None))
+    body = memoryview(data)[SAVE_HEADER.size:]
+    if zlib.crc32(body) != checksum: raise ValueError('save is corrupted')
+    body = bytes(body)
+
+    state = {'player': PLAYER.unpack_from(body), 'items': {}}
+    offset = PLAYER.size
+    for slot in ITEM_SLOTS:
+        offset += 1
+        if not body[offset-1]:
+            state['items'][slot] = None
+            continue
+        code, amount = ITEM.unpack_from(body, offset)
+        offset += ITEM.size
+        state['items'][slot] = Item(slot, code, amount)
+
+    state['scene'], state['status'], state['seed'], state['boss_kills'], state['run_time'] = MANAGER.unpack_from(body, offset)
+    offset += MANAGER.size
+    on_map, x, y = MAP.unpack_from(body, offset)
+    state['map_pos'] = (x, y) if on_map else None
+    offset += MAP.size
+    level_type, offset = _unpack_str(body, offset)
+    state['level_type'] = level_type or None
+    name, offset = _unpack_str(body, offset)
+    state['name'] = name or None
+
+    kind, count = struct.unpack_from('<BB', body, offset)
+    offset += 2
+    args = []
+    for _ in range(count):
+        arg, offset = _unpack_str(body, offset)
+        args.append(arg or None)
+    state['room'] = (SCENE_KINDS[kind],) + tuple(args)
+
+    state['rng'] = {}
+    for name in RNG.NAMES:
+        version, *internal, has_gauss, gauss_next = RNG_STATE.unpack_from(body, offset)
+        offset += RNG_STATE.size
+        state['rng'][name] = (version, tuple(internal), gauss_next if has_gauss else None)
+    return state
+
+
+def load_save(path=SAVE_FILE):
+    '''The snapshot in a save file and how long loading it took in seconds, None if there is no save'''
+
+    start = perf_counter()
+    try:
+        with open(path, 'rb') as file:
+            data = file.read()
+    except FileNotFoundError:
+        return None, 0.0
+
+    try:
+        state = decode_save(data)
+    except (ValueError, struct.error, UnicodeDecodeError) as error:
+        raise ValueError('{}: {}'.format(path, error)) from None
+    return state, perf_counter()-start
+
+
+def apply_save(manager, state):
+    '''Puts the player, the manager fields and RNG back as they were, then makes the saved room's scene'''
+
+    player = manager.player
+    for field, value in zip(PLAYER_FIELDS, state['player']):
+        setattr(player, field, value)
+    for slot, item in state['items'].items():
+        setattr(player, slot, item)
+
+    manager.scene = state['scene']
+    manager.status = state['status']
+    manager.level_type = state['level_type']
+    manager.name = state['name']
+    manager.boss_kills = state['boss_kills']
+    manager.run_started = perf_counter()-state['run_time']
+    manager.dungeon = Dungeon(state['seed']) if state['map_pos'] is not None else None
+    manager.map_pos = state['map_pos']
+    manager.drop_prepared()
+
+    RNG.seed(state['seed'])
+    RNG.setstate(state['rng'])
+    kind, *args = state['room']
+    manager.enter(kind, *args, save=False)
+
+
+class Saver:
+    '''
+    Writes saves on a background thread, so a room transition only pays for the snapshot
+    Each save is written next to the file and renamed over it, the old save stays whole if writing fails part way
+    Saves are written in order, the last one wins'''
+
+    def __init__(self, path=SAVE_FILE):
+        self.path = path
+        self.pool = ThreadPoolExecutor(1, thread_name_prefix='save')
+        self.pending = None
+        self.saves = 0
+        self.errors = 0
+        self.snapshot_times = deque(maxlen=1000)
+        self.write_times = deque(maxlen=1000)
+
+    def save(self, manager, kind, args):
+        '''Snapshots the manager as it enters a room and queues the write'''
+
+        start = perf_counter()
+        state = snapshot(manager, kind, args)
+        self.snapshot_times.append(perf_counter()-start)
+        self.pending = self.pool.submit(self.write, state)
+
+    def write(self, state):
+        '''Runs on the save thread'''
+
+        start = perf_counter()
+        temp = self.path + '.tmp'
+        try:
+            data = encode_save(state)  # Before opening the file, so a state that doesn't pack leaves it alone
+            with open(temp, 'wb') as file:
+                file.write(data)
+                file.flush()
+                os.fsync(file.fileno())
+            os.replace(temp, self.path)
+        except (OSError, struct.error):
+            self.errors += 1
+            return
+        self.saves += 1
+        self.write_times.append(perf_counter()-start)
+
+    def flush(self):
+        '''Waits for the queued saves to be written'''
+        if self.pending is not None: self.pending.result()
+
+    def stats(self):
+        '''Save counts, and ms taken on the game thread (snapshot) and the save thread (write), mean and worst of the last 1000'''
+
+        stats = {'saves': self.saves, 'errors': self.errors}
+        for name, times in (('snapshot', self.snapshot_times), ('write', self.write_times)):
+            if times:
+                stats[name+'_ms'] = round(sum(times) / len(times) * 1000, 4)
+                stats['worst_'+name+'_ms'] = round(max(times) * 1000, 4)
+        return stats
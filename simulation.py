@@ -0,0 +1,243 @@
+'''
+Headless simulator for whole story/endless runs, no pygame needed
+Plays the same rules as Manager.story_loop and Manager.endless_loop with a pluggable player policy'''
+
+
+import random
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from os import cpu_count
+from time import perf_counter
+
+from combat import Battle, FIGHT, SHARPEN, DEFEND, HEAL, MAX_BOOST
+from loot import roll_item
+from rules import *
+
+
+class Policy:
+    '''
+    What a simulated player does, the default plays sensibly
+    Subclass and override any of the choices'''
+
+    def allocate(self, player):
+        '''Spends the free skill points (skill and boost scenes) one at a time on atk, hp then defence'''
+
+        skill = 0
+        while player.sum < player.skill_points:
+            stat = ('atk', 'hp', 'defence')[skill % 3]
+            setattr(player, stat, getattr(player, stat)+1)
+            if stat == 'hp': player.max_hp = player.hp
+            skill += 1
+
+    def choose_room(self, player, rooms, rng):
+        '''Index of the room to enter'''
+
+        if 'BOOST ROOM' in rooms: return rooms.index('BOOST ROOM')
+        if player.hp < player.max_hp/2 and 'HEAL ROOM' in rooms: return rooms.index('HEAL ROOM')
+        if 'CHEST ROOM' in rooms: return rooms.index('CHEST ROOM')
+        return rng.randrange(len(rooms))
+
+    def battle_choice(self, battle, rng):
+        '''FIGHT, SHARPEN, DEFEND or HEAL'''
+        return FIGHT
+
+    def replace_item(self, player, item_type, item):
+        '''Whether to swap the equipped item for the new one'''
+
+        return item.amount > getattr(player, item_type).amount
+
+
+class SharpenPolicy(Policy):
+    '''Sharpens to the max before fighting'''
+
+    def battle_choice(self, battle, rng):
+        return SHARPEN if battle.extra_atk < MAX_BOOST else FIGHT
+
+
+class RandomPolicy(Policy):
+    '''Picks rooms and battle moves at random, like someone mashing keys'''
+
+    def choose_room(self, player, rooms, rng):
+        return rng.randrange(len(rooms))
+
+    def battle_choice(self, battle, rng):
+        return rng.choice((FIGHT, SHARPEN, DEFEND, HEAL))
+
+
+POLICIES = {'default': Policy, 'sharpen': SharpenPolicy, 'random': RandomPolicy}
+
+
+def play_battle(player, type_, policy, rng):
+    '''Plays one battle, returns True if the player won'''
+    return fight(Battle(player, type_, rng.randint), policy, rng)
+
+
+def fight(battle, policy, rng):
+    '''Plays a battle that has been set up to the end, returns True if the player won'''
+
+    while True:
+        move = policy.battle_choice(battle, rng)
+        if move == FIGHT: battle.fight()
+        elif move == SHARPEN: battle.sharpen()
+        elif move == DEFEND: battle.defend()
+        elif move == HEAL: battle.heal()
+
+        if battle.won: return True
+        battle.enemy_attack()
+        if battle.lost: return False
+
+
+def open_chest(player, type_, policy, rng):
+    '''Rolls an item and equips it if the slot is empty or the policy wants it'''
+
+    item_type, item = roll_item(player.level, type_, rng)
+    if getattr(player, item_type) is None or policy.replace_item(player, item_type, item):
+        setattr(player, item_type, item)
+
+
+def play_run(mode='Story', policy=None, seed=None, max_rooms=10000, max_deaths=None):
+    '''
+    Plays a whole run from the skill scene to the end
+    Story runs end when won, endless runs when the player first dies (unless max_deaths says otherwise)
+    Returns a dict describing the run'''
+
+    rng = random.Random(seed)
+    if policy is None: policy = Policy()
+    if max_deaths is None and mode == 'Endless': max_deaths = 1
+
+    player = Player()
+    policy.allocate(player)
+    player.level = 1
+
+    status = 0  # Same as Manager.status, 1 after the final boss has been fought
+    next_room = None
+    run = {'won': False, 'max_level': 1, 'rooms': 0, 'deaths': [], 'boss_kills': 0}
+
+    while run['rooms'] < max_rooms:
+        run['rooms'] += 1
+
+        if next_room is None:
+            rooms = room_names(rng)
+            room = rooms[policy.choose_room(player, rooms, rng)]
+        else:
+            room, next_room = next_room, None
+
+        if room == 'HEAL ROOM':
+            player.change_hp(heal_amount(player, rng))
+        elif room == 'BOOST ROOM':
+            boost(player)
+            policy.allocate(player)
+        elif room == 'CHEST ROOM':
+            open_chest(player, None, policy, rng)
+        elif room in ('ENEMY ROOM', 'FINAL'):
+            if room == 'FINAL':
+                type_ = 'final'
+                battle = Battle(player, type_, rng.randint)
+                player.level += 1  # Like Manager.enter('final'), the boss is rolled for the level before it
+                won = fight(battle, policy, rng)
+            else:
+                type_ = 'boss' if is_boss(mode, rng) else None
+                won = play_battle(player, type_, policy, rng)
+
+            if won:
+                if type_ == 'boss': run['boss_kills'] += 1
+                open_chest(player, 'boss' if type_ == 'boss' else 'enemy', policy, rng)
+            else:
+                run['deaths'].append((type_ or 'normal', player.level))
+                die(player)
+                policy.allocate(player)
+                if max_deaths is not None and len(run['deaths']) >= max_deaths: break
+
+        # Next selection scene
+        player.level += 1
+        if mode == 'Story':
+            if player.level >= FINAL_LEVEL and status == 0:
+                next_room = 'FINAL'
+                status = 1
+            elif player.level >= 100 and status == 1:
+                run['won'] = True
+                break
+        run['max_level'] = max(run['max_level'], player.level)
+
+    run['final_level'] = player.level
+    run['stats'] = (player.atk, player.max_hp, player.defence)
+    return run
+
+
+def play_runs(mode, policy_name, seeds, max_rooms, max_deaths):
+    '''Worker job: plays a run for each seed'''
+
+    policy = POLICIES[policy_name]()
+    return [play_run(mode, policy, seed, max_rooms, max_deaths) for seed in seeds]
+
+
+def simulate_runs(n, mode='Story', policy='default', workers=None, seed=0, max_rooms=10000, max_deaths=None, chunk_size=50):
+    '''
+    Plays n runs spread over a process pool and aggregates them
+    Every run gets its own seed (seed*n + run), so results don't depend on the number of workers'''
+
+    workers = workers or cpu_count() or 1
+    seeds = [seed*n + i for i in range(n)]
+    chunks = [seeds[i:i+chunk_size] for i in range(0, n, chunk_size)]
+
+    start = perf_counter()
+    runs = []
+    if workers == 1:
+        for chunk in chunks: runs += play_runs(mode, policy, chunk, max_rooms, max_deaths)
+    else:
+        with ProcessPoolExecutor(workers) as pool:
+            for result in pool.map(play_runs, *zip(*[(mode, policy, chunk, max_rooms, max_deaths) for chunk in chunks])):
+                runs += result
+    taken = perf_counter()-start
+
+    deaths = Counter()
+    for run in runs:
+        for type_, level in run['deaths']: deaths[(type_, level//10*10)] += 1
+
+    return {
+        'runs': n,
+        'won': sum(run['won'] for run in runs),
+        'max_level': Counter(run['max_level'] for run in runs),
+        'deaths': deaths,
+        'boss_kills': sum(run['boss_kills'] for run in runs),
+        'seconds': taken,
+        'runs_per_second_per_core': n / taken / workers,
+        'workers': workers,
+    }
+
+
+def report(result):
+    '''Prints the aggregated results'''
+
+    print('{} runs on {} workers in {:.2f}s ({:.1f} runs/s per core)'.format(result['runs'], result['workers'], result['seconds'], result['runs_per_second_per_core']))
+    print('Won: {} ({:.2%})  Boss kills: {}'.format(result['won'], result['won']/result['runs'], result['boss_kills']))
+
+    print('\nLevel reached:')
+    buckets = Counter()
+    for level, count in result['max_level'].items(): buckets[level//10*10] += count
+    for bucket in sorted(buckets):
+        print('  {:>3}-{:<3} {:>7}  {}'.format(bucket, bucket+9, buckets[bucket], '#'*round(buckets[bucket]/result['runs']*50)))
+
+    print('\nDeaths (enemy, levels):')
+    for (type_, bucket), count in sorted(result['deaths'].items(), key=lambda item: -item[1]):
+        print('  {:<7} {:>3}-{:<3} {:>7}'.format(type_, bucket, bucket+9, count))
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Simulates whole runs to check the balance')
+    parser.add_argument('--n', type=int, default=1000, help='number of runs')
+    parser.add_argument('--mode', choices=('Story', 'Endless'), default='Story')
+    parser.add_argument('--policy', choices=tuple(POLICIES), default='default')
+    parser.add_argument('--workers', type=int, help='processes to use, all cores by default')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--max-rooms', type=int, default=10000, help='rooms before a run is given up on')
+    parser.add_argument('--max-deaths', type=int, help='deaths before a run ends (endless runs end at the first)')
+    args = parser.parse_args()
+
+    report(simulate_runs(args.n, args.mode, args.policy, args.workers, args.seed, args.max_rooms, args.max_deaths))
+
+
+if __name__ == '__main__':
+    main()